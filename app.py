@@ -8,27 +8,35 @@
 
 import streamlit as st
 import pandas as pd
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
+import hashlib
+import importlib.util
 import io
 import json
 import re
-import streamlit.components.v1 as components
-from io import BytesIO
+import threading
+import time
+from collections import deque
 
 # ==== Supabase ====
 from supabase import create_client, Client
 from postgrest import APIError
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
-# ==== PDF (ReportLab) - opcional ====
-REPORTLAB_OK = True
-try:
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-    from reportlab.lib.pagesizes import A4, landscape
-    from reportlab.lib import colors
-    from reportlab.lib.styles import getSampleStyleSheet
-    from reportlab.lib.units import cm
-except ModuleNotFoundError:
-    REPORTLAB_OK = False
+# Instrumentação das consultas (tempo/linhas/bytes por chamada)
+from desempenho import ClienteInstrumentado, RegistroConsultas, RegistrosPorOrigem, CronometroFases, PerfilExecucao
+# Tarefas longas (importação) em segundo plano, com estado em SQLite local
+from tarefas import FilaTarefas, STATUS_ATIVOS
+
+# Motor de PDF paginado (ReportLab só é importado na geração)
+import relatorios
+
+# ==== PDF (ReportLab) - opcional, carregado sob demanda ====
+#  -> só verifica se o pacote existe; o import real (platypus/styles) acontece
+#     no primeiro clique em "Gerar PDF", dentro de relatorios.py.
+REPORTLAB_OK = importlib.util.find_spec("reportlab") is not None
+# ==== Parquet (pyarrow) - opcional, idem ====
+PYARROW_OK = importlib.util.find_spec("pyarrow") is not None
 
 # Parser (seu módulo)
 #  -> mantenha o arquivo parser.py no projeto com parse_tiss_original(csv_text) definido.
@@ -45,7 +53,51 @@ KEY = st.secrets.get("SUPABASE_KEY", "")
 if not URL or not KEY:
     st.error("Configure SUPABASE_URL e SUPABASE_KEY em Secrets para iniciar o app.")
     st.stop()
-supabase: Client = create_client(URL, KEY)
+
+@st.cache_resource(show_spinner=False)
+def _get_client(url: str, key: str) -> Client:
+    """Um client por processo (e não um por rerun/sessão)."""
+    return create_client(url, key)
+
+# ---- Registro de consultas (painel "Desempenho" na aba Sistema) ----
+@st.cache_resource(show_spinner=False)
+def _registros_background() -> RegistrosPorOrigem:
+    """
+    Chamadas feitas fora de um rerun (threads de tarefas), separadas por origem
+    ("tarefa-<id>"): cada sessão vê e limpa só as das tarefas que iniciou.
+    """
+    return RegistrosPorOrigem(max_origens=50, maxlen=2000)
+
+def _origens_da_sessao() -> list:
+    """Origens em segundo plano desta sessão (tarefas que ela criou ou retomou)."""
+    return [f"tarefa-{tid}" for tid in st.session_state.get("__perf_tarefas", [])]
+
+def _anotar_tarefa_da_sessao(tid: str):
+    tarefas = st.session_state.setdefault("__perf_tarefas", [])
+    if tid not in tarefas:
+        tarefas.append(tid)
+
+def _registro_da_sessao() -> RegistroConsultas:
+    if get_script_run_ctx() is None:
+        return _registros_background().registro()
+    if "__perf_consultas" not in st.session_state:
+        st.session_state["__perf_consultas"] = RegistroConsultas()
+    return st.session_state["__perf_consultas"]
+
+def _registrar_consulta(item: dict):
+    """Anota rerun/seção do momento e guarda o registro da chamada."""
+    if get_script_run_ctx() is not None:
+        item["rerun"] = st.session_state.get("__rerun_seq", 0)
+        item["secao"] = st.session_state.get("nav_secao") or "-"
+    else:
+        item["rerun"] = None
+        item["secao"] = "(background)"
+    _registro_da_sessao().adicionar(item)
+
+# Cada execução completa do script = 1 rerun (fragmentos contam no rerun que os desenhou)
+st.session_state["__rerun_seq"] = st.session_state.get("__rerun_seq", 0) + 1
+
+supabase = ClienteInstrumentado(_get_client(URL, KEY), _registrar_consulta)
 
 def _sb_debug_error(e: APIError, prefix="Erro Supabase"):
     st.error(prefix)
@@ -73,6 +125,56 @@ def _to_bool(x):
     return s in ("1", "true", "yes", "y", "on")
 
 USE_DB_VIEW = _to_bool(st.secrets.get("USE_DB_VIEW", False))  # opcional: usar VIEW vw_procedimentos_internacoes
+USE_DB_RPC  = _to_bool(st.secrets.get("USE_DB_RPC", False))   # opcional: funções de supabase_funcoes.sql
+USE_IMPORT_JOURNAL = _to_bool(st.secrets.get("USE_IMPORT_JOURNAL", False))  # opcional: tabela import_batches
+USE_DB_ROLLUP = _to_bool(st.secrets.get("USE_DB_ROLLUP", False))  # opcional: tabela procedimentos_resumo (KPIs da Home)
+TAREFAS_DB_PATH = st.secrets.get("TAREFAS_DB_PATH", "tarefas.db")  # estado das importações em segundo plano
+RELATORIOS_PROCESSOS = int(st.secrets.get("RELATORIOS_PROCESSOS", 2))  # PDFs fora do rerun (0 = thread)
+
+# ---- Profiling opt-in: secret PROFILING=true, ou ?perf=1 na URL se PROFILING_PERMITIR_URL=true ----
+# (o cProfile é do processo inteiro: ligado por um visitante, deixaria todas as sessões mais lentas)
+PROFILING_PERMITIR_URL = _to_bool(st.secrets.get("PROFILING_PERMITIR_URL", False))
+PROFILING = _to_bool(st.secrets.get("PROFILING", False)) or (
+    PROFILING_PERMITIR_URL and _to_bool(st.query_params.get("perf", ""))
+)
+
+def _registrar_fase(item: dict):
+    if get_script_run_ctx() is None:
+        return  # fases só fazem sentido dentro de um rerun
+    item["rerun"] = st.session_state.get("__rerun_seq", 0)
+    item["secao"] = st.session_state.get("nav_secao") or "-"
+    if "__perf_fases" not in st.session_state:
+        st.session_state["__perf_fases"] = deque(maxlen=3000)
+    st.session_state["__perf_fases"].append(item)
+
+# Uso: `with _fase("relatorios/fetch"): ...` — no-op quando PROFILING está desligado
+_fase = CronometroFases(_registrar_fase, ativo=PROFILING).fase
+
+def _iniciar_perfil_rerun():
+    """Liga o cProfile no topo do rerun (quando pedido no painel Desempenho)."""
+    anterior = st.session_state.get("__perf_perfil_ativo")
+    if anterior is not None and anterior.ativo:
+        # rerun anterior interrompido por st.rerun()/st.stop(): fecha o que foi capturado
+        st.session_state["__perf_ultimo_perfil"] = anterior.parar()
+    st.session_state["__perf_perfil_ativo"] = None
+    if PROFILING and st.session_state.get("__perf_cprofile"):
+        perfil = PerfilExecucao()
+        if perfil.iniciar():
+            st.session_state["__perf_perfil_ativo"] = perfil
+
+def _finalizar_perfil_rerun(secao_atual: str, t0: float):
+    """Fim do script: registra o tempo total do rerun e fecha o cProfile, se ativo."""
+    if not PROFILING:
+        return
+    _registrar_fase({"ts": time.time(), "fase": f"rerun/{secao_atual}", "nivel": 0,
+                     "ms": round((time.perf_counter() - t0) * 1000, 1)})
+    perfil = st.session_state.get("__perf_perfil_ativo")
+    if perfil is not None and perfil.ativo:
+        st.session_state["__perf_ultimo_perfil"] = perfil.parar()
+    st.session_state["__perf_perfil_ativo"] = None
+
+_T0_RERUN = time.perf_counter()
+_iniciar_perfil_rerun()
 
 def invalidate_caches():
     """Invalida TODOS os caches (chamado após qualquer CRUD)."""
@@ -129,6 +231,7 @@ def inject_css():
       background:#FFF;border:1px solid var(--border);border-radius:var(--radius);padding-top:6px;
     }
     button[role="tab"][aria-selected="true"]{ border-bottom:2px solid var(--primary)!important; color:var(--text)!important; }
+    .st-key-nav_secao{ border-bottom:1px solid var(--border); padding-bottom:4px; margin-bottom:8px; }
     section[data-testid="stSidebar"] .block-container{ background:var(--bg-main); border-right:1px solid var(--border); }
     .pill{display:inline-block; padding:2px 8px; border-radius:999px; font-size:.8rem; border:1px solid #DDD; background:#F8FAFC}
     .pill-pendente{ background:#FFF7ED; border-color:#FDBA74;}
@@ -164,6 +267,54 @@ def kpi_row(items, extra_class: str = ""):
         )
     st.markdown("</div>", unsafe_allow_html=True)
 
+def paginador(total: int, key: str, tamanhos=(25, 50, 100, 200)) -> tuple:
+    """
+    Controles de página para listas longas: itens por página + ◀/▶.
+    Estado em session_state[f"{key}_pag"] (0-based) e [f"{key}_tam"]; mudar o
+    tamanho volta para a 1ª página. Devolve (página, tamanho).
+    """
+    k_pag, k_tam = f"{key}_pag", f"{key}_tam"
+    tam = int(st.session_state.get(k_tam, tamanhos[0]))
+    n_pag = max(1, -(-int(total) // tam))
+    pag = min(max(int(st.session_state.get(k_pag, 0)), 0), n_pag - 1)
+    st.session_state[k_pag] = pag
+
+    def _ir(delta: int):
+        st.session_state[k_pag] = st.session_state.get(k_pag, 0) + delta
+
+    def _primeira():
+        st.session_state[k_pag] = 0
+
+    c1, c2, c3, c4 = st.columns([2, 1, 3, 1])
+    with c1:
+        st.selectbox("Itens por página", list(tamanhos), key=k_tam, on_change=_primeira)
+    with c2:
+        st.button("◀", key=f"{key}_ant", use_container_width=True, disabled=pag == 0, on_click=_ir, args=(-1,))
+    with c3:
+        st.caption(f"Página {pag + 1} de {n_pag} · {int(total)} itens")
+    with c4:
+        st.button("▶", key=f"{key}_prox", use_container_width=True, disabled=pag >= n_pag - 1, on_click=_ir, args=(1,))
+    return pag, tam
+
+def paginar_por_chave(key: str, total: int, assinatura, buscar) -> tuple:
+    """
+    paginador() + paginação por chave (data_ordem, id): guarda em session_state[f"{key}_cursores"]
+    a chave da última linha de cada página já vista (recomeça se `assinatura` ou o tamanho
+    mudarem) e chama `buscar(apos, tamanho)`. Devolve (página, DataFrame da página).
+    """
+    pag, tam = paginador(total, key)
+    k_cur = f"{key}_cursores"
+    cursores = st.session_state.get(k_cur)
+    if not cursores or cursores["assinatura"] != (assinatura, tam):
+        cursores = {"assinatura": (assinatura, tam), "lista": [None]}
+    pag = min(pag, len(cursores["lista"]) - 1)
+    df = buscar(cursores["lista"][pag], tam)
+    if not df.empty:
+        ult = df.iloc[-1]
+        cursores["lista"] = cursores["lista"][:pag + 1] + [(str(ult["data_ordem"]), int(ult["id"]))]
+    st.session_state[k_cur] = cursores
+    return pag, df
+
 def app_header(title: str, subtitle: str = ""):
     st.markdown(
         f"""
@@ -183,9 +334,8 @@ def tab_header_with_home(title: str, home_label: str = "🏠 Início", btn_key_s
         st.subheader(title)
     with col_t2:
         if st.button(home_label, key=f"btn_go_home_{btn_key_suffix}", use_container_width=True):
-            # Define o alvo e incrementa um nonce para "forçar" o HTML a ser reinjetado
+            # Define o alvo; a troca de seção é aplicada no topo do próximo rerun
             st.session_state["goto_tab_label"] = "🏠 Início"
-            st.session_state["__goto_nonce"] = st.session_state.get("__goto_nonce", 0) + 1
             st.rerun()
 
 # ============================================================
@@ -214,7 +364,7 @@ def _to_ddmmyyyy(value):
 
 def _to_float_or_none(v):
     if v is None or v == "": return None
-    if isinstance(v, (int,float)): return float(v)
+    if isinstance(v, (int,float)): return None if pd.isna(v) else float(v)   # NaN não serializa em JSON
     s = re.sub(r"[^\d,.\-]", "", str(v))
     if "," in s and "." in s: s = s.replace(".", "").replace(",", ".")
     elif "," in s:            s = s.replace(",", ".")
@@ -243,6 +393,23 @@ def _att_norm(v) -> str:
     s = s.lstrip("0")
     return s if s else "0"
 
+def _parse_lista_atendimentos(texto: str) -> list:
+    """
+    Extrai atendimentos de um texto colado (um por linha, ou separados por
+    vírgula/ponto e vírgula/espaço). Devolve normalizados, sem repetição,
+    na ordem em que aparecem.
+    """
+    vistos, out = set(), []
+    for tok in re.split(r"[\s,;]+", str(texto or "")):
+        tok = _fmt_id_str(tok)          # '7064233.0' (vindo de planilha) -> '7064233'
+        if not re.search(r"\d", tok):
+            continue
+        n = _att_norm(tok)
+        if n != "0" and n not in vistos:
+            vistos.add(n)
+            out.append(n)
+    return out
+
 def _att_to_number(v):
     """
     Converte atendimento para número (compatível com numero_internacao).
@@ -256,6 +423,71 @@ def _att_to_number(v):
     except Exception:
         return None
 
+# ============================================================
+# UTIL — diff de st.data_editor (detecção de alterações vetorizada)
+# ============================================================
+def _normalizar_para_diff(s: pd.Series, tipo: str) -> pd.Series:
+    """
+    Forma canônica de uma coluna para comparação/gravação (None = vazio):
+      - "texto": string sem espaços nas pontas; NaN/None/"" -> None
+      - "data":  'dd/mm/aaaa' (aceita date, Timestamp, ISO e dd/mm/aaaa)
+      - "valor": float arredondado em 2 casas
+      - "codigo": guias/avisos sem '.0' (_fmt_id_str)
+    """
+    if tipo == "valor":
+        out = pd.to_numeric(s, errors="coerce").round(2).astype(object)
+    elif tipo == "data":
+        txt = s.astype("string").str.strip()
+        iso = pd.to_datetime(txt.where(txt.str.match(r"^\d{4}-\d{2}-\d{2}", na=False)).str[:10],
+                             format="%Y-%m-%d", errors="coerce")
+        br = pd.to_datetime(txt.str[:10], format="%d/%m/%Y", errors="coerce")
+        out = iso.fillna(br).dt.strftime("%d/%m/%Y").astype(object)
+    elif tipo == "codigo":
+        out = s.map(_fmt_id_str, na_action="ignore").astype(object)
+    else:
+        out = s.astype("string").str.strip().astype(object)
+    out = out.where(pd.notna(out), None)
+    return out.where(out != "", None)
+
+def diff_editor(antes: pd.DataFrame, depois: pd.DataFrame, tipos: dict,
+                chave: str = "id", completo: bool = False) -> list:
+    """
+    Compara o DataFrame original com o devolvido pelo st.data_editor e devolve o
+    patch mínimo para gravação em lote: [{chave: ..., <coluna alterada>: valor_novo}].
+    Com `completo=True`, cada linha alterada leva todas as colunas de `tipos`.
+    NaN/None/"" são equivalentes; datas e valores são comparados já normalizados.
+    """
+    if antes is None or antes.empty or depois is None or depois.empty:
+        return []
+    cols = [c for c in tipos if c in antes.columns and c in depois.columns]
+    if not cols:
+        return []
+
+    a = antes[[chave] + cols].drop_duplicates(subset=[chave]).set_index(chave)
+    d = depois[[chave] + cols].drop_duplicates(subset=[chave]).set_index(chave)
+    d = d[d.index.isin(a.index)]
+    a = a.loc[d.index]
+
+    novos = pd.DataFrame({c: _normalizar_para_diff(d[c], tipos[c]) for c in cols}, index=d.index)
+    velhos = pd.DataFrame({c: _normalizar_para_diff(a[c], tipos[c]) for c in cols}, index=d.index)
+    mudou = ~((novos == velhos) | (novos.isna() & velhos.isna()))
+    linhas = mudou.any(axis=1)
+    if not linhas.any():
+        return []
+
+    patches = []
+    for k, row, msk in zip(novos.index[linhas], novos[linhas].to_dict("records"), mudou[linhas].to_dict("records")):
+        item = row if completo else {c: v for c, v in row.items() if msk[c]}
+        patches.append({chave: int(k) if str(k).lstrip("-").isdigit() else k, **item})
+    return patches
+
+def linhas_normalizadas(df: pd.DataFrame, tipos: dict, ids, chave: str = "id") -> dict:
+    """{chave: {coluna: valor normalizado}} das linhas `ids` (ex.: estado anterior para desfazer)."""
+    cols = [c for c in tipos if c in df.columns]
+    base = df[df[chave].isin(list(ids))].drop_duplicates(subset=[chave]).set_index(chave)
+    norm = pd.DataFrame({c: _normalizar_para_diff(base[c], tipos[c]) for c in cols}, index=base.index)
+    return {int(k): v for k, v in norm.to_dict("index").items()}
+
 # ============================================================
 # Helper de merge tolerante (evita KeyError com DF/coluna vazios)
 # ============================================================
@@ -264,15 +496,13 @@ def _att_to_number(v):
 # BACKUP / RESTORE — Helpers
 # ============================
 import math, zipfile, io, time
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable
 
 # Client com Service Key (opcional, para Storage privado/administrativo)
-URL = st.secrets.get("SUPABASE_URL", "")
-KEY = st.secrets.get("SUPABASE_KEY", "")
 SERVICE_KEY = st.secrets.get("SUPABASE_SERVICE_KEY", KEY)  # fallback no anon key
 BUCKET = st.secrets.get("STORAGE_BACKUP_BUCKET", "backups")
 
-admin_client: Client = create_client(URL, SERVICE_KEY)
+admin_client = ClienteInstrumentado(_get_client(URL, SERVICE_KEY), _registrar_consulta)
 
 # ---- Paginação segura (lê tudo) ----
 def _fetch_all_rows(table: str, cols: str = "*", page_size: int = 1000, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
@@ -301,9 +531,51 @@ def _to_csv_bytes(df: pd.DataFrame) -> bytes:
 def _now_ts() -> str:
     return datetime.now().strftime("%Y%m%d_%H%M%S")
 
+@st.cache_resource(show_spinner=False)
+def _fila_relatorios() -> relatorios.FilaRelatorios:
+    """Pool de geração de PDFs do processo (os bytes ficam num LRU compartilhado entre sessões)."""
+    return relatorios.FilaRelatorios(processos=RELATORIOS_PROCESSOS)
+
+# Tipos das colunas no Parquet (relatórios e backup): nome de coluna -> tipo em relatorios.gerar_parquet
+TIPOS_PARQUET = {
+    "id": "inteiro", "internacao_id": "inteiro", "procedimento_id": "inteiro", "import_batch_id": "inteiro",
+    "numero_internacao": "codigo", "aviso": "codigo",
+    "quitacao_guia_amhptiss": "codigo", "quitacao_guia_complemento": "codigo",
+    "data_internacao": "data", "data_procedimento": "data", "quitacao_data": "data",
+    "quitacao_valor_amhptiss": "valor", "quitacao_valor_complemento": "valor",
+    "hospital": "categoria", "convenio": "categoria", "profissional": "categoria", "situacao": "categoria",
+    "procedimento": "categoria", "grau_participacao": "categoria", "name": "categoria",
+    "is_manual": "booleano", "active": "booleano",
+    "created_at": "instante", "updated_at": "instante",
+}
+
+def _parquet_bytes(df: pd.DataFrame) -> bytes:
+    """Parquet tipado de um DataFrame já carregado (datas, decimais, categorias; guias sem '.0')."""
+    base = df.copy()
+    tipos = {}
+    for c in base.columns:
+        tipo = TIPOS_PARQUET.get(c, "texto")
+        if tipo in ("data", "codigo"):
+            base[c] = _normalizar_para_diff(base[c], tipo)
+        tipos[c] = "texto" if tipo == "codigo" else tipo
+    return relatorios.gerar_parquet(base, tipos)
+
+def _dados_sob_demanda(tipo: str, filtros: Dict[str, Any], df: pd.DataFrame, gerar) -> Callable[[], bytes]:
+    """
+    `data=` preguiçoso para st.download_button: o rerun não gera nada; no clique
+    (em outra thread) gera ou reaproveita do LRU, com chave (tipo, filtros, impressão digital do df).
+    """
+    fila = _fila_relatorios()
+
+    def _dados() -> bytes:
+        chave = relatorios.chave_relatorio(tipo, filtros, df)
+        return fila.obter_ou_gerar(chave, lambda: gerar(df))
+
+    return _dados
+
 def export_tables_to_zip(tables: List[str]) -> bytes:
     """
-    Gera um ZIP com json/csv por tabela. Retorna bytes do ZIP.
+    Gera um ZIP com json/csv (e parquet, se houver pyarrow) por tabela. Retorna bytes do ZIP.
     """
     mem = io.BytesIO()
     with zipfile.ZipFile(mem, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
@@ -322,6 +594,9 @@ def export_tables_to_zip(tables: List[str]) -> bytes:
             zf.writestr(f"{t}.json", json.dumps(data, ensure_ascii=False, indent=2))
             # CSV
             zf.writestr(f"{t}.csv", _to_csv_bytes(df) if not df.empty else b"")
+            # Parquet (tipado; mesmo DataFrame, sem nova consulta)
+            if PYARROW_OK and not df.empty:
+                zf.writestr(f"{t}.parquet", _parquet_bytes(df))
     return mem.getvalue()
 
 def upload_zip_to_storage(zip_bytes: bytes, filename: str) -> bool:
@@ -435,6 +710,7 @@ def restore_from_zip(zip_bytes: bytes, mode: str = "upsert") -> Dict[str, Any]:
                         report["status"] = "error"
                         report["details"].append(f"{t}: falha ao apagar - {getattr(e,'message',e)}")
                         return report
+                _indice_internacoes().limpar()
 
             # Insere por chunks
             def _chunked_upsert(table: str, rows: List[Dict[str, Any]], chunk: int = 500):
@@ -491,6 +767,7 @@ def restore_from_zip(zip_bytes: bytes, mode: str = "upsert") -> Dict[str, Any]:
                 count = _chunked_upsert("procedimentos", rows)
                 report["details"].append(f"procedimentos: {count} registro(s) restaurado(s).")
 
+            _indice_internacoes().limpar()
             invalidate_caches()
             return report
 
@@ -546,7 +823,8 @@ def safe_merge(
         return left
 
     try:
-        return left.merge(right, left_on=left_on, right_on=right_on, how=how, suffixes=suffixes)
+        with _fase("merge"):
+            return left.merge(right, left_on=left_on, right_on=right_on, how=how, suffixes=suffixes)
     except KeyError:
         return left
 
@@ -569,29 +847,201 @@ def get_hospitais(include_inactive: bool = False) -> list:
         _sb_debug_error(e, "Falha ao buscar hospitais.")
         return []
 
+# ============================================================
+# Índice em memória: atendimento/numero_internacao -> linha de internação
+# ============================================================
+class _IndiceInternacoes:
+    """
+    Hash index do processo (compartilhado entre sessões) com as internações já
+    vistas. Mantido pelas funções de CRUD; cada linha expira após `ttl` segundos
+    (edições feitas fora deste processo). O único cache negativo é o de
+    atendimentos que o banco já disse não existir: só com ele um acerto por
+    numero_internacao pode ser usado sem ir ao banco (atendimento tem precedência).
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._linhas = {}    # id -> (linha, instante)
+        self._por_att = {}   # atendimento normalizado -> {ids}
+        self._por_num = {}   # numero_internacao (float) -> {ids}
+        self._sem_att = {}   # atendimento normalizado sem internação -> instante
+
+    @staticmethod
+    def _chaves(linha: dict):
+        att = _att_norm(linha.get("atendimento")) if linha.get("atendimento") not in (None, "") else None
+        num = _att_to_number(_fmt_id_str(linha.get("numero_internacao")))
+        return att, num
+
+    def _remover(self, iid: int):
+        antigo = self._linhas.pop(iid, None)
+        if antigo is None:
+            return
+        att, num = self._chaves(antigo[0])
+        for mapa, k in ((self._por_att, att), (self._por_num, num)):
+            ids = mapa.get(k)
+            if ids is not None:
+                ids.discard(iid)
+                if not ids:
+                    mapa.pop(k, None)
+
+    def atualizar(self, linhas):
+        """Grava/substitui linhas completas (select('*') ou retorno de insert/update)."""
+        agora = time.monotonic()
+        with self._lock:
+            for linha in linhas or []:
+                if not linha or linha.get("id") is None:
+                    continue
+                iid = int(linha["id"])
+                self._remover(iid)
+                self._linhas[iid] = (dict(linha), agora)
+                att, num = self._chaves(linha)
+                if att is not None:
+                    self._por_att.setdefault(att, set()).add(iid)
+                    self._sem_att.pop(att, None)
+                if num is not None:
+                    self._por_num.setdefault(num, set()).add(iid)
+
+    def remover(self, iid):
+        with self._lock:
+            self._remover(int(iid))
+
+    def sem_atendimento(self, att_norm: str):
+        """Registra que o banco não tem internação com este atendimento."""
+        if att_norm is None:
+            return
+        with self._lock:
+            if att_norm not in self._por_att:
+                self._sem_att[att_norm] = time.monotonic()
+
+    def limpar(self):
+        with self._lock:
+            self._linhas.clear()
+            self._por_att.clear()
+            self._por_num.clear()
+            self._sem_att.clear()
+
+    def buscar(self, att_norm: str, num):
+        """
+        Mesma precedência da consulta: atendimento primeiro, depois numero_internacao.
+        O acerto por numero_internacao só vale se o atendimento já foi descartado
+        no banco (sem_atendimento); senão pode existir uma internação com esse
+        atendimento que ainda não está no índice.
+        """
+        limite = time.monotonic() - self.ttl
+        with self._lock:
+            chaves = [(self._por_att, att_norm)]
+            if att_norm is None or self._sem_att.get(att_norm, limite) > limite:
+                chaves.append((self._por_num, num))
+            for mapa, k in chaves:
+                ids = mapa.get(k) if k is not None else None
+                if not ids:
+                    continue
+                entradas = [self._linhas[i] for i in sorted(ids)]
+                if any(t < limite for _, t in entradas):
+                    return None  # expirou: revalida no banco
+                return [dict(linha) for linha, _ in entradas]
+        return None
+
+@st.cache_resource(show_spinner=False)
+def _indice_internacoes() -> _IndiceInternacoes:
+    return _IndiceInternacoes(ttl=TTL_MED)
+
 def get_internacao_by_atendimento(att):
     """
     Busca por atendimento normalizado e, em fallback, por numero_internacao.
-    NÃO cachear (usado em loops de import e consulta imediata).
+    Atendimentos já conhecidos saem do índice em memória (sem rede); os demais
+    vão ao banco numa única consulta OR. Não usa st.cache_data (o índice é
+    mantido pelo CRUD, então não fica desatualizado após gravar).
     """
-    try:
-        att_norm = _att_norm(att)
-        # 1) Busca por atendimento (string normalizada)
-        res = supabase.table("internacoes").select("*").eq("atendimento", att_norm).execute()
-        df = pd.DataFrame(res.data or [])
-        if not df.empty:
-            return df
+    att_norm = _att_norm(att)
+    num = _att_to_number(att)
+    indice = _indice_internacoes()
+
+    linhas = indice.buscar(att_norm, num)
+    if linhas is not None:
+        return pd.DataFrame(linhas)
 
-        # 2) Fallback: busca por numero_internacao
-        num = _att_to_number(att)
+    try:
+        query = supabase.table("internacoes").select("*")
         if num is not None:
-            res2 = supabase.table("internacoes").select("*").eq("numero_internacao", num).execute()
-            return pd.DataFrame(res2.data or [])
-        return pd.DataFrame()
+            # att_norm e num só têm dígitos: seguros dentro do filtro or=(...)
+            query = query.or_(f"atendimento.eq.{att_norm},numero_internacao.eq.{_fmt_id_str(num)}")
+        else:
+            query = query.eq("atendimento", att_norm)
+        data = query.execute().data or []
     except APIError as e:
         _sb_debug_error(e, "Falha ao consultar internação.")
         return pd.DataFrame()
 
+    indice.atualizar(data)
+    # Precedência: casamento por atendimento; senão, por numero_internacao
+    por_att = [r for r in data if _att_norm(r.get("atendimento")) == att_norm]
+    if not por_att:
+        indice.sem_atendimento(att_norm)
+    return pd.DataFrame(por_att or data)
+
+def _atts_da_internacao(r: dict) -> set:
+    """Atendimentos normalizados que casam com a linha (atendimento e numero_internacao)."""
+    chaves = set()
+    if r.get("atendimento") not in (None, ""):
+        chaves.add(_att_norm(r.get("atendimento")))
+    num = _fmt_id_str(r.get("numero_internacao"))
+    if num:
+        chaves.add(_att_norm(num))
+    return chaves
+
+@st.cache_data(ttl=TTL_SHORT, show_spinner=False)
+def buscar_internacoes_em_lote(atts_norm: tuple, chunk: int = 150):
+    """
+    Resolve vários atendimentos (já normalizados) de uma vez:
+      - internações: 1 consulta por chunk com or=(atendimento.in.(...),numero_internacao.in.(...))
+      - procedimentos: IN por internacao_id (chunks + paginação)
+    Retorna (df_internacoes, df_procedimentos, nao_encontrados).
+    Levanta APIError — o st.cache_data não guarda exceções, então uma falha
+    passageira não vira "não encontrados" em cache.
+    """
+    atts = [a for a in atts_norm if a and a != "0"]
+    linhas_int = {}
+    for i in range(0, len(atts), chunk):
+        parte = atts[i:i + chunk]
+        lista = ",".join(parte)   # só dígitos: dispensa aspas no filtro
+        res = (
+            supabase.table("internacoes").select("*")
+            .or_(f"atendimento.in.({lista}),numero_internacao.in.({lista})")
+            .execute()
+        )
+        for r in (res.data or []):
+            linhas_int[int(r["id"])] = r
+
+    _indice_internacoes().atualizar(list(linhas_int.values()))
+
+    encontrados = set()
+    for r in linhas_int.values():
+        encontrados |= _atts_da_internacao(r)
+    nao_encontrados = [a for a in atts if a not in encontrados]
+
+    ids = sorted(linhas_int)
+    procs = []
+    for i in range(0, len(ids), 200):
+        parte = ids[i:i + 200]
+        start = 0
+        while True:
+            res = (
+                supabase.table("procedimentos").select("*")
+                .in_("internacao_id", parte)
+                .order("id")
+                .range(start, start + 999)
+                .execute()
+            )
+            chunk_rows = res.data or []
+            procs.extend(chunk_rows)
+            if len(chunk_rows) < 1000:
+                break
+            start += 1000
+
+    return pd.DataFrame(list(linhas_int.values())), pd.DataFrame(procs), nao_encontrados
+
 def criar_internacao(hospital, atendimento, paciente, data, convenio):
     att_norm = _att_norm(atendimento)
     num = _att_to_number(atendimento)
@@ -606,6 +1056,7 @@ def criar_internacao(hospital, atendimento, paciente, data, convenio):
     try:
         res = supabase.table("internacoes").insert(payload).execute()
         row = (res.data or [{}])[0]
+        _indice_internacoes().atualizar(res.data)
         invalidate_caches()
         return int(row.get("id"))
     except APIError as e:
@@ -617,17 +1068,109 @@ def atualizar_internacao(internacao_id, **kwargs):
     if "data_internacao" in update_data:
         update_data["data_internacao"] = _to_ddmmyyyy(update_data["data_internacao"])
     try:
-        supabase.table("internacoes").update(update_data).eq("id", int(internacao_id)).execute()
+        res = supabase.table("internacoes").update(update_data).eq("id", int(internacao_id)).execute()
+        if res.data:
+            _indice_internacoes().atualizar(res.data)
+        else:
+            _indice_internacoes().remover(internacao_id)
         invalidate_caches()
     except APIError as e:
         _sb_debug_error(e, "Falha ao atualizar internação.")
 
 
+def _ids_existentes(tabela: str, ids) -> set:
+    """Quais destes ids ainda existem na tabela (SELECT id ... IN em chunks). Levanta APIError."""
+    achados = set()
+    ids = list(ids)
+    for i in range(0, len(ids), 200):
+        res = supabase.table(tabela).select("id").in_("id", ids[i:i + 200]).execute()
+        achados.update(int(r["id"]) for r in (res.data or []))
+    return achados
+
+def excluir_internacoes_em_lote(ids) -> Dict[str, int]:
+    """
+    Exclui internações (e seus procedimentos) por lista de ids.
+      - USE_DB_RPC: 1 chamada a excluir_internacoes (uma transação no banco).
+      - Fallback: DELETE ... IN (chunks) em procedimentos e depois em internacoes;
+        as contagens vêm das linhas devolvidas pelo PostgREST.
+    Se saiu menos do que o pedido, confere no banco quais ainda existem (RLS
+    bloqueia sem erro) e devolve esses ids em "bloqueadas", com st.error.
+    Retorna {"internacoes": n, "procedimentos": m, "bloqueadas": [...]} ou None em caso de erro.
+    """
+    ids = sorted({int(i) for i in (ids or [])})
+    if not ids:
+        return {"internacoes": 0, "procedimentos": 0, "bloqueadas": []}
+    try:
+        if USE_DB_RPC:
+            res = supabase.rpc("excluir_internacoes", {"p_ids": ids}).execute()
+            row = (res.data or [{}])[0]
+            out = {"internacoes": int(row.get("internacoes") or 0), "procedimentos": int(row.get("procedimentos") or 0)}
+        else:
+            out = {"internacoes": 0, "procedimentos": 0}
+            for i in range(0, len(ids), 200):
+                parte = ids[i:i + 200]
+                rp = supabase.table("procedimentos").delete().in_("internacao_id", parte).execute()
+                out["procedimentos"] += len(rp.data or [])
+                ri = supabase.table("internacoes").delete().in_("id", parte).execute()
+                out["internacoes"] += len(ri.data or [])
+        restantes = _ids_existentes("internacoes", ids) if out["internacoes"] < len(ids) else set()
+    except APIError as e:
+        _sb_debug_error(e, "Falha ao excluir internações.")
+        return None
+
+    out["bloqueadas"] = sorted(restantes)
+    if restantes:
+        st.error(f"❌ {len(restantes)} internação(ões) não foram excluídas (ids {', '.join(map(str, out['bloqueadas'][:20]))}). "
+                 "Verifique RLS/Policies ou FKs.")
+    indice = _indice_internacoes()
+    for iid in ids:
+        if iid not in restantes:
+            indice.remover(iid)
+    invalidate_caches()
+    return out
+
+def excluir_procedimentos_em_lote(ids) -> Dict[str, int]:
+    """
+    Exclui procedimentos por lista de ids (RPC excluir_procedimentos ou DELETE ... IN).
+    Como nas internações, os ids que continuam no banco voltam em "bloqueados" (com st.error).
+    Retorna {"procedimentos": n, "bloqueados": [...]} ou None em erro.
+    """
+    ids = sorted({int(i) for i in (ids or [])})
+    if not ids:
+        return {"procedimentos": 0, "bloqueados": []}
+    try:
+        if USE_DB_RPC:
+            res = supabase.rpc("excluir_procedimentos", {"p_ids": ids}).execute()
+            n = int(res.data or 0) if not isinstance(res.data, list) else int((res.data or [0])[0] or 0)
+        else:
+            n = 0
+            for i in range(0, len(ids), 200):
+                res = supabase.table("procedimentos").delete().in_("id", ids[i:i + 200]).execute()
+                n += len(res.data or [])
+        restantes = _ids_existentes("procedimentos", ids) if n < len(ids) else set()
+    except APIError as e:
+        _sb_debug_error(e, "Falha ao excluir procedimentos.")
+        return None
+    if restantes:
+        st.error(f"❌ {len(restantes)} procedimento(s) não foram excluídos (ids {', '.join(map(str, sorted(restantes)[:20]))}). "
+                 "Verifique RLS/Policies.")
+    invalidate_caches()
+    return {"procedimentos": n, "bloqueados": sorted(restantes)}
+
 def deletar_internacao(internacao_id: int) -> bool:
     """
     Exclui uma internação e seus procedimentos vinculados, com verificação pré/pós,
     compatível com supabase-py que não suporta delete().select(...).
+    Com USE_DB_RPC, vira uma única chamada (excluir_internacoes).
     """
+    if USE_DB_RPC:
+        res = excluir_internacoes_em_lote([internacao_id])
+        if res is None or res["bloqueadas"]:
+            return False
+        if res["internacoes"] == 0:
+            st.info("A internação já não existe (nada a excluir).")
+        return True
+
     try:
         iid = int(internacao_id)
 
@@ -682,6 +1225,7 @@ def deletar_internacao(internacao_id: int) -> bool:
         ok = len(pos_int.data or []) == 0
 
         if ok:
+            _indice_internacoes().remover(iid)
             invalidate_caches()
             return True
         else:
@@ -751,10 +1295,85 @@ def atualizar_procedimento(proc_id, procedimento=None, situacao=None,
     except APIError as e:
         _sb_debug_error(e, "Falha ao atualizar procedimento.")
 
+# Colunas que o editor da Consulta pode alterar em lote (e como compará-las no diff)
+TIPOS_CAMPOS_PROC = {
+    "procedimento": "texto", "situacao": "texto", "observacao": "texto",
+    "grau_participacao": "texto", "aviso": "codigo",
+}
+CAMPOS_EDITAVEIS_PROC = list(TIPOS_CAMPOS_PROC)
+
+def atualizar_procedimentos_em_lote(itens: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Atualiza vários procedimentos de uma vez. Cada item é {"id": ..., <só as colunas alteradas>}.
+      - USE_DB_RPC: 1 chamada à função atualizar_procedimentos_em_lote (supabase_funcoes.sql).
+      - Fallback: agrupa itens com o mesmo payload em update(...).in_("id", ids)
+        (ex.: 40 linhas reclassificadas iguais = 1 request); se um grupo falhar,
+        repete linha a linha só para identificar quem falhou.
+    Invalida os caches uma única vez. Retorna {"ok": [ids], "falhas": [{"id", "erro"}]}.
+    """
+    itens = [
+        {"id": int(it["id"]), **{k: v for k, v in it.items() if k in CAMPOS_EDITAVEIS_PROC}}
+        for it in (itens or [])
+    ]
+    itens = [it for it in itens if len(it) > 1]
+    resultado = {"ok": [], "falhas": []}
+    if not itens:
+        return resultado
+
+    feito = False
+    if USE_DB_RPC:
+        try:
+            res = supabase.rpc("atualizar_procedimentos_em_lote", {"p_itens": itens}).execute()
+            for r in (res.data or []):
+                if r.get("ok"):
+                    resultado["ok"].append(int(r["id"]))
+                else:
+                    resultado["falhas"].append({"id": int(r["id"]), "erro": r.get("erro") or "falha"})
+            feito = True
+        except APIError as e:
+            _sb_debug_error(e, "Falha na função atualizar_procedimentos_em_lote. Usando fallback.")
+
+    if not feito:
+        grupos: Dict[str, Dict[str, Any]] = {}
+        for it in itens:
+            payload = {k: v for k, v in it.items() if k != "id"}
+            chave = json.dumps(payload, sort_keys=True, default=str)
+            grupos.setdefault(chave, {"payload": payload, "ids": []})["ids"].append(it["id"])
+
+        for g in grupos.values():
+            ids = g["ids"]
+            try:
+                res = supabase.table("procedimentos").update(g["payload"]).in_("id", ids).execute()
+                atualizados = {int(r["id"]) for r in (res.data or []) if r.get("id") is not None}
+                for i in ids:
+                    if i in atualizados:
+                        resultado["ok"].append(i)
+                    else:
+                        resultado["falhas"].append({"id": i, "erro": "não encontrado (ou bloqueado por RLS)"})
+            except APIError:
+                for i in ids:
+                    try:
+                        supabase.table("procedimentos").update(g["payload"]).eq("id", i).execute()
+                        resultado["ok"].append(i)
+                    except APIError as e1:
+                        resultado["falhas"].append({"id": i, "erro": getattr(e1, "message", None) or str(e1)})
+
+    if resultado["ok"]:
+        invalidate_caches()
+    return resultado
+
 
 
 def deletar_procedimento(proc_id: int) -> bool:
     """Exclui o procedimento com verificação pré/pós (compatível com supabase-py atual)."""
+    if USE_DB_RPC:
+        res = excluir_procedimentos_em_lote([proc_id])
+        if res is None or res["bloqueados"]:
+            return False
+        if res["procedimentos"] == 0:
+            st.info("Registro já não existe (nada a excluir).")
+        return True
+
     try:
         # 1) Pré-checagem: existe?
         pre = (
@@ -792,9 +1411,9 @@ def deletar_procedimento(proc_id: int) -> bool:
         return False
 
 
-def quitar_procedimento(proc_id, data_quitacao=None, guia_amhptiss=None, valor_amhptiss=None,
-                        guia_complemento=None, valor_complemento=None, quitacao_observacao=None):
-    
+def _payload_quitacao(data_quitacao=None, guia_amhptiss=None, valor_amhptiss=None,
+                      guia_complemento=None, valor_complemento=None, quitacao_observacao=None) -> Dict[str, Any]:
+    """Colunas gravadas numa quitação (None = não altera; situação sempre 'Finalizado')."""
     update_data = {
         "quitacao_data": _to_ddmmyyyy(data_quitacao) if data_quitacao else None,
         "quitacao_guia_amhptiss": (_fmt_id_str(guia_amhptiss) or None),   # <<< sanitiza
@@ -804,14 +1423,86 @@ def quitar_procedimento(proc_id, data_quitacao=None, guia_amhptiss=None, valor_a
         "quitacao_observacao": quitacao_observacao,
         "situacao": "Finalizado",
     }
+    return {k:v for k,v in update_data.items() if v is not None or k=="situacao"}
 
-    update_data = {k:v for k,v in update_data.items() if v is not None or k=="situacao"}
+def quitar_procedimento(proc_id, data_quitacao=None, guia_amhptiss=None, valor_amhptiss=None,
+                        guia_complemento=None, valor_complemento=None, quitacao_observacao=None):
+    
+    update_data = _payload_quitacao(data_quitacao, guia_amhptiss, valor_amhptiss,
+                                    guia_complemento, valor_complemento, quitacao_observacao)
     try:
         supabase.table("procedimentos").update(update_data).eq("id", int(proc_id)).execute()
         invalidate_caches()
     except APIError as e:
         _sb_debug_error(e, "Falha ao quitar procedimento.")
 
+def quitar_procedimentos_em_lote(itens: List[Dict[str, Any]], anteriores: Dict[int, Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Quita vários procedimentos de uma vez (tudo ou nada).
+      itens: [{"id": ..., **_payload_quitacao(...)}]
+      - USE_DB_RPC: 1 chamada a quitar_procedimentos_em_lote (supabase_funcoes.sql),
+        numa única transação no Postgres.
+      - Fallback: updates linha a linha; se uma falhar, as já aplicadas são
+        revertidas para `anteriores` (id -> valores antes da edição), quando informado.
+    Invalida os caches uma vez. Retorna {"ok": [ids], "falhas": [{"id", "erro"}]}.
+    """
+    itens = [{**it, "id": int(it["id"]), "situacao": "Finalizado"} for it in (itens or [])]
+    resultado = {"ok": [], "falhas": []}
+    if not itens:
+        return resultado
+
+    if USE_DB_RPC:
+        try:
+            res = supabase.rpc("quitar_procedimentos_em_lote", {"p_itens": itens}).execute()
+            for r in (res.data or []):
+                if r.get("ok"):
+                    resultado["ok"].append(int(r["id"]))
+                else:
+                    resultado["falhas"].append({"id": int(r["id"]), "erro": r.get("erro") or "falha"})
+            if resultado["ok"]:
+                invalidate_caches()
+            return resultado
+        except APIError as e:
+            _sb_debug_error(e, "Falha na função quitar_procedimentos_em_lote. Usando fallback.")
+
+    aplicados = []
+    falha = None
+    for it in itens:
+        payload = {k: v for k, v in it.items() if k != "id"}
+        try:
+            res = supabase.table("procedimentos").update(payload).eq("id", it["id"]).execute()
+            if not (res.data or []):
+                falha = {"id": it["id"], "erro": "não encontrado (ou bloqueado por RLS)"}
+                break
+            aplicados.append(it["id"])
+        except APIError as e:
+            falha = {"id": it["id"], "erro": getattr(e, "message", None) or str(e)}
+            break
+
+    if falha is None:
+        resultado["ok"] = aplicados
+    else:
+        # Compensa: devolve as linhas já gravadas ao estado anterior
+        nao_revertidos = []
+        for iid in aplicados:
+            antes = (anteriores or {}).get(iid)
+            try:
+                if antes is None:
+                    raise KeyError(iid)
+                supabase.table("procedimentos").update(antes).eq("id", iid).execute()
+            except (APIError, KeyError):
+                nao_revertidos.append(iid)
+        resultado["ok"] = nao_revertidos
+        resultado["falhas"].append(falha)
+        resultado["falhas"].extend(
+            {"id": it["id"], "erro": "não aplicado (lote revertido)"}
+            for it in itens if it["id"] != falha["id"] and it["id"] not in nao_revertidos
+        )
+
+    if aplicados:
+        invalidate_caches()
+    return resultado
+
 
 def _excel_quitacoes_colunas_fixas(df: pd.DataFrame) -> bytes:
     """
@@ -845,13 +1536,12 @@ def _excel_quitacoes_colunas_fixas(df: pd.DataFrame) -> bytes:
         if col in base.columns:
             base[col] = base[col].apply(_fmt_id_str)
 
-    # ---- Datas (dd/mm/aaaa no Excel) ----
-    def _to_date_or_none(s):
-        d = _pt_date_to_dt(s)
-        return pd.to_datetime(d) if d else pd.NaT
+    # ---- Datas (dd/mm/aaaa no Excel), vetorizado ----
+    def _to_date_or_nat(s):
+        return pd.to_datetime(_normalizar_para_diff(s, "data"), format="%d/%m/%Y", errors="coerce")
 
-    base["quitacao_data_x"]     = base["quitacao_data"].apply(_to_date_or_none)
-    base["data_procedimento_x"] = base["data_procedimento"].apply(_to_date_or_none)
+    base["quitacao_data_x"]     = _to_date_or_nat(base["quitacao_data"])
+    base["data_procedimento_x"] = _to_date_or_nat(base["data_procedimento"])
 
     # ---- Valores numéricos (float) ----
     base["quitacao_valor_amhptiss_x"]    = pd.to_numeric(base["quitacao_valor_amhptiss"], errors="coerce")
@@ -873,82 +1563,8 @@ def _excel_quitacoes_colunas_fixas(df: pd.DataFrame) -> bytes:
         "R$ Compl.":              base["quitacao_valor_complemento_x"],
     })
 
-    # ---- Escreve com openpyxl + formatos e larguras ----
-    buf = BytesIO()
-    with pd.ExcelWriter(buf, engine="openpyxl") as writer:
-        sheet_name = "Quitações"
-        out.to_excel(writer, sheet_name=sheet_name, index=False)
-
-        ws = writer.sheets[sheet_name]
-
-        # Formatos
-        from openpyxl.styles import numbers, Alignment, Font
-        # dd/mm/aaaa (número 14 é dd/mm/aa; usaremos código explícito dd/mm/yyyy)
-        date_fmt = "dd/mm/yyyy"
-        money_fmt = u'[$R$-pt_BR] #,##0.00'  # R$ com separadores BR
-
-        # Descobre índices das colunas por título (1-based)
-        headers = [cell.value for cell in next(ws.iter_rows(min_row=1, max_row=1))]
-        idx_quit = headers.index("Quitação") + 1
-        idx_proc = headers.index("Data Proc.") + 1
-        idx_v1   = headers.index("R$ AMHPTISS") + 1
-        idx_v2   = headers.index("R$ Compl.") + 1
-
-        # Aplica formatos de coluna (a partir da 2ª linha)
-        for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=idx_quit, max_col=idx_quit):
-            for cell in row:
-                cell.number_format = date_fmt
-                cell.alignment = Alignment(horizontal="center")
-        for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=idx_proc, max_col=idx_proc):
-            for cell in row:
-                cell.number_format = date_fmt
-                cell.alignment = Alignment(horizontal="center")
-        for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=idx_v1, max_col=idx_v1):
-            for cell in row:
-                cell.number_format = money_fmt
-                cell.alignment = Alignment(horizontal="right")
-        for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=idx_v2, max_col=idx_v2):
-            for cell in row:
-                cell.number_format = money_fmt
-                cell.alignment = Alignment(horizontal="right")
-
-        # Alinhamentos para algumas colunas
-        for col_title in ["Atendimento","Guia AMHPTISS","Guia Compl."]:
-            cidx = headers.index(col_title) + 1
-            for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=cidx, max_col=cidx):
-                for cell in row:
-                    cell.alignment = Alignment(horizontal="center")
-
-        # Ajuste de cabeçalho (bold + centralizado)
-        for c in ws[1]:
-            c.font = Font(bold=True)
-            c.alignment = Alignment(horizontal="center")
-
-        # Largura de colunas — mapeando proporcionalmente às larguras do PDF
-        # (valores em “caracteres” aprox. no Excel)
-        col_width_map = {
-            "Quitação":        11,   # datas
-            "Hospital":        16,
-            "Atendimento":     12,
-            "Paciente":        32,
-            "Convênio":        18,
-            "Profissional":    22,
-            "Grau":            12,
-            "Data Proc.":      11,   # datas
-            "Guia AMHPTISS":   16,
-            "R$ AMHPTISS":     14,
-            "Guia Compl.":     16,
-            "R$ Compl.":       14,
-        }
-        for col_cells in ws.iter_cols(min_row=1, max_row=1):
-            title = col_cells[0].value
-            if title in col_width_map:
-                ws.column_dimensions[col_cells[0].column_letter].width = col_width_map[title]
-
-        # Freezepanes (fixa cabeçalho)
-        ws.freeze_panes = "A2"
-
-    return buf.getvalue()
+    # ---- Escreve em modo write-only (uma passada, formato por coluna) ----
+    return relatorios.gerar_xlsx("Quitações", out, relatorios.LAYOUT_XLSX_QUITACOES)
 
 
 def reverter_quitacao(proc_id: int):
@@ -993,6 +1609,143 @@ def get_quitacao_by_proc_id(proc_id: int):
         _sb_debug_error(e, "Falha ao consultar quitação.")
         return pd.DataFrame()
 
+def _procedimentos_auto_existentes(internacao_ids, datas, chunk_ids: int = 200, page_size: int = 1000) -> set:
+    """
+    {(internacao_id, 'dd/mm/aaaa')} dos procedimentos automáticos já gravados, limitado
+    às `datas` informadas. Levanta APIError (o chamador decide como avisar).
+    """
+    ids = sorted({int(i) for i in (internacao_ids or []) if i})
+    dias = sorted({_to_ddmmyyyy(d) for d in (datas or []) if d})
+    dias = [d for d in dias if re.fullmatch(r"\d{2}/\d{2}/\d{4}", d)]
+    if not ids or not dias:
+        return set()
+    # a coluna é texto: registros antigos/restaurados podem estar em ISO
+    filtro_datas = dias + [datetime.strptime(d, "%d/%m/%Y").strftime("%Y-%m-%d") for d in dias]
+
+    existentes = set()
+    for i in range(0, len(ids), chunk_ids):
+        parte = ids[i:i + chunk_ids]
+        start = 0
+        while True:
+            res = (
+                supabase.table("procedimentos")
+                .select("id, internacao_id, data_procedimento")
+                .in_("internacao_id", parte)
+                .in_("data_procedimento", filtro_datas)
+                .eq("is_manual", 0)
+                .order("id")
+                .range(start, start + page_size - 1)
+                .execute()
+            )
+            rows = res.data or []
+            for r in rows:
+                dt = _to_ddmmyyyy(r.get("data_procedimento"))
+                if r.get("internacao_id") and dt:
+                    existentes.add((int(r["internacao_id"]), dt))
+            if len(rows) < page_size:
+                break
+            start += page_size
+    return existentes
+
+# ============================================================
+#  Diário de importações (import_batches) — opcional via USE_IMPORT_JOURNAL
+# ============================================================
+def _hash_arquivo(raw: bytes) -> str:
+    return hashlib.sha256(raw or b"").hexdigest()
+
+def _medicos_chave(medicos) -> str:
+    return ";".join(sorted({str(m).strip() for m in (medicos or []) if str(m).strip()}))
+
+def buscar_lote_importado(content_hash: str, hospital: str, medicos, status: str = "concluido") -> Dict[str, Any]:
+    """Último lote com o mesmo arquivo, hospital e seleção de médicos no `status` dado (ou None)."""
+    try:
+        res = (
+            supabase.table("import_batches").select("*")
+            .eq("content_hash", content_hash).eq("hospital", hospital)
+            .eq("medicos", _medicos_chave(medicos)).eq("status", status)
+            .order("id", desc=True).limit(1).execute()
+        )
+        return (res.data or [None])[0]
+    except APIError as e:
+        _sb_debug_error(e, "Falha ao consultar o diário de importações.")
+        return None
+
+def abrir_lote_importacao(content_hash: str, hospital: str, medicos, arquivo: str, registros: int):
+    """Cria o registro do lote (status 'em_andamento') e devolve o id."""
+    try:
+        res = supabase.table("import_batches").insert({
+            "content_hash": content_hash,
+            "hospital": hospital,
+            "medicos": _medicos_chave(medicos),
+            "arquivo": arquivo,
+            "registros_arquivo": int(registros),
+            "status": "em_andamento",
+        }).execute()
+        return int((res.data or [{}])[0].get("id"))
+    except (APIError, TypeError) as e:
+        if isinstance(e, APIError):
+            _sb_debug_error(e, "Falha ao abrir lote no diário de importações.")
+        return None
+
+def marcar_lote_importacao(batch_id: int, status: str, **contagens):
+    """Grava status do lote (em_andamento | concluido | falhou) e, se vierem, contagens/tempo."""
+    try:
+        supabase.table("import_batches").update({**contagens, "status": status}).eq("id", int(batch_id)).execute()
+        _listar_lotes_importacao.clear()
+    except APIError as e:
+        _sb_debug_error(e, "Falha ao atualizar lote no diário de importações.")
+
+def fechar_lote_importacao(batch_id: int, **contagens):
+    """Grava contagens/tempo e marca o lote como concluído."""
+    marcar_lote_importacao(batch_id, "concluido", **contagens)
+
+@st.cache_data(ttl=TTL_SHORT, show_spinner=False)
+def _listar_lotes_importacao(limite: int = 30) -> pd.DataFrame:
+    try:
+        res = supabase.table("import_batches").select("*").order("id", desc=True).limit(limite).execute()
+        return pd.DataFrame(res.data or [])
+    except APIError as e:
+        _sb_debug_error(e, "Falha ao listar o diário de importações.")
+        return pd.DataFrame()
+
+def reverter_lote_importacao(batch_id: int) -> Dict[str, int]:
+    """
+    Desfaz um lote: apaga os procedimentos do lote e as internações do lote que
+    ficaram sem procedimentos. USE_DB_RPC: 1 chamada (reverter_import_batch).
+    Retorna {"internacoes": n, "procedimentos": m} ou None em erro.
+    """
+    bid = int(batch_id)
+    try:
+        if USE_DB_RPC:
+            res = supabase.rpc("reverter_import_batch", {"p_batch_id": bid}).execute()
+            row = (res.data or [{}])[0]
+            out = {"internacoes": int(row.get("internacoes") or 0), "procedimentos": int(row.get("procedimentos") or 0)}
+        else:
+            rp = supabase.table("procedimentos").delete().eq("import_batch_id", bid).execute()
+            out = {"internacoes": 0, "procedimentos": len(rp.data or [])}
+            ri = supabase.table("internacoes").select("id").eq("import_batch_id", bid).execute()
+            ids = [int(r["id"]) for r in (ri.data or [])]
+            if ids:
+                # preserva internações que receberam procedimentos de outra origem
+                com_proc = set()
+                for i in range(0, len(ids), 200):
+                    rr = supabase.table("procedimentos").select("internacao_id").in_("internacao_id", ids[i:i + 200]).execute()
+                    com_proc.update(int(r["internacao_id"]) for r in (rr.data or []))
+                apagar = [i for i in ids if i not in com_proc]
+                for i in range(0, len(apagar), 200):
+                    rd = supabase.table("internacoes").delete().in_("id", apagar[i:i + 200]).execute()
+                    out["internacoes"] += len(rd.data or [])
+            supabase.table("import_batches").update(
+                {"status": "revertido", "reverted_at": datetime.now().isoformat()}
+            ).eq("id", bid).execute()
+    except APIError as e:
+        _sb_debug_error(e, "Falha ao reverter o lote de importação.")
+        return None
+
+    _indice_internacoes().limpar()
+    invalidate_caches()
+    return out
+
 # ============================================================
 #  Consultas cacheadas (bases usadas em telas pesadas)
 #  Agora com opção de usar VIEW (USE_DB_VIEW) e fallback para merge local
@@ -1041,6 +1794,132 @@ def _home_fetch_base_df() -> pd.DataFrame:
         _sb_debug_error(e, "Falha ao carregar dados para a Home.")
         return pd.DataFrame()
 
+def _meses_exatos(ini: date, fim: date):
+    """(1º dia do mês de ini, 1º dia do mês de fim) se o período cobre meses inteiros; senão None."""
+    if ini.day != 1 or ini > fim:
+        return None
+    prox = (fim.replace(day=28) + timedelta(days=4)).replace(day=1)
+    if fim != prox - timedelta(days=1):
+        return None
+    return ini, fim.replace(day=1)
+
+@st.cache_data(ttl=TTL_SHORT, show_spinner=False)
+def _home_contagens_resumo(hospital: str, meses_int: tuple = None, meses_proc: tuple = None) -> Dict[str, int]:
+    """
+    Procedimentos por situação, lidos de procedimentos_resumo (USE_DB_ROLLUP).
+    meses_*: (mês inicial, mês final) como 1º dia do mês, ou None (sem filtro).
+    Devolve None se a tabela não responder (a Home volta a contar na base).
+    """
+    contagens: Dict[str, int] = {}
+    start, page_size = 0, 1000
+    try:
+        while True:
+            q = supabase.table("procedimentos_resumo").select("situacao, total").gt("total", 0)
+            if hospital != "Todos":
+                q = q.eq("hospital", hospital)
+            if meses_int:
+                q = q.gte("mes_internacao", meses_int[0].isoformat()).lte("mes_internacao", meses_int[1].isoformat())
+            if meses_proc:
+                q = q.gte("mes_procedimento", meses_proc[0].isoformat()).lte("mes_procedimento", meses_proc[1].isoformat())
+            chunk = q.range(start, start + page_size - 1).execute().data or []
+            for r in chunk:
+                contagens[r["situacao"]] = contagens.get(r["situacao"], 0) + int(r["total"] or 0)
+            if len(chunk) < page_size:
+                break
+            start += page_size
+    except APIError as e:
+        _sb_debug_error(e, "Falha ao ler procedimentos_resumo. Contando na base da Home.")
+        return None
+    return contagens
+
+def _home_df_filtrado(hospital: str, int_range: tuple = None, proc_range: tuple = None) -> pd.DataFrame:
+    """Base da Home (_home_fetch_base_df) filtrada por hospital e períodos (ini, fim) opcionais."""
+    with _fase("inicio/fetch"):
+        df_all = _home_fetch_base_df()
+
+    with _fase("inicio/filtro"):
+        if df_all.empty:
+            return df_all.copy()
+
+        def _safe_pt_date(s):
+            try:
+                return datetime.strptime(str(s).strip(), "%d/%m/%Y").date()
+            except Exception:
+                try:
+                    return datetime.strptime(str(s).strip(), "%Y-%m-%d").date()
+                except Exception:
+                    return None
+
+        df_all["_int_dt"]  = df_all["data_internacao"].apply(_safe_pt_date)
+        df_all["_proc_dt"] = df_all["data_procedimento"].apply(_safe_pt_date)
+
+        mask = pd.Series([True]*len(df_all), index=df_all.index)
+
+        if hospital != "Todos":
+            mask &= (df_all["hospital"] == hospital)
+
+        if int_range:
+            mask &= df_all["_int_dt"].notna()
+            mask &= (df_all["_int_dt"] >= int_range[0])
+            mask &= (df_all["_int_dt"] <= int_range[1])
+
+        if proc_range:
+            mask &= df_all["_proc_dt"].notna()
+            mask &= (df_all["_proc_dt"] >= proc_range[0])
+            mask &= (df_all["_proc_dt"] <= proc_range[1])
+
+        return df_all[mask].copy()
+
+# ---- Listas paginadas por chave (data_ordem, id) ----
+# data_ordem = data do procedimento em ISO (1900-01-01 = sem data), como nas views
+# vw_procedimentos_lista / vw_quitacao_pendentes de supabase_funcoes.sql.
+_FILTROS_IGUALDADE = ("hospital", "situacao", "profissional", "convenio")
+
+def _data_ordem(s: pd.Series) -> pd.Series:
+    dt = pd.to_datetime(_normalizar_para_diff(s, "data"), format="%d/%m/%Y", errors="coerce")
+    return dt.dt.strftime("%Y-%m-%d").fillna("1900-01-01")
+
+def _consulta_filtrada(tabela: str, cols: str, filtros: dict, **kwargs):
+    """select na view com os filtros ("Todos"/None = sem filtro; ini/fim ISO sobre data_ordem)."""
+    q = supabase.table(tabela).select(cols, **kwargs)
+    for col in _FILTROS_IGUALDADE:
+        if filtros.get(col) not in (None, "Todos"):
+            q = q.eq(col, filtros[col])
+    if filtros.get("ini"):
+        q = q.gte("data_ordem", filtros["ini"])
+    if filtros.get("fim"):
+        q = q.lte("data_ordem", filtros["fim"])
+    return q
+
+def _apos_chave(q, apos: tuple = None, desc: bool = True):
+    """Ordena por (data_ordem, id) e começa depois de `apos` (data_ordem, id)."""
+    if apos:
+        op = "lt" if desc else "gt"
+        q = q.or_(f"data_ordem.{op}.{apos[0]},and(data_ordem.eq.{apos[0]},id.{op}.{apos[1]})")
+    return q.order("data_ordem", desc=desc).order("id", desc=desc)
+
+def _filtrar_local(df: pd.DataFrame, filtros: dict) -> pd.DataFrame:
+    """Mesmos filtros de _consulta_filtrada, sobre um DataFrame com data_ordem."""
+    mask = pd.Series(True, index=df.index)
+    for col in _FILTROS_IGUALDADE:
+        if filtros.get(col) not in (None, "Todos"):
+            mask &= df[col] == filtros[col]
+    if filtros.get("ini"):
+        mask &= df["data_ordem"] >= filtros["ini"]
+    if filtros.get("fim"):
+        mask &= df["data_ordem"] <= filtros["fim"]
+    return df[mask]
+
+def _pagina_local(df: pd.DataFrame, apos: tuple = None, limite: int = 50, desc: bool = True) -> pd.DataFrame:
+    """Mesma semântica de _apos_chave + limit, sobre um DataFrame."""
+    if apos:
+        d, i = apos
+        if desc:
+            df = df[(df["data_ordem"] < d) | ((df["data_ordem"] == d) & (df["id"] < i))]
+        else:
+            df = df[(df["data_ordem"] > d) | ((df["data_ordem"] == d) & (df["id"] > i))]
+    return df.sort_values(["data_ordem", "id"], ascending=not desc).head(limite).reset_index(drop=True)
+
 @st.cache_data(ttl=TTL_MED, show_spinner=False)
 def _listar_profissionais_cache() -> list:
     """Lista de profissionais distintos (cache 3 min)."""
@@ -1058,6 +1937,25 @@ def _listar_profissionais_cache() -> list:
     except APIError:
         return []
 
+@st.cache_data(ttl=TTL_MED, show_spinner=False)
+def _listar_convenios_cache() -> list:
+    """
+    Lista de convênios distintos das internações (cache 3 min).
+      - USE_DB_RPC: DISTINCT no banco (função listar_convenios).
+      - Fallback: baixa a coluna convenio e deduplica aqui.
+    """
+    try:
+        if USE_DB_RPC:
+            res = supabase.rpc("listar_convenios", {}).execute()
+            return [str(r["convenio"]) for r in (res.data or []) if r.get("convenio")]
+        res = supabase.table("internacoes").select("convenio").execute()
+        df_conv = pd.DataFrame(res.data or [])
+        if "convenio" not in df_conv.columns:
+            return []
+        return sorted({str(x).strip() for x in df_conv["convenio"].dropna() if str(x).strip()})
+    except APIError:
+        return []
+
 @st.cache_data(ttl=TTL_MED, show_spinner=False)
 def _rel_cirurgias_base_df() -> pd.DataFrame:
     """Base para Relatório 'Cirurgias por Status' (cache curto)."""
@@ -1174,6 +2072,47 @@ def _quitacao_pendentes_base_df() -> pd.DataFrame:
         _sb_debug_error(e, "Falha ao carregar pendências de quitação.")
         return pd.DataFrame()
 
+_COLS_QUITACAO = [
+    "id", "internacao_id", "data_procedimento", "profissional", "aviso", "situacao",
+    "quitacao_data", "quitacao_guia_amhptiss", "quitacao_valor_amhptiss",
+    "quitacao_guia_complemento", "quitacao_valor_complemento", "quitacao_observacao",
+    "hospital", "atendimento", "paciente", "convenio", "data_ordem",
+]
+
+def _quitacao_pendentes_local() -> pd.DataFrame:
+    """Fallback sem USE_DB_RPC: base cacheada da Quitação com data_ordem."""
+    df = _quitacao_pendentes_base_df()
+    if df.empty:
+        return pd.DataFrame(columns=_COLS_QUITACAO)
+    df = df.copy()
+    df["data_ordem"] = _data_ordem(df["data_procedimento"])
+    return df.reindex(columns=_COLS_QUITACAO)
+
+@st.cache_data(ttl=TTL_SHORT, show_spinner=False)
+def contar_quitacoes_pendentes(filtros: dict) -> int:
+    """
+    Cirurgias 'Enviado para pagamento' com os filtros (hospital, convenio, ini/fim ISO).
+      - USE_DB_RPC: count=exact na vw_quitacao_pendentes.
+      - Fallback: conta na base local.
+    Levanta APIError.
+    """
+    if USE_DB_RPC:
+        res = _consulta_filtrada("vw_quitacao_pendentes", "id", filtros, count="exact").limit(1).execute()
+        return int(res.count or 0)
+    return len(_filtrar_local(_quitacao_pendentes_local(), filtros))
+
+@st.cache_data(ttl=TTL_SHORT, show_spinner=False)
+def pagina_quitacoes_pendentes(filtros: dict, apos: tuple = None, limite: int = 50) -> pd.DataFrame:
+    """
+    Uma página das pendências de quitação, da cirurgia mais antiga para a mais recente,
+    paginada por chave (data_ordem, id) como pagina_procedimentos. Levanta APIError.
+    """
+    if USE_DB_RPC:
+        q = _consulta_filtrada("vw_quitacao_pendentes", ", ".join(_COLS_QUITACAO), filtros)
+        res = _apos_chave(q, apos, desc=False).limit(limite).execute()
+        return pd.DataFrame(res.data or [], columns=_COLS_QUITACAO)
+    return _pagina_local(_filtrar_local(_quitacao_pendentes_local(), filtros), apos, limite, desc=False)
+
 # ============================================================
 # INICIALIZAÇÃO UI
 # ============================================================
@@ -1183,129 +2122,80 @@ app_header("Sistema de Internações — Supabase",
            "Importação, edição, quitação e relatórios (banco em nuvem)")
 
 
-def _switch_to_tab_by_label(tab_label: str):
-    """
-    Clica na aba cujo rótulo visível contém `tab_label` (match por substring).
-    Usa JSON para injetar a string com segurança e injeta um nonce para evitar cache do componente.
-    """
-    nonce = int(st.session_state.get("__goto_nonce", 0))  # muda a cada clique
-
-    js = """
-    <script>
-    // nonce: __NONCE__
-    (function(){
-      const target = __TAB_LABEL__;
-      const norm = (s) => (s || "").replace(/\s+/g, " ").trim();
-
-      let attempts = 0;
-      const maxAttempts = 20;  // 20 * 100ms = 2s
-      const timer = setInterval(() => {
-        attempts++;
-        const tabs = window.parent.document.querySelectorAll('button[role="tab"]');
-        for (const t of tabs) {
-          const txt = norm(t.textContent || t.innerText);
-          if (txt.includes(norm(target))) {
-            t.click();
-            clearInterval(timer);
-            return;
-          }
-        }
-        if (attempts >= maxAttempts) {
-          clearInterval(timer);
-          console.warn("Tab não encontrada para:", target);
-        }
-      }, 100);
-    })();
-    </script>
-    """
-    js = js.replace("__TAB_LABEL__", json.dumps(tab_label))
-    js = js.replace("__NONCE__", str(nonce))
-    components.html(js, height=0, width=0)
-
-
-tabs = st.tabs([
+# ============================================================
+# NAVEGAÇÃO — só a seção selecionada é executada
+# ============================================================
+# st.tabs executa o corpo de TODAS as abas a cada rerun; aqui um seletor
+# (radio horizontal) escolhe a seção e apenas ela roda consultas/cálculos.
+SECOES = [
     "🏠 Início",
     "📤 Importar Arquivo",
     "🔍 Consultar Internação",
     "📑 Relatórios",
     "💼 Quitação",
     "⚙️ Sistema",
-])
+]
 
-# ============================================================
-# 🏠 0) INÍCIO
-# ============================================================
-with tabs[0]:
-    st.subheader("🏠 Tela Inicial")
+# Widgets de filtro cujo valor deve sobreviver à troca de seção
+# (o Streamlit descarta o estado de widgets que não foram desenhados no rerun).
+_CHAVES_PERSISTENTES = [
+    "home_f_hosp", "home_use_int_range", "home_use_proc_range",
+    "home_f_int_ini", "home_f_int_fim", "home_f_proc_ini", "home_f_proc_fim",
+    "home_lista_ordem", "home_lista_tam",
+    "import_csv_hospital", "import_all_docs_chk", "import_selected_docs_ms",
+    "consulta_codigo", "consulta_modo", "consulta_lote_texto",
+    "rel_hosp", "rel_status", "rel_ini", "rel_fim",
+    "rel_q_hosp", "rel_q_ini", "rel_q_fim",
+    "quit_hosp", "quit_conv", "quit_usar_datas", "quit_ini", "quit_fim", "quit_tam",
+    "sys_proc_hosp", "sys_proc_status", "sys_proc_prof", "sys_proc_ordem",
+    "sys_proc_usar_datas", "sys_proc_ini", "sys_proc_fim", "sys_proc_tam",
+    "sys_prof_hosp", "sys_conv_hosp",
+]
 
-    if "home_status" not in st.session_state:
-        st.session_state["home_status"] = None
+def _preservar_estado_widgets(chaves):
+    for k in chaves:
+        if k in st.session_state:
+            st.session_state[k] = st.session_state[k]
 
-    hoje = date.today()
-    ini_mes = hoje.replace(day=1)
+def _switch_to_tab_by_label(tab_label: str) -> bool:
+    """
+    Seleciona a seção cujo rótulo contém `tab_label` (match por substring).
+    Precisa rodar ANTES do seletor de seção ser desenhado — por isso os botões
+    gravam 'goto_tab_label' e chamam st.rerun(); a troca é aplicada no topo do rerun.
+    """
+    norm = lambda s: " ".join((s or "").split())
+    for secao in SECOES:
+        if norm(tab_label) in norm(secao):
+            st.session_state["nav_secao"] = secao
+            return True
+    return False
 
-    colf1, colf2 = st.columns([2,3])
-    with colf1:
-        filtro_hosp_home = st.selectbox("Hospital", ["Todos"] + get_hospitais(), index=0, key="home_f_hosp")
-    with colf2:
-        st.write(" ")
-        st.caption("Períodos (opcionais)")
-
-    cbox1, cbox2 = st.columns(2)
-    with cbox1:
-        use_int_range = st.checkbox("Filtrar por data da internação", key="home_use_int_range", value=False)
-    with cbox2:
-        use_proc_range = st.checkbox("Filtrar por data do procedimento", key="home_use_proc_range", value=False)
-
-    if use_int_range or use_proc_range:
-        cold1, cold2, cold3, cold4 = st.columns(4)
-        with cold1:
-            int_ini = st.date_input("Internação — início", value=st.session_state.get("home_f_int_ini", ini_mes), key="home_f_int_ini")
-        with cold2:
-            int_fim = st.date_input("Internação — fim", value=st.session_state.get("home_f_int_fim", hoje), key="home_f_int_fim")
-        with cold3:
-            proc_ini = st.date_input("Procedimento — início", value=st.session_state.get("home_f_proc_ini", ini_mes), key="home_f_proc_ini")
-        with cold4:
-            proc_fim = st.date_input("Procedimento — fim", value=st.session_state.get("home_f_proc_fim", hoje), key="home_f_proc_fim")
-
-    # ------ Carrega Procedimentos + Internações (cache curto; 2 passos, ou view) ------
-    df_all = _home_fetch_base_df()
 
-    # Filtros
-    if df_all.empty:
-        df_f = df_all.copy()
-    else:
-        def _safe_pt_date(s):
-            try:
-                return datetime.strptime(str(s).strip(), "%d/%m/%Y").date()
-            except Exception:
-                try:
-                    return datetime.strptime(str(s).strip(), "%Y-%m-%d").date()
-                except Exception:
-                    return None
-
-        df_all["_int_dt"]  = df_all["data_internacao"].apply(_safe_pt_date)
-        df_all["_proc_dt"] = df_all["data_procedimento"].apply(_safe_pt_date)
-
-        mask = pd.Series([True]*len(df_all), index=df_all.index)
-
-        if filtro_hosp_home != "Todos":
-            mask &= (df_all["hospital"] == filtro_hosp_home)
-
-        if use_int_range:
-            mask &= df_all["_int_dt"].notna()
-            mask &= (df_all["_int_dt"] >= st.session_state["home_f_int_ini"])
-            mask &= (df_all["_int_dt"] <= st.session_state["home_f_int_fim"])
+# ---- Troca de seção programática (pedida no rerun anterior) ----
+if st.session_state.get("goto_tab_label"):
+    _switch_to_tab_by_label(st.session_state["goto_tab_label"])
+    st.session_state["goto_tab_label"] = None
 
-        if use_proc_range:
-            mask &= df_all["_proc_dt"].notna()
-            mask &= (df_all["_proc_dt"] >= st.session_state["home_f_proc_ini"])
-            mask &= (df_all["_proc_dt"] <= st.session_state["home_f_proc_fim"])
+_preservar_estado_widgets(_CHAVES_PERSISTENTES)
 
-        df_f = df_all[mask].copy()
+secao = st.radio("Seção", SECOES, horizontal=True, key="nav_secao", label_visibility="collapsed")
 
+# ============================================================
+# 🏠 0) INÍCIO
+# ============================================================
+@st.fragment
+def _home_kpis_e_lista(filtros: dict, contagens: Dict[str, int] = None, df_f: pd.DataFrame = None):
+    """
+    KPIs + lista de internações por status (fragmento).
+    Alternar KPI/fechar lista reroda só este trecho.
+      - contagens (procedimentos_resumo): KPIs sem baixar a base; as linhas
+        (_home_df_filtrado) só são carregadas quando uma lista é aberta.
+      - senão: conta no df_f já filtrado do rerun completo.
+    """
     # --- contadores de status (robusto contra ausência de coluna) ---
     def _count_status(df: pd.DataFrame, status: str) -> int:
+        if contagens is not None:
+            return int(contagens.get(status, 0))
         if df is None or df.empty:
             return 0
         col = "situacao" if "situacao" in df.columns else None
@@ -1317,10 +2207,11 @@ with tabs[0]:
     tot_finalizado = _count_status(df_f, "Finalizado")
     tot_nao_cobrar = _count_status(df_f, "Não Cobrar")
 
+    # callbacks rodam antes do rerun do fragmento — dispensa st.rerun() explícito
     def _toggle_home_status(target: str):
         curr = st.session_state.get("home_status")
         st.session_state["home_status"] = None if curr == target else target
-        st.rerun()
+        st.session_state["home_lista_pag"] = 0
 
     active = st.session_state.get("home_status")
     c1, c2, c3 = st.columns(3)
@@ -1328,22 +2219,19 @@ with tabs[0]:
         kpi_row([{"label":"Pendentes", "value": f"{tot_pendente}", "hint": "Todos os procedimentos"}], extra_class="center")
         lbl = "🔽 Esconder Pendentes" if active == "Pendente" else "👁️ Ver Pendentes"
         st.markdown("<div class='kpi-action'>", unsafe_allow_html=True)
-        if st.button(lbl, key="kpi_btn_pend", use_container_width=True):
-            _toggle_home_status("Pendente")
+        st.button(lbl, key="kpi_btn_pend", use_container_width=True, on_click=_toggle_home_status, args=("Pendente",))
         st.markdown("</div>", unsafe_allow_html=True)
     with c2:
         kpi_row([{"label":"Finalizadas", "value": f"{tot_finalizado}", "hint": "Todos os procedimentos"}], extra_class="center")
         lbl = "🔽 Esconder Finalizadas" if active == "Finalizado" else "👁️ Ver Finalizadas"
         st.markdown("<div class='kpi-action'>", unsafe_allow_html=True)
-        if st.button(lbl, key="kpi_btn_fin", use_container_width=True):
-            _toggle_home_status("Finalizado")
+        st.button(lbl, key="kpi_btn_fin", use_container_width=True, on_click=_toggle_home_status, args=("Finalizado",))
         st.markdown("</div>", unsafe_allow_html=True)
     with c3:
         kpi_row([{"label":"Não Cobrar", "value": f"{tot_nao_cobrar}", "hint": "Todos os procedimentos"}], extra_class="center")
         lbl = "🔽 Esconder Não Cobrar" if active == "Não Cobrar" else "👁️ Ver Não Cobrar"
         st.markdown("<div class='kpi-action'>", unsafe_allow_html=True)
-        if st.button(lbl, key="kpi_btn_nc", use_container_width=True):
-            _toggle_home_status("Não Cobrar")
+        st.button(lbl, key="kpi_btn_nc", use_container_width=True, on_click=_toggle_home_status, args=("Não Cobrar",))
         st.markdown("</div>", unsafe_allow_html=True)
 
     status_sel_home = st.session_state.get("home_status")
@@ -1353,10 +2241,11 @@ with tabs[0]:
 
         cc1, _ = st.columns([1, 6])
         with cc1:
-            if st.button("Fechar lista", key="btn_close_list", type="secondary", use_container_width=True):
-                st.session_state["home_status"] = None
-                st.rerun()
+            st.button("Fechar lista", key="btn_close_list", type="secondary", use_container_width=True,
+                      on_click=_toggle_home_status, args=(status_sel_home,))
 
+        if df_f is None:
+            df_f = _home_df_filtrado(**filtros)
         if df_f.empty:
             st.info("Nenhuma internação encontrada com os filtros aplicados.")
         else:
@@ -1367,42 +2256,451 @@ with tabs[0]:
                 cols_show = ["internacao_id","atendimento","paciente","hospital","convenio","data_internacao"]
                 df_ints = df_status[cols_show].drop_duplicates(subset=["internacao_id"]).copy()
 
-                def _safe_pt_date_int(s):
-                    try:
-                        return datetime.strptime(str(s).strip(), "%d/%m/%Y").date()
-                    except Exception:
-                        try:
-                            return datetime.strptime(str(s).strip(), "%Y-%m-%d").date()
-                        except Exception:
-                            return None
-
-                df_ints["_int_dt"] = df_ints["data_internacao"].apply(_safe_pt_date_int)
-                df_ints = (
-                    df_ints.sort_values(by=["_int_dt","hospital","paciente"], ascending=[False,True,True])
-                          .drop(columns=["_int_dt"])
+                txt_int = df_ints["data_internacao"].astype(str).str.strip()
+                df_ints["_int_dt"] = pd.to_datetime(txt_int, format="%d/%m/%Y", errors="coerce").fillna(
+                    pd.to_datetime(txt_int, format="%Y-%m-%d", errors="coerce")
                 )
 
-                for _, r in df_ints.iterrows():
+                # ordenação sobre o frame inteiro; só a página atual vira elementos na tela
+                ordens = {
+                    "Data da internação (recentes)": (["_int_dt", "hospital", "paciente"], [False, True, True]),
+                    "Data da internação (antigas)":  (["_int_dt", "hospital", "paciente"], [True, True, True]),
+                    "Paciente":                      (["paciente", "_int_dt"], [True, False]),
+                    "Hospital":                      (["hospital", "_int_dt", "paciente"], [True, False, True]),
+                    "Atendimento":                   (["atendimento"], [True]),
+                }
+                co1, _ = st.columns([2, 5])
+                with co1:
+                    ordem = st.selectbox("Ordenar por", list(ordens), key="home_lista_ordem")
+                by, asc = ordens[ordem]
+                df_ints = df_ints.sort_values(by=by, ascending=asc, na_position="last", kind="stable")
+
+                pag, tam = paginador(len(df_ints), "home_lista")
+                df_pag = df_ints.iloc[pag * tam:(pag + 1) * tam]
+
+                for r in df_pag.itertuples(index=False):
                     i1, i2, i3, i4 = st.columns([3, 3, 3, 2])
                     with i1:
-                        st.markdown(f"**Atendimento:** {r['atendimento']}  \n**Paciente:** {r.get('paciente') or '-'}")
+                        st.markdown(f"**Atendimento:** {r.atendimento}  \n**Paciente:** {r.paciente or '-'}")
                     with i2:
-                        st.markdown(f"**Hospital:** {r.get('hospital') or '-'}  \n**Convênio:** {r.get('convenio') or '-'}")
+                        st.markdown(f"**Hospital:** {r.hospital or '-'}  \n**Convênio:** {r.convenio or '-'}")
                     with i3:
-                        st.markdown(f"**Data internação:** {r.get('data_internacao') or '-'}")
+                        st.markdown(f"**Data internação:** {r.data_internacao or '-'}")
                     with i4:
-                        if st.button("🔎 Abrir na Consulta", key=f"open_cons_{int(r['internacao_id'])}", use_container_width=True):
-                            st.session_state["consulta_codigo"] = str(r["atendimento"])
+                        if st.button("🔎 Abrir na Consulta", key=f"open_cons_{int(r.internacao_id)}", use_container_width=True):
+                            st.session_state["consulta_codigo"] = str(r.atendimento)
                             st.session_state["goto_tab_label"] = "🔍 Consultar Internação"
+                            st.rerun()  # troca de seção: rerun completo
+
+
+if secao == "🏠 Início":
+    st.subheader("🏠 Tela Inicial")
+
+    if "home_status" not in st.session_state:
+        st.session_state["home_status"] = None
+
+    hoje = date.today()
+    ini_mes = hoje.replace(day=1)
+
+    colf1, colf2 = st.columns([2,3])
+    with colf1:
+        filtro_hosp_home = st.selectbox("Hospital", ["Todos"] + get_hospitais(), index=0, key="home_f_hosp")
+    with colf2:
+        st.write(" ")
+        st.caption("Períodos (opcionais)")
+
+    cbox1, cbox2 = st.columns(2)
+    with cbox1:
+        use_int_range = st.checkbox("Filtrar por data da internação", key="home_use_int_range", value=False)
+    with cbox2:
+        use_proc_range = st.checkbox("Filtrar por data do procedimento", key="home_use_proc_range", value=False)
+
+    if use_int_range or use_proc_range:
+        cold1, cold2, cold3, cold4 = st.columns(4)
+        with cold1:
+            int_ini = st.date_input("Internação — início", value=st.session_state.get("home_f_int_ini", ini_mes), key="home_f_int_ini")
+        with cold2:
+            int_fim = st.date_input("Internação — fim", value=st.session_state.get("home_f_int_fim", hoje), key="home_f_int_fim")
+        with cold3:
+            proc_ini = st.date_input("Procedimento — início", value=st.session_state.get("home_f_proc_ini", ini_mes), key="home_f_proc_ini")
+        with cold4:
+            proc_fim = st.date_input("Procedimento — fim", value=st.session_state.get("home_f_proc_fim", hoje), key="home_f_proc_fim")
+
+    filtros_home = {
+        "hospital": filtro_hosp_home,
+        "int_range": (st.session_state["home_f_int_ini"], st.session_state["home_f_int_fim"]) if use_int_range else None,
+        "proc_range": (st.session_state["home_f_proc_ini"], st.session_state["home_f_proc_fim"]) if use_proc_range else None,
+    }
+
+    # ------ KPIs pelo resumo (USE_DB_ROLLUP) quando os períodos cobrem meses inteiros ------
+    contagens = None
+    if USE_DB_ROLLUP:
+        meses_int = _meses_exatos(*filtros_home["int_range"]) if use_int_range else None
+        meses_proc = _meses_exatos(*filtros_home["proc_range"]) if use_proc_range else None
+        if (meses_int or not use_int_range) and (meses_proc or not use_proc_range):
+            with _fase("inicio/resumo"):
+                contagens = _home_contagens_resumo(filtro_hosp_home, meses_int, meses_proc)
+
+    df_f = _home_df_filtrado(**filtros_home) if contagens is None else None
+
+    with _fase("inicio/render"):
+        _home_kpis_e_lista(filtros_home, contagens, df_f)
 
     if st.session_state.get("consulta_codigo"):
         st.caption(f"🔎 Atendimento **{st.session_state['consulta_codigo']}** pronto para consulta na aba **'🔍 Consultar Internação'**.")
 
 
+# ============================================================
+#  Importação — plano (dry run) e execução
+# ============================================================
+@st.cache_data(ttl=TTL_SHORT, show_spinner=False)
+def _planejar_importacao(content_hash: str, hospital: str, medicos: str, _registros: list) -> Dict[str, Any]:
+    """
+    Calcula o que a importação vai fazer, sem gravar nada (cache por hash do arquivo,
+    hospital e seleção de médicos; `_registros` não entra na chave):
+      - internações a criar (payloads) e atendimentos já existentes (-> id)
+      - pares (atendimento, data) a criar, com profissional/aviso do dia
+      - pares ignorados, com o motivo
+    Tudo em dicionários montados numa passada só (O(n)) e consultas em lote.
+    """
+    # Primeiro registro com valor de cada campo, por atendimento e por (atendimento, data)
+    por_att: Dict[str, Dict[str, Any]] = {}
+    por_par: Dict[tuple, Dict[str, Any]] = {}
+    for r in _registros:
+        att, dia = r.get("atendimento"), r.get("data")
+        if not att:
+            continue
+        info = por_att.setdefault(att, {})
+        for campo in ("paciente", "convenio", "data"):
+            if r.get(campo) and not info.get(campo):
+                info[campo] = r.get(campo)
+        if dia:
+            par = por_par.setdefault((att, dia), {})
+            for campo in ("profissional", "aviso"):
+                if r.get(campo) and not par.get(campo):
+                    par[campo] = r.get(campo)
+
+    atts_file = sorted({att for (att, _d) in por_par})
+    orig_to_norm = {att: _att_norm(att) for att in atts_file}
+    norm_set = sorted({v for v in orig_to_norm.values() if v})
+    num_set = sorted({_att_to_number(att) for att in atts_file if _att_to_number(att) is not None})
+
+    plano = {
+        "hospital": hospital, "orig_to_norm": orig_to_norm, "existentes": {},
+        "criar_internacoes": [], "criar_procedimentos": [], "ignorados": [], "erro": None,
+    }
+
+    # Internações existentes (por atendimento e por numero)
+    existentes: Dict[str, int] = {}
+    try:
+        for i in range(0, len(norm_set), 500):
+            res = supabase.table("internacoes").select("id, atendimento").in_("atendimento", norm_set[i:i + 500]).execute()
+            for r in (res.data or []):
+                existentes[str(r["atendimento"])] = int(r["id"])
+        for i in range(0, len(num_set), 500):
+            res = supabase.table("internacoes").select("id, numero_internacao").in_("numero_internacao", num_set[i:i + 500]).execute()
+            for r in (res.data or []):
+                existentes.setdefault(_att_norm(_fmt_id_str(r["numero_internacao"])), int(r["id"]))
+    except APIError as e:
+        plano["erro"] = f"Falha ao buscar internações existentes: {getattr(e, 'message', e)}"
+        return plano
+    plano["existentes"] = existentes
+
+    # Internações que faltam (grava normalizado)
+    novos_norm = set()
+    for att in atts_file:
+        na = orig_to_norm.get(att)
+        if not na or na in existentes or na in novos_norm:
+            continue
+        novos_norm.add(na)
+        info = por_att.get(att, {})
+        plano["criar_internacoes"].append({
+            "hospital": hospital,
+            "atendimento": na,                         # normalizado
+            "paciente": info.get("paciente") or "",
+            "data_internacao": _to_ddmmyyyy(info.get("data")) if info.get("data") else _to_ddmmyyyy(date.today()),
+            "convenio": info.get("convenio") or "",
+            "numero_internacao": _att_to_number(att),  # sem zeros à esquerda
+        })
+
+    # Automáticos já gravados nas datas do arquivo (internações novas não têm nenhum)
+    try:
+        existing_auto = _procedimentos_auto_existentes(sorted(set(existentes.values())), [d for (_a, d) in por_par])
+    except APIError as e:
+        plano["erro"] = f"Falha ao buscar procedimentos existentes: {getattr(e, 'message', e)}"
+        return plano
+
+    # Pares (atendimento, data): 1 automático por internação/dia
+    vistos = set()
+    for (att, data_proc) in sorted(por_par):
+        na = orig_to_norm.get(att)
+        data_norm = _to_ddmmyyyy(data_proc)
+        chave = (existentes.get(na) or f"novo:{na}", data_norm)
+        item = {"atendimento": att, "atendimento_norm": na, "data_procedimento": data_norm}
+        if not na:
+            plano["ignorados"].append({**item, "motivo": "atendimento inválido"})
+        elif (existentes.get(na), data_norm) in existing_auto or chave in vistos:
+            plano["ignorados"].append({**item, "motivo": "já existe automático no dia"})
+        elif not por_par[(att, data_proc)].get("profissional"):
+            plano["ignorados"].append({**item, "motivo": "sem profissional"})
+        else:
+            vistos.add(chave)
+            plano["criar_procedimentos"].append({
+                **item,
+                "profissional": por_par[(att, data_proc)]["profissional"],
+                "aviso": por_par[(att, data_proc)].get("aviso") or None,
+            })
+    return plano
+
+def _mostrar_plano_importacao(plano: Dict[str, Any]):
+    """KPIs + tabelas do plano calculado no dry run."""
+    n_exist = len({plano["orig_to_norm"].get(p["atendimento"]) for p in plano["criar_procedimentos"] + plano["ignorados"]}
+                  & set(plano["existentes"]))
+    kpi_row([
+        {"label": "Internações a criar", "value": f"{len(plano['criar_internacoes']):,}".replace(",", ".")},
+        {"label": "Internações já existentes", "value": f"{n_exist:,}".replace(",", ".")},
+        {"label": "Procedimentos a criar", "value": f"{len(plano['criar_procedimentos']):,}".replace(",", ".")},
+        {"label": "Ignorados", "value": f"{len(plano['ignorados']):,}".replace(",", ".")},
+    ], extra_class="compact")
+    with st.expander("📋 Plano da importação (o que será gravado)"):
+        t1, t2, t3 = st.tabs(["Internações a criar", "Procedimentos a criar", "Ignorados"])
+        with t1:
+            st.dataframe(pd.DataFrame(plano["criar_internacoes"]), use_container_width=True, hide_index=True)
+        with t2:
+            st.dataframe(pd.DataFrame(plano["criar_procedimentos"]), use_container_width=True, hide_index=True)
+        with t3:
+            st.dataframe(pd.DataFrame(plano["ignorados"]), use_container_width=True, hide_index=True)
+
+def _tarefa_importacao(ctx, payload: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Grava o plano do dry run em segundo plano (roda numa thread de FilaTarefas):
+      fase "internacoes"   -> insere as novas em chunks; cada chunk registra {norm: id}
+      fase "procedimentos" -> insere os automáticos em chunks
+    Em retomada (`ctx.retomada`), pula os chunks registrados e revalida o primeiro
+    pendente no banco (pode ter sido gravado sem dar tempo de registrar).
+    Não refaz as consultas de existência do plano. Erros viram exceção (status 'erro')
+    e o lote do diário fica 'falhou' com as contagens parciais (dá para desfazer);
+    a retomada continua no mesmo lote.
+    """
+    batch_id = payload.get("batch_id")
+    tot = {"internacoes": 0, "criados": 0, "ignorados": len(payload["plano"]["ignorados"])}
+    with _registros_background().origem(f"tarefa-{ctx.id}"):
+        if batch_id and ctx.retomada:
+            marcar_lote_importacao(batch_id, "em_andamento")
+        try:
+            return _gravar_plano_importacao(ctx, payload, tot)
+        except Exception:
+            if batch_id:
+                marcar_lote_importacao(
+                    batch_id, "falhou",
+                    internacoes_criadas=tot["internacoes"],
+                    procedimentos_criados=tot["criados"],
+                    ignorados=tot["ignorados"],
+                )
+            raise
+
+def _gravar_plano_importacao(ctx, payload: Dict[str, Any], tot: Dict[str, int]) -> Dict[str, int]:
+    """Corpo de _tarefa_importacao; `tot` é atualizado a cada chunk (parcial em caso de erro)."""
+    plano, batch_id = payload["plano"], payload.get("batch_id")
+    tag_lote = {"import_batch_id": batch_id} if batch_id else {}
+    ids_por_norm = dict(plano["existentes"])
+    CH = 500
+
+    def _falha(e: APIError, msg: str):
+        return RuntimeError(f"{msg}: {getattr(e, 'message', None) or e}")
+
+    # ---- Fase 1: internações novas ----
+    novos = [{**r, **tag_lote} for r in plano["criar_internacoes"]]
+    ctx.fase("internacoes", len(novos), ordem=1)
+    feitos = ctx.chunks_feitos("internacoes")
+    revalidar = ctx.retomada
+    for n, i in enumerate(range(0, len(novos), CH)):
+        if n in feitos:
+            ids_por_norm.update(feitos[n] or {})
+            tot["internacoes"] += len(feitos[n] or {})
+            continue
+        parte = novos[i:i + CH]
+        mapa = {}
+        try:
+            if revalidar:
+                res = supabase.table("internacoes").select("id, atendimento").in_(
+                    "atendimento", [r["atendimento"] for r in parte]
+                ).execute()
+                mapa.update({str(r["atendimento"]): int(r["id"]) for r in (res.data or [])})
+                parte = [r for r in parte if r["atendimento"] not in mapa]
+                revalidar = False
+            if parte:
+                res = supabase.table("internacoes").insert(parte).execute()
+                _indice_internacoes().atualizar(res.data)
+                mapa.update({str(r["atendimento"]): int(r["id"]) for r in (res.data or [])})
+        except APIError as e:
+            raise _falha(e, "Falha ao criar internações em lote")
+        ctx.registrar_chunk("internacoes", n, mapa)
+        ids_por_norm.update(mapa)
+        tot["internacoes"] += len(mapa)
+        ctx.progresso("internacoes", min(i + CH, len(novos)))
+    if novos:
+        ctx.progresso("internacoes", len(novos))
+        invalidate_caches()
+
+    # ---- Fase 2: procedimentos automáticos ----
+    payload_procs = []
+    for p in plano["criar_procedimentos"]:
+        iid = ids_por_norm.get(p["atendimento_norm"])
+        if not iid:
+            tot["ignorados"] += 1   # internação não pôde ser criada
+            continue
+        payload_procs.append({
+            "internacao_id": int(iid),
+            "data_procedimento": p["data_procedimento"],
+            "profissional": p["profissional"],
+            "procedimento": "Cirurgia / Procedimento",
+            "situacao": "Pendente",
+            "observacao": None,
+            "is_manual": 0,
+            "aviso": p.get("aviso"),
+            "grau_participacao": None,
+            **tag_lote,
+        })
+
+    ctx.fase("procedimentos", len(payload_procs), ordem=2)
+    feitos = ctx.chunks_feitos("procedimentos")
+    revalidar = ctx.retomada
+    for n, i in enumerate(range(0, len(payload_procs), CH)):
+        if n in feitos:
+            tot["criados"] += int(feitos[n] or 0)
+            continue
+        parte = payload_procs[i:i + CH]
+        try:
+            if revalidar:
+                ja = _procedimentos_auto_existentes([r["internacao_id"] for r in parte],
+                                                    [r["data_procedimento"] for r in parte])
+                parte = [r for r in parte if (r["internacao_id"], r["data_procedimento"]) not in ja]
+                revalidar = False
+            if parte:
+                supabase.table("procedimentos").insert(parte).execute()
+        except APIError as e:
+            raise _falha(e, "Falha ao inserir procedimentos em lote")
+        ctx.registrar_chunk("procedimentos", n, len(parte))
+        tot["criados"] += len(parte)
+        ctx.progresso("procedimentos", min(i + CH, len(payload_procs)))
+    if payload_procs:
+        invalidate_caches()
+
+    if batch_id:
+        fechar_lote_importacao(
+            batch_id,
+            internacoes_criadas=tot["internacoes"],
+            procedimentos_criados=tot["criados"],
+            ignorados=tot["ignorados"],
+            duracao_ms=int((time.time() - float(payload.get("t0") or time.time())) * 1000),
+        )
+    return tot
+
+@st.cache_resource(show_spinner=False)
+def _fila_tarefas() -> FilaTarefas:
+    """
+    Fila do processo. A vigia retoma o que ficou pela metade (dono sem batimento:
+    restart, "Clear cache", reload do módulo); o que ainda roda em outra instância fica lá.
+    """
+    fila = FilaTarefas(TAREFAS_DB_PATH)
+    fila.vigiar({"importacao": _tarefa_importacao})
+    return fila
+
+# Cria a fila (e a vigia) em qualquer rerun, seja qual for a seção aberta
+_fila_tarefas()
+
+def _fmt_resultado_importacao(r: Dict[str, Any]) -> str:
+    return (f"Internações criadas: {r.get('internacoes', 0)} | Automáticos criados: {r.get('criados', 0)} | "
+            f"Ignorados: {r.get('ignorados', 0)}")
+
+@st.fragment(run_every=1.5)
+def _progresso_importacoes():
+    """Barras de progresso por fase das importações em andamento (atualiza sozinho)."""
+    fila = _fila_tarefas()
+    ativas = fila.listar(tipo="importacao", status=STATUS_ATIVOS)
+    if not ativas:
+        st.rerun()   # terminou: rerun completo mostra o resultado e para o polling
+    for t in ativas:
+        st.markdown(f"**⏳ {t.get('titulo') or t['id']}** — {t['status']}")
+        for f in t["fases"]:
+            total = max(int(f["total"] or 0), 1)
+            st.progress(min(int(f["feito"] or 0) / total, 1.0),
+                        text=f"{f['fase'].capitalize()}: {f['feito']}/{f['total']}")
+
+def _painel_tarefas_importacao():
+    """Importações em segundo plano: progresso das ativas e resultado das últimas."""
+    fila = _fila_tarefas()
+    if fila.listar(tipo="importacao", status=STATUS_ATIVOS, limite=1):
+        _progresso_importacoes()
+
+    recentes = [t for t in fila.listar(tipo="importacao", limite=5) if t["status"] not in STATUS_ATIVOS]
+    if not recentes:
+        return
+    ult = recentes[0]
+    if ult["status"] == "concluida" and st.session_state.get("import_tarefa_id") == ult["id"]:
+        st.success(f"Concluído! {_fmt_resultado_importacao(ult['resultado'] or {})}")
+        st.session_state.pop("import_tarefa_id", None)
+    with st.expander("🗂️ Importações em segundo plano (últimas)"):
+        for t in recentes:
+            quando = datetime.fromtimestamp(t["criado_em"]).strftime("%d/%m/%Y %H:%M")
+            if t["status"] == "concluida":
+                st.markdown(f"✅ **{t.get('titulo') or t['id']}** ({quando}) — {_fmt_resultado_importacao(t['resultado'] or {})}")
+            else:
+                st.markdown(f"❌ **{t.get('titulo') or t['id']}** ({quando}) — parou com erro")
+                st.code(str(t.get("erro") or "")[:1500], language="text")
+                if st.button("Retomar do último chunk gravado", key=f"btn_retomar_{t['id']}"):
+                    if not fila.iniciar(t["id"], _tarefa_importacao, retomada=True):
+                        st.info("Esta importação já foi retomada (outra sessão) ou não está mais com erro.")
+                    else:
+                        st.session_state["import_tarefa_id"] = t["id"]
+                        _anotar_tarefa_da_sessao(t["id"])
+                        st.rerun()
+
+def _painel_lotes_importacao():
+    """Diário de importações: últimos lotes e 'desfazer lote' (1 exclusão em massa; concluídos ou que falharam)."""
+    with st.expander("📜 Lotes importados"):
+        df_lotes = _listar_lotes_importacao()
+        if df_lotes.empty:
+            st.info("Nenhum lote registrado ainda.")
+            return
+        cols = [c for c in ["id", "created_at", "hospital", "arquivo", "status", "registros_arquivo",
+                            "internacoes_criadas", "procedimentos_criados", "ignorados", "duracao_ms"] if c in df_lotes.columns]
+        st.dataframe(df_lotes[cols], use_container_width=True, hide_index=True)
+
+        reversiveis = df_lotes[df_lotes["status"].isin(["concluido", "falhou"])]
+        if reversiveis.empty:
+            return
+        rot = {
+            int(r["id"]): (f"#{int(r['id'])} — {r.get('arquivo') or '-'} ({r.get('hospital')}, {str(r.get('created_at') or '')[:16]})"
+                           + (" ⚠️ falhou" if r.get("status") == "falhou" else ""))
+            for r in reversiveis.to_dict("records")
+        }
+        c1, c2, c3 = st.columns([3, 2, 1])
+        with c1:
+            lote = st.selectbox("Desfazer lote:", list(rot), format_func=rot.get, key="import_lote_reverter")
+        with c2:
+            confirm = st.text_input("Digite DESFAZER para confirmar", key="import_lote_confirm")
+        with c3:
+            st.write("")
+            if st.button("Desfazer", key="btn_import_lote_reverter", type="primary"):
+                if confirm.strip().upper() != "DESFAZER":
+                    st.info("Confirmação inválida. Digite DESFAZER.")
+                else:
+                    r = reverter_lote_importacao(lote)
+                    if r is not None:
+                        _listar_lotes_importacao.clear()
+                        st.session_state.pop("import_lote_confirm", None)
+                        st.toast(
+                            f"Lote #{lote} desfeito: {r['procedimentos']} procedimento(s) e {r['internacoes']} internação(ões) removidos.",
+                            icon="↩️",
+                        )
+                        st.rerun()
+
 # ============================================================
 # 📤 1) IMPORTAR  (Importação primeiro, cadastro manual depois)
 # ============================================================
-with tabs[1]:
+if secao == "📤 Importar Arquivo":
     tab_header_with_home("📤 Importar arquivo", btn_key_suffix="import")
 
     # --------- Seção: Importação de CSV ---------
@@ -1474,151 +2772,77 @@ with tabs[1]:
             unsafe_allow_html=True
         )
 
-        # ======== IMPORTAÇÃO TURBO (mesmo código que você já tinha) ========
+        # ======== PLANO (calculado no dry run; cache por arquivo + hospital + médicos) ========
+        content_hash = _hash_arquivo(raw_bytes)
+        with _fase("importar/plano"):
+            plano = _planejar_importacao(content_hash, hospital, _medicos_chave(final_pros), registros_filtrados)
+        if plano.get("erro"):
+            st.error(plano["erro"])
+            _planejar_importacao.clear()   # não guarda falha no cache
+        _mostrar_plano_importacao(plano)
+
+        # ======== IMPORTAÇÃO TURBO (executa o plano já calculado) ========
+        # Com uma importação em andamento o plano acima já reflete um banco pela metade:
+        # não deixa gravar de novo até ela terminar (o progresso aparece abaixo).
+        importando = bool(_fila_tarefas().listar(tipo="importacao", status=STATUS_ATIVOS, limite=1))
+        if importando:
+            st.warning("⏳ Há uma importação em andamento. Aguarde terminar para gravar outro arquivo.")
         colg1, colg2 = st.columns([1, 4])
         with colg1:
-            if st.button("Gravar no banco", type="primary", key="import_csv_gravar"):
-                total_criados = total_ignorados = total_internacoes = 0
-
-                # 1) Atendimentos únicos (originais) do arquivo pós-filtro
-                atts_file = sorted({att for (att, d) in pares if att})
-
-                # Mapeia original -> normalizado e conjuntos para busca
-                orig_to_norm = {att: _att_norm(att) for att in atts_file}
-                norm_set = sorted({v for v in orig_to_norm.values() if v})
-                num_set = sorted({_att_to_number(att) for att in atts_file if _att_to_number(att) is not None})
-
-                # 2) Carrega internações existentes (por atendimento e por numero)
-                existing_map_norm_to_id = {}
-                try:
-                    if norm_set:
-                        res_int = supabase.table("internacoes").select("id, atendimento").in_("atendimento", norm_set).execute()
-                        for r in (res_int.data or []):
-                            existing_map_norm_to_id[str(r["atendimento"])] = int(r["id"])
-                    if num_set:
-                        res_int_num = supabase.table("internacoes").select("id, numero_internacao").in_("numero_internacao", num_set).execute()
-                        for r in (res_int_num.data or []):
-                            k = _att_norm(str(int(float(r["numero_internacao"]))))
-                            existing_map_norm_to_id[k] = int(r["id"])
-                except APIError as e:
-                    _sb_debug_error(e, "Falha ao buscar internações existentes.")
-                    existing_map_norm_to_id = {}
-
-                # 3) Monta payload de internações que faltam (grava normalizado)
-                to_create_int = []
-                for att in atts_file:
-                    na = orig_to_norm.get(att)
-                    if not na:
-                        continue
-                    if na in existing_map_norm_to_id:
-                        continue
-                    itens_att = [r for r in registros_filtrados if r.get("atendimento") == att]
-                    paciente = next((x.get("paciente") for x in itens_att if x.get("paciente")), "") if itens_att else ""
-                    conv_total = next((x.get("convenio") for x in itens_att if x.get("convenio")), "") if itens_att else ""
-                    data_int = next((x.get("data") for x in itens_att if x.get("data")), None) or None
-                    to_create_int.append({
-                        "hospital": hospital,
-                        "atendimento": na,                         # normalizado
-                        "paciente": paciente,
-                        "data_internacao": _to_ddmmyyyy(data_int) if data_int else _to_ddmmyyyy(date.today()),
-                        "convenio": conv_total,
-                        "numero_internacao": _att_to_number(att)   # sem zeros à esquerda
-                    })
-
-                # 4) Inserção em lote de internações (chunks)
-                def _chunked_insert(table_name: str, rows: list, chunk: int = 500):
-                    for i in range(0, len(rows), chunk):
-                        supabase.table(table_name).insert(rows[i:i+chunk]).execute()
-
-                if to_create_int:
-                    try:
-                        _chunked_insert("internacoes", to_create_int, chunk=500)
-                        # Recarrega mapeamento por atendimento normalizado
-                        if norm_set:
-                            res_int2 = supabase.table("internacoes").select("id, atendimento").in_("atendimento", norm_set).execute()
-                            for r in (res_int2.data or []):
-                                existing_map_norm_to_id[str(r["atendimento"])] = int(r["id"])
-                        total_internacoes = len(to_create_int)
-                        invalidate_caches()
-                    except APIError as e:
-                        _sb_debug_error(e, "Falha ao criar internações em lote.")
-
-                # 5) Map (original -> ID) usando normalizado
-                att_to_id = {att: existing_map_norm_to_id.get(orig_to_norm.get(att)) for att in atts_file}
-                target_iids = sorted({iid for iid in att_to_id.values() if iid})
-
-                # 6) Busca procedimentos automáticos existentes (1 chamada) e cria set (iid, data)
-                existing_auto = set()
-                try:
-                    if target_iids:
-                        res_auto = (
-                            supabase.table("procedimentos")
-                            .select("internacao_id, data_procedimento, is_manual")
-                            .in_("internacao_id", target_iids).eq("is_manual", 0)
-                            .execute()
-                        )
-                        for r in (res_auto.data or []):
-                            iid = int(r["internacao_id"])
-                            dt = _to_ddmmyyyy(r.get("data_procedimento"))
-                            if iid and dt:
-                                existing_auto.add((iid, dt))
-                except APIError as e:
-                    _sb_debug_error(e, "Falha ao buscar procedimentos existentes.")
-
-                # 7) Gera payload dos novos (garante 1 automático/dia)
-                to_insert_auto = []
-                for (att, data_proc) in pares:
-                    if not att or not data_proc:
-                        total_ignorados += 1
-                        continue
-                    iid = att_to_id.get(att)
-                    if not iid:
-                        total_ignorados += 1
-                        continue
-
-                    data_norm = _to_ddmmyyyy(data_proc)
-                    if (iid, data_norm) in existing_auto:
-                        total_ignorados += 1
-                        continue
-
-                    prof_dia = next((it.get("profissional") for it in registros_filtrados
-                                     if it.get("atendimento") == att and it.get("data") == data_proc and it.get("profissional")), "")
-                    aviso_dia = next((it.get("aviso") for it in registros_filtrados
-                                      if it.get("atendimento") == att and it.get("data") == data_proc and it.get("aviso")), "")
-
-                    if not prof_dia:
-                        total_ignorados += 1
-                        continue
-
-                    to_insert_auto.append({
-                        "internacao_id": int(iid),
-                        "data_procedimento": data_norm,
-                        "profissional": prof_dia,
-                        "procedimento": "Cirurgia / Procedimento",
-                        "situacao": "Pendente",
-                        "observacao": None,
-                        "is_manual": 0,
-                        "aviso": (aviso_dia or None),
-                        "grau_participacao": None
-                    })
-                    # evita duplicar dentro do mesmo arquivo
-                    existing_auto.add((iid, data_norm))
-
-                # 8) Insere procedimentos em lote
-                if to_insert_auto:
-                    try:
-                        _chunked_insert("procedimentos", to_insert_auto, chunk=500)
-                        invalidate_caches()
-                        total_criados = len(to_insert_auto)
-                    except APIError as e:
-                        _sb_debug_error(e, "Falha ao inserir procedimentos em lote.")
-
-                st.success(
-                    f"Concluído! Internações criadas: {total_internacoes} | Automáticos criados: {total_criados} | Ignorados: {total_ignorados}"
+            gravar = st.button("Gravar no banco", type="primary", key="import_csv_gravar",
+                               disabled=bool(plano.get("erro")) or importando)
+        if USE_IMPORT_JOURNAL:
+            with colg2:
+                forcar = st.checkbox("Reprocessar mesmo se este arquivo já foi importado", key="import_forcar")
+        # 0) Diário: mesmo arquivo + hospital + médicos já importado? (curto-circuito, sem consultas)
+        if gravar and USE_IMPORT_JOURNAL:
+            anterior = None if forcar else buscar_lote_importado(content_hash, hospital, final_pros)
+            if anterior:
+                st.info(
+                    f"Este arquivo já foi importado (lote #{anterior['id']}, {str(anterior.get('created_at') or '')[:16]}): "
+                    f"{anterior.get('internacoes_criadas') or 0} internações e "
+                    f"{anterior.get('procedimentos_criados') or 0} procedimentos. Nada a fazer."
+                )
+                gravar = False
+            falho = None if (forcar or anterior) else buscar_lote_importado(content_hash, hospital, final_pros, status="falhou")
+            if falho:
+                st.warning(
+                    f"Uma importação deste arquivo parou com erro (lote #{falho['id']}, "
+                    f"{falho.get('internacoes_criadas') or 0} internações e {falho.get('procedimentos_criados') or 0} "
+                    "procedimentos já gravados). Retome-a em 'Importações em segundo plano', desfaça o lote em "
+                    "'📜 Lotes importados' ou marque 'Reprocessar' para gravar um lote novo só com o que falta."
                 )
-                st.toast("✅ Importação concluída.", icon="✅")
+                gravar = False
+
+        if gravar:
+            # Grava em segundo plano: sobrevive a reload da aba; o progresso aparece abaixo.
+            # A chave (hospital + arquivo) impede duas tarefas ativas do mesmo arquivo, mesmo
+            # com cliques simultâneos em outra aba/sessão.
+            fila = _fila_tarefas()
+            tid = fila.criar(
+                "importacao",
+                {"plano": plano, "batch_id": None, "t0": time.time()},
+                titulo=f"{arquivo.name} — {hospital}",
+                chave=f"{hospital}|{content_hash}",
+            )
+            if tid is None:
+                st.warning("Este arquivo já está sendo importado para este hospital. Acompanhe o progresso abaixo.")
+            else:
+                if USE_IMPORT_JOURNAL:
+                    batch_id = abrir_lote_importacao(content_hash, hospital, final_pros, arquivo.name, len(registros_filtrados))
+                    if batch_id:
+                        fila.atualizar_payload(tid, {"batch_id": batch_id})
+                fila.iniciar(tid, _tarefa_importacao)
+                st.session_state["import_tarefa_id"] = tid
+                _anotar_tarefa_da_sessao(tid)
+                _planejar_importacao.clear()   # o banco vai mudar: o próximo dry run recalcula
+                st.toast("⏳ Importação iniciada em segundo plano.", icon="⏳")
         # ======== FIM IMPORTAÇÃO TURBO ========
 
+    _painel_tarefas_importacao()
+    if USE_IMPORT_JOURNAL:
+        _painel_lotes_importacao()
+
     st.markdown("</div>", unsafe_allow_html=True)
     st.divider()
 
@@ -1650,17 +2874,227 @@ with tabs[1]:
 # ============================================================
 # 🔍 2) CONSULTAR
 # ============================================================
-with tabs[2]:
+@st.fragment
+def _editor_procedimentos(internacao_id: int, df_proc: pd.DataFrame):
+    """
+    Editor de procedimentos da internação (fragmento): editar células reroda só
+    o editor; o rerun completo acontece apenas depois de gravar.
+    """
+    st.subheader("Procedimentos — Editáveis")
+    falhas = st.session_state.pop("proc_lote_falhas", None)
+    if falhas:
+        st.error(f"{len(falhas)} procedimento(s) não foram atualizados:")
+        st.dataframe(pd.DataFrame(falhas), use_container_width=True, hide_index=True)
+    edited = st.data_editor(
+        df_proc,
+        key="editor_proc",
+        use_container_width=True, hide_index=True,
+        column_config={
+            "id": st.column_config.Column("ID", disabled=True),
+            "data_procedimento": st.column_config.Column("Data", disabled=True),
+            "profissional": st.column_config.Column("Profissional", disabled=True),
+            "aviso": st.column_config.TextColumn("Aviso"),
+            "grau_participacao": st.column_config.SelectboxColumn(
+                "Grau de Participação",
+                options=[""] + GRAU_PARTICIPACAO_OPCOES,
+                required=False
+            ),
+            "procedimento": st.column_config.SelectboxColumn(
+                "Tipo de Procedimento",
+                options=PROCEDIMENTO_OPCOES,
+                required=True
+            ),
+            "situacao": st.column_config.SelectboxColumn(
+                "Situação",
+                options=STATUS_OPCOES,
+                required=True
+            ),
+            "observacao": st.column_config.TextColumn("Observações"),
+        },
+    )
+
+    col_save = st.columns(6)[-1]
+    with col_save:
+        if st.button("💾 Salvar alterações", key="btn_save_proc", type="primary"):
+            alterados = diff_editor(df_proc, edited, TIPOS_CAMPOS_PROC)
+            if not alterados:
+                st.info("Nenhuma alteração detectada.")
+            else:
+                res_lote = atualizar_procedimentos_em_lote(alterados)
+                if res_lote["falhas"]:
+                    st.session_state["proc_lote_falhas"] = res_lote["falhas"]  # exibidas após o rerun
+                if res_lote["ok"]:
+                    st.toast(f"{len(res_lote['ok'])} procedimento(s) atualizado(s).", icon="✅")
+                st.rerun()  # gravou: rerun completo (lista de quitações/exclusão dependem de df_proc)
+
+
+def _ler_arquivo_atendimentos(arquivo) -> str:
+    """Texto com os atendimentos de um .txt/.csv/.xlsx (coluna 'atendimento' se houver; senão a 1ª)."""
+    nome = (arquivo.name or "").lower()
+    if nome.endswith((".xlsx", ".xls", ".csv")):
+        try:
+            if nome.endswith(".csv"):
+                df = pd.read_csv(arquivo, dtype=str, sep=None, engine="python", header=None)
+            else:
+                df = pd.read_excel(arquivo, dtype=str, header=None)
+        except Exception as e:
+            st.error(f"Não foi possível ler o arquivo: {e}")
+            return ""
+        if df.empty:
+            return ""
+        cab = [str(c or "").strip().lower() for c in df.iloc[0].tolist()]
+        col = next((i for i, c in enumerate(cab) if "atend" in c), 0)
+        return "\n".join(df.iloc[:, col].dropna().astype(str).tolist())
+    return arquivo.getvalue().decode("utf-8", errors="ignore")
+
+def _consulta_em_lote(filtro_hosp: str):
+    """Consulta de vários atendimentos (colados ou de arquivo) numa tacada só."""
+    c1, c2 = st.columns([3, 2])
+    with c1:
+        texto = st.text_area(
+            "Cole os atendimentos (um por linha, ou separados por vírgula/;):",
+            key="consulta_lote_texto", height=160,
+        )
+    with c2:
+        arquivo = st.file_uploader("…ou envie um arquivo (.txt, .csv, .xlsx)", type=["txt", "csv", "xlsx"], key="consulta_lote_arquivo")
+
+    bruto = texto or ""
+    if arquivo is not None:
+        bruto += "\n" + _ler_arquivo_atendimentos(arquivo)
+    atts = _parse_lista_atendimentos(bruto)
+    if not atts:
+        st.info("Informe ao menos um atendimento.")
+        return
+
+    try:
+        with _fase("consulta/fetch_lote"):
+            df_int, df_proc, nao_encontrados = buscar_internacoes_em_lote(tuple(atts))
+    except APIError as e:
+        _sb_debug_error(e, "Falha ao consultar internações em lote.")
+        return
+    em_outro_hospital = []
+    if filtro_hosp != "Todos" and not df_int.empty:
+        df_int = df_int[df_int["hospital"] == filtro_hosp]
+        no_hospital = set().union(*(_atts_da_internacao(r) for r in df_int.to_dict("records")))
+        em_outro_hospital = [a for a in atts if a not in no_hospital and a not in nao_encontrados]
+    if not df_proc.empty and not df_int.empty:
+        df_proc = df_proc[df_proc["internacao_id"].isin(df_int["id"])]
+
+    kpi_row([
+        {"label": "Atendimentos informados", "value": f"{len(atts):,}".replace(",", ".")},
+        {"label": "Internações encontradas", "value": f"{len(df_int):,}".replace(",", ".")},
+        {"label": "Procedimentos", "value": f"{len(df_proc) if not df_int.empty else 0:,}".replace(",", ".")},
+        {"label": "Não encontrados", "value": f"{len(nao_encontrados):,}".replace(",", ".")},
+    ], extra_class="compact")
+
+    if df_int.empty:
+        st.warning("Nenhuma internação encontrada.")
+    else:
+        # Uma linha por procedimento (internações sem procedimento aparecem com colunas vazias)
+        cols_int = [c for c in ["id", "atendimento", "paciente", "hospital", "convenio", "data_internacao"] if c in df_int.columns]
+        base_int = df_int[cols_int].rename(columns={"id": "internacao_id"})
+        cols_proc = [c for c in ["internacao_id", "id", "data_procedimento", "profissional", "procedimento",
+                                 "situacao", "aviso", "grau_participacao", "observacao"] if c in df_proc.columns]
+        df_lote = safe_merge(base_int, df_proc[cols_proc] if cols_proc else pd.DataFrame(),
+                             left_on="internacao_id", right_on="internacao_id", how="left")
+        df_lote = df_lote.rename(columns={"id": "procedimento_id"})
+        if "aviso" in df_lote.columns:
+            df_lote["aviso"] = df_lote["aviso"].apply(_fmt_id_str)
+        if "atendimento" in df_lote.columns:
+            ordem = {a: i for i, a in enumerate(atts)}
+            df_lote["_ord"] = df_lote["atendimento"].map(lambda a: ordem.get(_att_norm(a), len(ordem)))
+            df_lote = df_lote.sort_values(["_ord", "internacao_id"], kind="stable").drop(columns=["_ord"])
+
+        st.subheader("Internações e procedimentos")
+        st.dataframe(df_lote, use_container_width=True, hide_index=True)
+        st.download_button(
+            "⬇️ Baixar resultado (CSV)",
+            data=_dados_sob_demanda("csv_consulta_lote", {"filtro_hosp": filtro_hosp}, df_lote, _to_csv_bytes),
+            file_name=f"consulta_lote_{_now_ts()}.csv",
+            mime="text/csv",
+            on_click="ignore",
+            key="dl_consulta_lote",
+        )
+
+    if nao_encontrados:
+        st.subheader(f"Não encontrados ({len(nao_encontrados)})")
+        st.code("\n".join(nao_encontrados), language="text")
+    if em_outro_hospital:
+        st.subheader(f"Em outro hospital ({len(em_outro_hospital)})")
+        st.caption(f"Existem, mas não no hospital filtrado ({filtro_hosp}). Use 'Todos' para vê-los.")
+        st.code("\n".join(em_outro_hospital), language="text")
+
+    if not df_int.empty:
+        _exclusao_em_lote(df_int, df_proc)
+
+def _exclusao_em_lote(df_int: pd.DataFrame, df_proc: pd.DataFrame):
+    """Exclusão múltipla (limpeza de importações erradas) a partir do resultado da consulta em lote."""
+    with st.expander("🗑️ Excluir em lote"):
+        st.warning("Excluir uma internação apaga também TODOS os procedimentos vinculados.")
+        rot_int = {
+            int(r["id"]): f"{r.get('atendimento', '')} — {r.get('paciente', '') or '-'} ({r.get('hospital', '')}) · id {int(r['id'])}"
+            for r in df_int.to_dict("records")
+        }
+        sel_int = st.multiselect("Internações a excluir:", list(rot_int), format_func=rot_int.get, key="lote_del_int")
+
+        rot_proc = {}
+        if not df_proc.empty:
+            att_por_iid = {int(r["id"]): r.get("atendimento", "") for r in df_int.to_dict("records")}
+            for r in df_proc.to_dict("records"):
+                if int(r["internacao_id"]) in sel_int:
+                    continue  # já sai junto com a internação
+                rot_proc[int(r["id"])] = (
+                    f"{att_por_iid.get(int(r['internacao_id']), '')} · {r.get('data_procedimento', '')} · "
+                    f"{r.get('profissional', '') or '-'} · {r.get('situacao', '')} · id {int(r['id'])}"
+                )
+        sel_proc = st.multiselect("Procedimentos avulsos a excluir:", list(rot_proc), format_func=rot_proc.get, key="lote_del_proc")
+
+        confirm = st.text_input("Digite APAGAR para confirmar", key="lote_del_confirm")
+        if st.button("Excluir selecionados", key="btn_lote_del", type="primary", disabled=not (sel_int or sel_proc)):
+            if confirm.strip().upper() != "APAGAR":
+                st.info("Confirmação inválida. Digite APAGAR.")
+                return
+            msgs, bloqueados = [], False
+            if sel_int:
+                r = excluir_internacoes_em_lote(sel_int)
+                if r is None:
+                    st.stop()
+                msgs.append(f"{r['internacoes']} internação(ões) e {r['procedimentos']} procedimento(s)")
+                bloqueados = bool(r["bloqueadas"])
+            if sel_proc:
+                r = excluir_procedimentos_em_lote(sel_proc)
+                if r is None:
+                    st.stop()
+                msgs.append(f"{r['procedimentos']} procedimento(s) avulso(s)")
+                bloqueados = bloqueados or bool(r["bloqueados"])
+            if bloqueados:
+                # Sem rerun: o st.error com os ids que ficaram precisa continuar na tela
+                st.warning("Excluídos: " + "; ".join(msgs))
+                st.stop()
+            for k in ("lote_del_int", "lote_del_proc", "lote_del_confirm"):
+                st.session_state.pop(k, None)
+            st.toast("🗑️ Excluídos: " + "; ".join(msgs), icon="✅")
+            st.rerun()
+
+if secao == "🔍 Consultar Internação":
     tab_header_with_home("🔍 Consultar Internação", btn_key_suffix="consulta")
 
     st.markdown("<div class='soft-card'>", unsafe_allow_html=True)
     hlist = ["Todos"] + get_hospitais()
     filtro_hosp = st.selectbox("Filtrar hospital (consulta):", hlist)
-    codigo = st.text_input("Digite o atendimento para consultar:", key="consulta_codigo", placeholder="Ex.: 0007064233 ou 7064233")
+    modo_consulta = st.radio("Modo:", ["Um atendimento", "Em lote"], horizontal=True, key="consulta_modo")
+    if modo_consulta == "Um atendimento":
+        codigo = st.text_input("Digite o atendimento para consultar:", key="consulta_codigo", placeholder="Ex.: 0007064233 ou 7064233")
+    else:
+        codigo = ""
     st.markdown("</div>", unsafe_allow_html=True)
 
+    if modo_consulta == "Em lote":
+        _consulta_em_lote(filtro_hosp)
+
     if codigo:
-        df_int = get_internacao_by_atendimento(codigo)
+        with _fase("consulta/fetch"):
+            df_int = get_internacao_by_atendimento(codigo)
         if filtro_hosp != "Todos":
             df_int = df_int[df_int["hospital"] == filtro_hosp]
 
@@ -1729,9 +3163,10 @@ with tabs[2]:
 
             # ===== Procedimentos (edição) =====
             try:
-                res_p = supabase.table("procedimentos").select(
-                    "id, data_procedimento, profissional, procedimento, situacao, observacao, aviso, grau_participacao"
-                ).eq("internacao_id", internacao_id).execute()
+                with _fase("consulta/fetch_procedimentos"):
+                    res_p = supabase.table("procedimentos").select(
+                        "id, data_procedimento, profissional, procedimento, situacao, observacao, aviso, grau_participacao"
+                    ).eq("internacao_id", internacao_id).execute()
                 df_proc = pd.DataFrame(res_p.data or [])
             except APIError as e:
                 _sb_debug_error(e, "Falha ao carregar procedimentos.")
@@ -1768,66 +3203,8 @@ with tabs[2]:
             if "aviso" in df_proc.columns:
                 df_proc["aviso"] = df_proc["aviso"].apply(_fmt_id_str)
 
-            st.subheader("Procedimentos — Editáveis")
-            edited = st.data_editor(
-                df_proc,
-                key="editor_proc",
-                use_container_width=True, hide_index=True,
-                column_config={
-                    "id": st.column_config.Column("ID", disabled=True),
-                    "data_procedimento": st.column_config.Column("Data", disabled=True),
-                    "profissional": st.column_config.Column("Profissional", disabled=True),
-                    "aviso": st.column_config.TextColumn("Aviso"),
-                    "grau_participacao": st.column_config.SelectboxColumn(
-                        "Grau de Participação",
-                        options=[""] + GRAU_PARTICIPACAO_OPCOES,
-                        required=False
-                    ),
-                    "procedimento": st.column_config.SelectboxColumn(
-                        "Tipo de Procedimento",
-                        options=PROCEDIMENTO_OPCOES,
-                        required=True
-                    ),
-                    "situacao": st.column_config.SelectboxColumn(
-                        "Situação",
-                        options=STATUS_OPCOES,
-                        required=True
-                    ),
-                    "observacao": st.column_config.TextColumn("Observações"),
-                },
-            )
-
-            col_save = st.columns(6)[-1]
-            with col_save:
-                if st.button("💾 Salvar alterações", key="btn_save_proc", type="primary"):
-                    cols_chk = ["procedimento", "situacao", "observacao", "grau_participacao", "aviso"]
-                    df_compare = df_proc[["id"] + cols_chk].merge(edited[["id"] + cols_chk], on="id", suffixes=("_old", "_new"))
-                    alterados = []
-                    for _, row in df_compare.iterrows():
-                        changed = any((str(row[c + "_old"] or "") != str(row[c + "_new"] or "")) for c in cols_chk)
-                        if changed:
-                            alterados.append({
-                                "id": int(row["id"]),
-                                "procedimento": row["procedimento_new"],
-                                "situacao": row["situacao_new"],
-                                "observacao": row["observacao_new"],
-                                "grau_participacao": (row["grau_participacao_new"] if row["grau_participacao_new"] != "" else None),
-                                "aviso": row["aviso_new"],
-                            })
-                    if not alterados:
-                        st.info("Nenhuma alteração detectada.")
-                    else:
-                        for item in alterados:
-                            atualizar_procedimento(
-                                proc_id=item["id"],
-                                procedimento=item["procedimento"],
-                                situacao=item["situacao"],
-                                observacao=item["observacao"],
-                                grau_participacao=item["grau_participacao"],
-                                aviso=item.get("aviso"),
-                            )
-                        st.toast(f"{len(alterados)} procedimento(s) atualizado(s).", icon="✅")
-                        st.rerun()
+            with _fase("consulta/render_editor"):
+                _editor_procedimentos(internacao_id, df_proc)
 
             # ===== Excluir procedimento =====           
             with st.expander("🗑️ Excluir cirurgia (procedimento)"):
@@ -1975,244 +3352,103 @@ with tabs[2]:
 # 📑 3) RELATÓRIOS
 # ============================================================
 # --- PDF: Cirurgias por Status ---
-if REPORTLAB_OK:
-    def _pdf_cirurgias_por_status(df, filtros):
-        buf = io.BytesIO()
-        doc = SimpleDocTemplate(buf, pagesize=landscape(A4), leftMargin=18, rightMargin=18, topMargin=18, bottomMargin=18)
-        styles = getSampleStyleSheet()
-        H1 = styles["Heading1"]; H2 = styles["Heading2"]; N = styles["BodyText"]
-        from reportlab.lib.styles import ParagraphStyle
-        from reportlab.platypus import Paragraph
-
-        TH = ParagraphStyle("TH", parent=styles["Normal"], fontName="Helvetica-Bold", fontSize=9, leading=11, alignment=1)
-        TD = ParagraphStyle("TD", parent=styles["Normal"], fontName="Helvetica", fontSize=8, leading=10, wordWrap="LTR")
-        TD_CENTER = ParagraphStyle(**{**TD.__dict__, "alignment":1})
-        elems = []
-        elems.append(Paragraph("Relatório — Cirurgias por Status", H1)); elems.append(Spacer(1,6))
-        filtros_txt = (f"Período: {filtros['ini']} a {filtros['fim']}  |  Hospital: {filtros['hospital']}  |  Status: {filtros['status']}")
-        elems.append(Paragraph(filtros_txt, N)); elems.append(Spacer(1,8))
-        total = len(df); elems.append(Paragraph(f"Total de cirurgias: <b>{total}</b>", H2))
-
-        if total > 0 and filtros["status"] == "Todos":
-            resumo = (df.groupby("situacao")["situacao"].count().sort_values(ascending=False).reset_index(name="qtd"))
-            data_resumo = [["Situação", "Quantidade"]] + resumo.values.tolist()
-            t_res = Table(data_resumo, hAlign="LEFT")
-            t_res.setStyle(TableStyle([
-                ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#F0F0F0")),
-                ("GRID", (0,0), (-1,-1), 0.25, colors.grey),
-                ("ALIGN", (1,1), (-1,-1), "RIGHT"),
-                ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
-                ("FONTSIZE", (0,0), (-1,0), 9),
-            ]))
-            elems.append(t_res); elems.append(Spacer(1,10))
-
-        header_labels = ["Atendimento","Aviso","Convênio","Paciente","Data","Tipo","Profissional","Grau de Participação","Hospital","Situação"]
-        header = [Paragraph(h, TH) for h in header_labels]
-        col_widths = [2.6*cm,2.0*cm,2.8*cm,5.0*cm,2.2*cm,2.4*cm,2.8*cm,3.0*cm,2.6*cm,2.1*cm]
-
-        def _p(v, style=TD): return Paragraph("" if v is None else str(v), style)
-        data_rows = []
-        for _, r in df.iterrows():
-            data_rows.append([
-                _p(r.get("atendimento"), TD_CENTER),
-                _p(r.get("aviso"), TD_CENTER),
-                _p(r.get("convenio")),
-                _p(r.get("paciente")),
-                _p(r.get("data_procedimento"), TD_CENTER),
-                _p(r.get("procedimento")),
-                _p(r.get("profissional")),
-                _p(r.get("grau_participacao"), TD_CENTER),
-                _p(r.get("hospital")),
-                _p(r.get("situacao"), TD_CENTER),
-            ])
-        table = Table([header] + data_rows, repeatRows=1, colWidths=col_widths)
-        table.setStyle(TableStyle([
-            ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#E8EEF7")),
-            ("GRID", (0,0), (-1,-1), 0.25, colors.grey),
-            ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
-            ("FONTSIZE", (0,0), (-1,0), 9),
-            ("VALIGN", (0,0), (-1,-1), "TOP"),
-            ("ROWBACKGROUNDS", (0,1), (-1,-1), [colors.white, colors.HexColor("#FAFAFA")]),
-            ("ALIGN", (0,0), (-1,0), "CENTER"),
-        ]))
-        elems.append(table)
-        doc.build(elems)
-        pdf_bytes = buf.getvalue(); buf.close()
-        return pdf_bytes
-else:
-    def _pdf_cirurgias_por_status(*args, **kwargs):
-        raise RuntimeError("ReportLab não está instalado no ambiente.")
+# O layout/paginação ficam em relatorios.py (tabela em blocos de linhas,
+# estilos reaproveitados, PDF gravado em arquivo temporário) e a geração
+# roda em outro processo (FilaRelatorios). Aqui só se prepara o DataFrame
+# já como texto e os argumentos do gerador.
+def _args_pdf_cirurgias(df, filtros) -> Dict[str, Any]:
+    resumo = None
+    if len(df) > 0 and filtros["status"] == "Todos":
+        resumo = (df.groupby("situacao")["situacao"].count().sort_values(ascending=False)
+                  .reset_index(name="qtd").values.tolist())
+    cols = [c.campo for c in relatorios.LAYOUT_CIRURGIAS.colunas]
+    return {"df": df.reindex(columns=cols), "filtros": filtros, "resumo": resumo}
 
 # --- PDF: Quitações (colunas fixas, sem Aviso e sem Situação, A4 paisagem) ---
 
-if REPORTLAB_OK:
-    def _pdf_quitacoes_colunas_fixas(df, filtros):
-        """
-        Quitação | Hospital | Atendimento | Paciente | Convênio | Profissional | Grau |
-        Data Proc. | Guia AMHPTISS | R$ AMHPTISS | Guia Compl. | R$ Compl.
-        - Evita quebra em 'Atendimento' (header) e nas datas (nobr).
-        - Ajuste fino de larguras para A4 paisagem, sem cortes.
-        """
-        # ---- Garantias de colunas ----
-        need = [
-            "quitacao_data","hospital","atendimento","paciente","convenio",
-            "profissional","grau_participacao","data_procedimento",
-            "quitacao_guia_amhptiss","quitacao_valor_amhptiss",
-            "quitacao_guia_complemento","quitacao_valor_complemento",
-        ]
-        df = df.copy()
-        for c in need:
-            if c not in df.columns: df[c] = ""
-
-        # ---- Normalizações e datas ----
-        for col in ["quitacao_guia_amhptiss","quitacao_guia_complemento"]:
-            df[col] = df[col].apply(_fmt_id_str)
-
-        def _fmt_dt(s):
-            d = _pt_date_to_dt(s)
-            return d.strftime("%d/%m/%Y") if isinstance(d, (date, datetime)) and not pd.isna(d) else (str(s) or "")
-
-        df["quitacao_data"]     = df["quitacao_data"].apply(_fmt_dt)
-        df["data_procedimento"] = df["data_procedimento"].apply(_fmt_dt)
-
-        # ---- Totais ----
-        v_amhp = pd.to_numeric(df.get("quitacao_valor_amhptiss", 0), errors="coerce").fillna(0.0)
-        v_comp = pd.to_numeric(df.get("quitacao_valor_complemento", 0), errors="coerce").fillna(0.0)
-        total_amhp = float(v_amhp.sum()); total_comp = float(v_comp.sum()); total_geral = total_amhp + total_comp
-
-        # ---- ReportLab ----
-        buf = io.BytesIO()
-        doc = SimpleDocTemplate(
-            buf, pagesize=landscape(A4),
-            leftMargin=18, rightMargin=18, topMargin=18, bottomMargin=18
-        )
-        styles = getSampleStyleSheet()
-        H1 = styles["Heading1"]; N = styles["BodyText"]
-
-        from reportlab.lib.styles import ParagraphStyle
-        from reportlab.platypus import Table, TableStyle, Spacer, Paragraph
-        from reportlab.lib import colors
-        from reportlab.lib.units import cm
-
-        # Fonte um pouco menor + estilos
-        TH = ParagraphStyle("TH", parent=styles["Normal"], fontName="Helvetica-Bold", fontSize=8.2, leading=9.8, alignment=1)
-        TD = ParagraphStyle("TD", parent=styles["Normal"], fontName="Helvetica", fontSize=7.8, leading=9.6, wordWrap="LTR")
-        TD_CENTER = ParagraphStyle("TD_CENTER", parent=TD, alignment=1)
-        TD_RIGHT  = ParagraphStyle("TD_RIGHT", parent=TD, alignment=2)
-        TD_SMALL  = ParagraphStyle("TD_SMALL", parent=TD, fontSize=7.0, leading=8.6)  # Paciente/Convênio
-
-        # Helper para impedir quebra dentro do texto
-        def nobr(text: str) -> str:
-            s = "" if text is None else str(text)
-            return f"<nobr>{s}</nobr>"
-
-        # Título e filtros
-        elems = []
-        elems.append(Paragraph("Relatório — Quitações", H1))
-        filtros_txt = f"Período da quitação: {filtros['ini']} a {filtros['fim']}  |  Hospital: {filtros['hospital']}"
-        elems.append(Paragraph(filtros_txt, N))
-        elems.append(Spacer(1, 8))
-
-        # Cabeçalho (aplicando nobr SOMENTE em 'Atendimento')
-        headers_raw = [
-            "Quitação","Hospital", nobr("Atendimento"), "Paciente","Convênio","Profissional","Grau",
-            "Data Proc.","Guia AMHPTISS","R$ AMHPTISS","Guia Compl.","R$ Compl."
-        ]
-        headers = [Paragraph(h, TH) for h in headers_raw]
+def _args_pdf_quitacoes(df, filtros) -> Dict[str, Any]:
+    """
+    Quitação | Hospital | Atendimento | Paciente | Convênio | Profissional | Grau |
+    Data Proc. | Guia AMHPTISS | R$ AMHPTISS | Guia Compl. | R$ Compl.
+    - Datas, guias e valores já vão formatados como texto (sem quebra).
+    """
+    # ---- Garantias de colunas ----
+    need = [c.campo for c in relatorios.LAYOUT_QUITACOES.colunas]
+    df = df.copy()
+    for c in need:
+        if c not in df.columns: df[c] = ""
 
-        # Ordem de colunas
-        cols = [
-            "quitacao_data","hospital","atendimento","paciente","convenio","profissional","grau_participacao",
-            "data_procedimento","quitacao_guia_amhptiss","quitacao_valor_amhptiss",
-            "quitacao_guia_complemento","quitacao_valor_complemento",
-        ]
+    # ---- Normalizações e datas ----
+    for col in ["quitacao_guia_amhptiss","quitacao_guia_complemento"]:
+        df[col] = df[col].map(_fmt_id_str)
 
-        # Larguras (cm) — soma ≈ 28,4 cm (área útil em A4 paisagem com margens 18pt)
-        # ↑ aumento em Quitação (+0.2) e Atendimento (+0.2) para evitar quebra; compensação nas guias (−0.4 no total)
-        col_widths = [
-            2.0*cm,  # Quitação   (↑ +0.2)
-            2.2*cm,  # Hospital
-            2.2*cm,  # Atendimento (↑ +0.2)
-            4.3*cm,  # Paciente
-            2.6*cm,  # Convênio
-            3.2*cm,  # Profissional
-            1.8*cm,  # Grau
-            2.0*cm,  # Data Proc.
-            2.5*cm,  # Guia AMHPTISS (↓ -0.1)
-            2.1*cm,  # R$ AMHPTISS (↓ -0.1)
-            2.5*cm,  # Guia Compl.   (↓ -0.1)
-            2.0*cm,  # R$ Compl.     (↓ -0.2)
-        ]
+    def _fmt_dt(s):
+        d = _pt_date_to_dt(s)
+        return d.strftime("%d/%m/%Y") if isinstance(d, (date, datetime)) and not pd.isna(d) else (str(s) or "")
+
+    df["quitacao_data"]     = df["quitacao_data"].map(_fmt_dt)
+    df["data_procedimento"] = df["data_procedimento"].map(_fmt_dt)
+
+    # ---- Totais ----
+    v_amhp = pd.to_numeric(df["quitacao_valor_amhptiss"], errors="coerce").fillna(0.0)
+    v_comp = pd.to_numeric(df["quitacao_valor_complemento"], errors="coerce").fillna(0.0)
+    total_amhp = float(v_amhp.sum()); total_comp = float(v_comp.sum()); total_geral = total_amhp + total_comp
+    totais = [
+        ["Total AMHPTISS:", _format_currency_br(total_amhp)],
+        ["Total Complemento:", _format_currency_br(total_comp)],
+        ["Total Geral:", _format_currency_br(total_geral)],
+    ]
 
-        # Builder de Paragraph
-        def P(v, style=TD): return Paragraph("" if v is None else str(v), style)
-
-        # Linhas (aplicando nobr nas DATAS)
-        data_rows = []
-        for _, r in df.iterrows():
-            data_rows.append([
-                P(nobr(r["quitacao_data"]), TD_CENTER),           # Quitação (data) sem quebra
-                P(r["hospital"], TD),
-                P(r["atendimento"], TD_CENTER),
-                P(r["paciente"], TD_SMALL),
-                P(r["convenio"], TD_SMALL),
-                P(r["profissional"], TD),
-                P(r["grau_participacao"], TD_CENTER),
-                P(nobr(r["data_procedimento"]), TD_CENTER),       # Data Proc. sem quebra
-                P(r["quitacao_guia_amhptiss"], TD_CENTER),
-                P(_format_currency_br(r["quitacao_valor_amhptiss"]), TD_RIGHT),
-                P(r["quitacao_guia_complemento"], TD_CENTER),
-                P(_format_currency_br(r["quitacao_valor_complemento"]), TD_RIGHT),
-            ])
+    for col in ["quitacao_valor_amhptiss","quitacao_valor_complemento"]:
+        df[col] = df[col].map(_format_currency_br)
+    return {"df": df[need], "filtros": filtros, "totais": totais}
 
-        table = Table([headers] + data_rows, repeatRows=1, colWidths=col_widths)
-        table.setStyle(TableStyle([
-            ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#E8EEF7")),
-            ("GRID", (0,0), (-1,-1), 0.25, colors.grey),
-            ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
-            ("FONTSIZE", (0,0), (-1,0), 8.2),
-            ("VALIGN", (0,0), (-1,-1), "TOP"),
-            ("ROWBACKGROUNDS", (0,1), (-1,-1), [colors.white, colors.HexColor("#FAFAFA")]),
-            ("ALIGN", (0,0), (-1,0), "CENTER"),
-            # monetárias
-            ("ALIGN", (9,1), (9,-1), "RIGHT"),
-            ("ALIGN", (11,1), (11,-1), "RIGHT"),
-            # datas/códigos
-            ("ALIGN", (0,1), (0,-1), "CENTER"),   # Quitação
-            ("ALIGN", (2,1), (2,-1), "CENTER"),   # Atendimento
-            ("ALIGN", (7,1), (7,-1), "CENTER"),   # Data Proc.
-            ("ALIGN", (8,1), (8,-1), "CENTER"),   # Guia AMHPTISS
-            ("ALIGN", (10,1), (10,-1), "CENTER"), # Guia Compl.
-        ]))
-        elems.append(table)
-        elems.append(Spacer(1, 8))
-
-        # Totais
-        totals_data = [
-            ["Total AMHPTISS:", _format_currency_br(total_amhp)],
-            ["Total Complemento:", _format_currency_br(total_comp)],
-            ["Total Geral:", _format_currency_br(total_geral)],
-        ]
-        totals_tbl = Table(totals_data, colWidths=[4.5*cm, 3.5*cm], hAlign="RIGHT")
-        totals_tbl.setStyle(TableStyle([
-            ("FONTNAME", (0,0), (-1,-1), "Helvetica"),
-            ("FONTSIZE", (0,0), (-1,-1), 10),
-            ("ALIGN", (0,0), (0,-1), "RIGHT"),
-            ("ALIGN", (1,0), (1,-1), "RIGHT"),
-        ]))
-        elems.append(totals_tbl)
 
-        doc.build(elems)
-        pdf_bytes = buf.getvalue(); buf.close()
-        return pdf_bytes
+def _gerar_pdf_em_segundo_plano(chave_sessao: str, tipo: str, kwargs: Dict[str, Any], arquivo: str, msg: str):
+    """Agenda o PDF; a chave (tipo, filtros, impressão digital do df) reaproveita um PDF já gerado."""
+    with _fase(f"relatorios/{tipo}_submeter"):
+        chave = relatorios.chave_relatorio(tipo, kwargs["filtros"], kwargs["df"])
+        _fila_relatorios().submeter(chave, tipo, **kwargs)
+    st.session_state[chave_sessao] = {"chave": chave, "filtros": kwargs["filtros"], "arquivo": arquivo, "msg": msg}
 
+@st.fragment(run_every=1.0)
+def _aguardar_relatorio(chave: str):
+    """Status enquanto o PDF é gerado; ao terminar, rerun para mostrar o download."""
+    est = _fila_relatorios().estado(chave)
+    if est["status"] == "executando":
+        st.info(f"⏳ Gerando PDF em segundo plano… {est['s']:.0f}s (as outras abas continuam livres)")
+    else:
+        st.rerun()
+
+def _mostrar_relatorio(chave_sessao: str, filtros: Dict[str, Any], rotulo: str, dl_key: str):
+    """Status/download do último PDF pedido nesta sessão (se os filtros ainda são os mesmos)."""
+    job = st.session_state.get(chave_sessao)
+    if not job or job["filtros"] != filtros:
+        return
+    est = _fila_relatorios().estado(job["chave"])
+    if est["status"] == "executando":
+        _aguardar_relatorio(job["chave"])
+    elif est["status"] == "pronto":
+        st.success(f"{job['msg']} (gerado em {est['s']:.1f}s)")
+        st.download_button(
+            label=rotulo,
+            data=est["bytes"],
+            file_name=job["arquivo"],
+            mime="application/pdf",
+            use_container_width=True,
+            key=dl_key,
+        )
+    elif est["status"] == "erro":
+        st.error(f"Falha ao gerar o PDF: {est['erro']}")
+    else:
+        st.session_state.pop(chave_sessao, None)   # saiu do LRU: gerar de novo
 
-with tabs[3]:
-    tab_header_with_home("📑 Relatórios — Central", btn_key_suffix="relatorios")
 
+@st.fragment
+def _painel_rel_cirurgias(hosp_opts: list):
+    """Filtros + geração do relatório de cirurgias (fragmento: mexer nos filtros não reroda o app)."""
     # 1) Cirurgias por Status
     st.markdown("**1) Cirurgias por Status (PDF)**")
-    hosp_opts = ["Todos"] + get_hospitais()
     colf1, colf2, colf3 = st.columns(3)
     with colf1:
         hosp_sel = st.selectbox("Hospital", hosp_opts, index=0, key="rel_hosp")
@@ -2225,19 +3461,27 @@ with tabs[3]:
         dt_fim = st.date_input("Data final", value=hoje, key="rel_fim")
 
     # Base (procedimentos Cirurgia/Proc + merge com internacoes ou view)
-    df_rel = _rel_cirurgias_base_df()
-    if not df_rel.empty:
-        df_rel["_data_dt"] = df_rel["data_procedimento"].apply(_pt_date_to_dt)
-        mask = (df_rel["_data_dt"].notna()) & (df_rel["_data_dt"] >= dt_ini) & (df_rel["_data_dt"] <= dt_fim)
-        df_rel = df_rel[mask].copy()
-        if hosp_sel != "Todos":
-            df_rel = df_rel[df_rel["hospital"] == hosp_sel]
-        if status_sel != "Todos":
-            df_rel = df_rel[df_rel["situacao"] == status_sel]
-        df_rel = df_rel.sort_values(by=["_data_dt","hospital","paciente","atendimento"])
-        df_rel["data_procedimento"] = df_rel["_data_dt"].apply(lambda d: d.strftime("%d/%m/%Y") if pd.notna(d) else "")
-        df_rel = df_rel.drop(columns=["_data_dt"])
-
+    with _fase("relatorios/fetch_cirurgias"):
+        df_rel = _rel_cirurgias_base_df()
+    with _fase("relatorios/filtro_cirurgias"):
+        if not df_rel.empty:
+            df_rel["_data_dt"] = df_rel["data_procedimento"].apply(_pt_date_to_dt)
+            mask = (df_rel["_data_dt"].notna()) & (df_rel["_data_dt"] >= dt_ini) & (df_rel["_data_dt"] <= dt_fim)
+            df_rel = df_rel[mask].copy()
+            if hosp_sel != "Todos":
+                df_rel = df_rel[df_rel["hospital"] == hosp_sel]
+            if status_sel != "Todos":
+                df_rel = df_rel[df_rel["situacao"] == status_sel]
+            df_rel = df_rel.sort_values(by=["_data_dt","hospital","paciente","atendimento"])
+            df_rel["data_procedimento"] = df_rel["_data_dt"].apply(lambda d: d.strftime("%d/%m/%Y") if pd.notna(d) else "")
+            df_rel = df_rel.drop(columns=["_data_dt"])
+
+    filtros = {
+        "ini": dt_ini.strftime("%d/%m/%Y"),
+        "fim": dt_fim.strftime("%d/%m/%Y"),
+        "hospital": hosp_sel,
+        "status": status_sel,
+    }
     colc1, colc2 = st.columns(2)
     with colc1:
         if st.button("Gerar PDF (Cirurgias por Status)", key="btn_pdf_cir", type="primary"):
@@ -2246,41 +3490,43 @@ with tabs[3]:
             elif not REPORTLAB_OK:
                 st.error("A biblioteca 'reportlab' não está instalada no ambiente.")
             else:
-                filtros = {
-                    "ini": dt_ini.strftime("%d/%m/%Y"),
-                    "fim": dt_fim.strftime("%d/%m/%Y"),
-                    "hospital": hosp_sel,
-                    "status": status_sel,
-                }
-                pdf_bytes = _pdf_cirurgias_por_status(df_rel, filtros)
                 ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-                fname = f"relatorio_cirurgias_por_status_{ts}.pdf"
-                st.success(f"Relatório gerado com {len(df_rel)} registro(s).")
-                st.download_button(
-                    label="⬇️ Baixar PDF",
-                    data=pdf_bytes,
-                    file_name=fname,
-                    mime="application/pdf",
-                    use_container_width=True
+                _gerar_pdf_em_segundo_plano(
+                    "rel_pdf_cir", "pdf_cirurgias", _args_pdf_cirurgias(df_rel, filtros),
+                    arquivo=f"relatorio_cirurgias_por_status_{ts}.pdf",
+                    msg=f"Relatório gerado com {len(df_rel)} registro(s).",
                 )
+        _mostrar_relatorio("rel_pdf_cir", filtros, "⬇️ Baixar PDF", "dl_pdf_cir")
     with colc2:
         if not df_rel.empty:
-            csv_bytes = df_rel.to_csv(index=False).encode("utf-8-sig")
+            # Gerado só no clique (e memoizado por filtros + dados)
             st.download_button(
                 "⬇️ Baixar CSV (fallback)",
-                data=csv_bytes,
+                data=_dados_sob_demanda("csv_cirurgias", filtros, df_rel, _to_csv_bytes),
                 file_name=f"cirurgias_por_status_{date.today().strftime('%Y%m%d')}.csv",
-                mime="text/csv"
+                mime="text/csv",
+                on_click="ignore",
+                key="dl_csv_cir",
             )
+            if PYARROW_OK:
+                st.download_button(
+                    "⬇️ Baixar Parquet (tipado)",
+                    data=_dados_sob_demanda("parquet_cirurgias", filtros, df_rel, _parquet_bytes),
+                    file_name=f"cirurgias_por_status_{date.today().strftime('%Y%m%d')}.parquet",
+                    mime="application/vnd.apache.parquet",
+                    on_click="ignore",
+                    key="dl_parquet_cir",
+                )
 
-    st.divider()
 
+@st.fragment
+def _painel_rel_quitacoes(hosp_opts: list):
+    """Filtros + PDF/CSV/Excel de quitações (fragmento)."""
     # 2) Quitações — PDF / CSV / Excel
     st.markdown("**2) Quitações (PDF / Excel)**")
-    hosp_opts_q = ["Todos"] + get_hospitais()
     colq1, colq2 = st.columns(2)
     with colq1:
-        hosp_sel_q = st.selectbox("Hospital", hosp_opts_q, index=0, key="rel_q_hosp")
+        hosp_sel_q = st.selectbox("Hospital", hosp_opts, index=0, key="rel_q_hosp")
     with colq2:
         hoje = date.today()
         ini_default_q = hoje.replace(day=1)
@@ -2288,47 +3534,54 @@ with tabs[3]:
         dt_fim_q = st.date_input("Data final da quitação", value=hoje, key="rel_q_fim")
 
     # Base de quitações
-    df_quit = _rel_quitacoes_base_df()
-    if not df_quit.empty:
-        # Período da QUITAÇÃO
-        df_quit["_quit_dt"] = df_quit["quitacao_data"].apply(_pt_date_to_dt)
-        mask_q = (df_quit["_quit_dt"].notna()) & (df_quit["_quit_dt"] >= dt_ini_q) & (df_quit["_quit_dt"] <= dt_fim_q)
-        df_quit = df_quit[mask_q].copy()
-
-        # Filtro por hospital
-        if hosp_sel_q != "Todos":
-            df_quit = df_quit[df_quit["hospital"] == hosp_sel_q]
-
-        # Normalizações (sem ".0") e datas
-        for col in ["quitacao_guia_amhptiss", "quitacao_guia_complemento", "aviso"]:
-            if col in df_quit.columns:
-                df_quit[col] = df_quit[col].apply(_fmt_id_str)
-
-        def _fmt_dt_pt(s):
-            d = _pt_date_to_dt(s)
-            return d.strftime("%d/%m/%Y") if isinstance(d, (date, datetime)) and not pd.isna(d) else (str(s) or "")
-
-        df_quit["data_procedimento"] = df_quit["data_procedimento"].apply(_fmt_dt_pt)
-        df_quit["quitacao_data"] = df_quit["_quit_dt"].apply(lambda d: d.strftime("%d/%m/%Y") if pd.notna(d) else "")
-        df_quit = df_quit.drop(columns=["_quit_dt"]).fillna("")
-
-        # Garante colunas do PDF/Excel (mesmo layout do PDF)
-        cols_pdf = [
-            "hospital","atendimento","convenio","paciente","profissional","grau_participacao",
-            "data_procedimento",
-            "quitacao_guia_amhptiss","quitacao_guia_complemento",
-            "quitacao_valor_amhptiss","quitacao_valor_complemento",
-            "quitacao_data"
-        ]
-        for c in cols_pdf:
-            if c not in df_quit.columns:
-                df_quit[c] = ""
-
-        # Ordenação
-        df_quit = df_quit.sort_values(
-            by=["quitacao_data","hospital","convenio","paciente","profissional","data_procedimento"]
-        ).reset_index(drop=True)
-
+    with _fase("relatorios/fetch_quitacoes"):
+        df_quit = _rel_quitacoes_base_df()
+    with _fase("relatorios/filtro_quitacoes"):
+        if not df_quit.empty:
+            # Período da QUITAÇÃO
+            df_quit["_quit_dt"] = df_quit["quitacao_data"].apply(_pt_date_to_dt)
+            mask_q = (df_quit["_quit_dt"].notna()) & (df_quit["_quit_dt"] >= dt_ini_q) & (df_quit["_quit_dt"] <= dt_fim_q)
+            df_quit = df_quit[mask_q].copy()
+
+            # Filtro por hospital
+            if hosp_sel_q != "Todos":
+                df_quit = df_quit[df_quit["hospital"] == hosp_sel_q]
+
+            # Normalizações (sem ".0") e datas
+            for col in ["quitacao_guia_amhptiss", "quitacao_guia_complemento", "aviso"]:
+                if col in df_quit.columns:
+                    df_quit[col] = df_quit[col].apply(_fmt_id_str)
+
+            def _fmt_dt_pt(s):
+                d = _pt_date_to_dt(s)
+                return d.strftime("%d/%m/%Y") if isinstance(d, (date, datetime)) and not pd.isna(d) else (str(s) or "")
+
+            df_quit["data_procedimento"] = df_quit["data_procedimento"].apply(_fmt_dt_pt)
+            df_quit["quitacao_data"] = df_quit["_quit_dt"].apply(lambda d: d.strftime("%d/%m/%Y") if pd.notna(d) else "")
+            df_quit = df_quit.drop(columns=["_quit_dt"]).fillna("")
+
+            # Garante colunas do PDF/Excel (mesmo layout do PDF)
+            cols_pdf = [
+                "hospital","atendimento","convenio","paciente","profissional","grau_participacao",
+                "data_procedimento",
+                "quitacao_guia_amhptiss","quitacao_guia_complemento",
+                "quitacao_valor_amhptiss","quitacao_valor_complemento",
+                "quitacao_data"
+            ]
+            for c in cols_pdf:
+                if c not in df_quit.columns:
+                    df_quit[c] = ""
+
+            # Ordenação
+            df_quit = df_quit.sort_values(
+                by=["quitacao_data","hospital","convenio","paciente","profissional","data_procedimento"]
+            ).reset_index(drop=True)
+
+    filtros_q = {
+        "ini": dt_ini_q.strftime("%d/%m/%Y"),
+        "fim": dt_fim_q.strftime("%d/%m/%Y"),
+        "hospital": hosp_sel_q,
+    }
     colqb1, colqb2 = st.columns(2)
     with colqb1:
         if st.button("Gerar PDF (Quitações)", type="primary", key="btn_pdf_quit"):
@@ -2337,137 +3590,520 @@ with tabs[3]:
             elif not REPORTLAB_OK:
                 st.error("A biblioteca 'reportlab' não está instalada no ambiente.")
             else:
-                filtros_q = {
-                    "ini": dt_ini_q.strftime("%d/%m/%Y"),
-                    "fim": dt_fim_q.strftime("%d/%m/%Y"),
-                    "hospital": hosp_sel_q,
-                }
-                pdf_bytes_q = _pdf_quitacoes_colunas_fixas(df_quit, filtros_q)
                 ts_q = datetime.now().strftime("%Y%m%d_%H%M%S")
-                fname_q = f"relatorio_quitacoes_{ts_q}.pdf"
-                st.success(f"Relatório de Quitações gerado com {len(df_quit)} registro(s).")
-                st.download_button(
-                    label="⬇️ Baixar PDF (Quitações)",
-                    data=pdf_bytes_q,
-                    file_name=fname_q,
-                    mime="application/pdf",
-                    use_container_width=True
+                with _fase("relatorios/pdf_quitacoes_preparo"):
+                    args_q = _args_pdf_quitacoes(df_quit, filtros_q)
+                _gerar_pdf_em_segundo_plano(
+                    "rel_pdf_quit", "pdf_quitacoes", args_q,
+                    arquivo=f"relatorio_quitacoes_{ts_q}.pdf",
+                    msg=f"Relatório de Quitações gerado com {len(df_quit)} registro(s).",
                 )
+        _mostrar_relatorio("rel_pdf_quit", filtros_q, "⬇️ Baixar PDF (Quitações)", "dl_pdf_quit")
     with colqb2:
         if not df_quit.empty:
-            # CSV (base completa)
-            csv_quit = df_quit.to_csv(index=False).encode("utf-8-sig")
+            # CSV (base completa) e Excel (mesmo layout do PDF — sem Aviso/Situação):
+            # gerados só no clique e memoizados por filtros + dados
             st.download_button(
                 "⬇️ Baixar CSV (Quitações)",
-                data=csv_quit,
+                data=_dados_sob_demanda("csv_quitacoes", filtros_q, df_quit, _to_csv_bytes),
                 file_name=f"quitacoes_{date.today().strftime('%Y%m%d')}.csv",
                 mime="text/csv",
+                on_click="ignore",
+                key="dl_csv_quit",
             )
-
-            # Excel (mesmo layout do PDF — sem Aviso/Situação)
-            xlsx_bytes = _excel_quitacoes_colunas_fixas(df_quit)
             st.download_button(
                 "⬇️ Baixar Excel (layout do PDF)",
-                data=xlsx_bytes,
+                data=_dados_sob_demanda("xlsx_quitacoes", filtros_q, df_quit, _excel_quitacoes_colunas_fixas),
                 file_name=f"quitacoes_{date.today().strftime('%Y%m%d')}.xlsx",
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                on_click="ignore",
+                key="dl_xlsx_quit",
             )
+            if PYARROW_OK:
+                st.download_button(
+                    "⬇️ Baixar Parquet (tipado)",
+                    data=_dados_sob_demanda("parquet_quitacoes", filtros_q, df_quit, _parquet_bytes),
+                    file_name=f"quitacoes_{date.today().strftime('%Y%m%d')}.parquet",
+                    mime="application/vnd.apache.parquet",
+                    on_click="ignore",
+                    key="dl_parquet_quit",
+                )
+
+
+if secao == "📑 Relatórios":
+    tab_header_with_home("📑 Relatórios — Central", btn_key_suffix="relatorios")
+
+    hosp_opts = ["Todos"] + get_hospitais()
+    _painel_rel_cirurgias(hosp_opts)
+    st.divider()
+    _painel_rel_quitacoes(hosp_opts)
+
 
-            
 # ============================================================
 # 💼 4) QUITAÇÃO (edição em lote)
 # ============================================================
-with tabs[4]:
-    tab_header_with_home("💼 Quitação de Cirurgias", btn_key_suffix="quitacao")
+_TIPOS_QUITACAO = {
+    "quitacao_data": "data", "quitacao_guia_amhptiss": "codigo", "quitacao_valor_amhptiss": "valor",
+    "quitacao_guia_complemento": "codigo", "quitacao_valor_complemento": "valor", "quitacao_observacao": "texto",
+}
+
+def _preparar_quitacao(df: pd.DataFrame, buffer: dict = None) -> pd.DataFrame:
+    """Tipos do editor (datas, valores, guias sem '.0'), com as edições do buffer aplicadas por cima."""
+    df = df.copy()
+    if buffer:
+        # Colunas como object antes de aplicar o buffer: uma página só com inteiros
+        # vem como int64 e o pandas recusa gravar '150.5' ou '999' nela.
+        editaveis = [c for c in _TIPOS_QUITACAO if c in df.columns]
+        df[editaveis] = df[editaveis].astype(object)
+        for idx, pid in df["id"].items():
+            novo = buffer.get(int(pid))
+            if novo:
+                for col, v in novo["novo"].items():
+                    if col in _TIPOS_QUITACAO:
+                        df.at[idx, col] = v
+    df["quitacao_data"] = pd.to_datetime(df["quitacao_data"], dayfirst=True, errors="coerce")
+    for col in ["quitacao_valor_amhptiss", "quitacao_valor_complemento"]:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    for col in ["quitacao_guia_amhptiss", "quitacao_guia_complemento"]:
+        df[col] = df[col].apply(_fmt_id_str)
+    return df
+
+def _limpar_vista_quitacao():
+    st.session_state["quit_vista"] = None
+    st.session_state.pop("quit_cursores", None)
+    st.session_state["quit_pag"] = 0
+
+@st.fragment
+def _editor_quitacao():
+    """
+    Editor de quitações (fragmento), uma página por vez com filtros no servidor.
+    As edições ficam em session_state["quit_buffer"] (id -> valores novos e anteriores)
+    ao trocar de página ou filtro; "Gravar" manda tudo numa gravação em lote e faz
+    rerun completo para recarregar as pendências.
+    """
+    def _primeira_pagina():
+        st.session_state["quit_pag"] = 0
+
+    f1, f2, f3 = st.columns(3)
+    with f1:
+        hosp = st.selectbox("Hospital", ["Todos"] + get_hospitais(), key="quit_hosp", on_change=_primeira_pagina)
+    with f2:
+        conv = st.selectbox("Convênio", ["Todos"] + _listar_convenios_cache(), key="quit_conv", on_change=_primeira_pagina)
+    with f3:
+        usar_datas = st.checkbox("Filtrar por data do procedimento", key="quit_usar_datas", on_change=_primeira_pagina)
+    ini = fim = None
+    if usar_datas:
+        d1, d2, _ = st.columns(3)
+        with d1:
+            ini = st.date_input("Data inicial", value=date.today().replace(day=1), key="quit_ini", on_change=_primeira_pagina)
+        with d2:
+            fim = st.date_input("Data final", value=date.today(), key="quit_fim", on_change=_primeira_pagina)
+
+    filtros = {
+        "hospital": hosp, "convenio": conv,
+        "ini": ini.isoformat() if ini else None, "fim": fim.isoformat() if fim else None,
+    }
+    buffer = st.session_state.setdefault("quit_buffer", {})
 
-    st.markdown("<div class='soft-card'>", unsafe_allow_html=True)
-    hosp_opts = ["Todos"] + get_hospitais()
-    hosp_sel = st.selectbox("Hospital", hosp_opts, index=0, key="quit_hosp")
-    st.markdown("</div>", unsafe_allow_html=True)
+    st.markdown("Preencha os dados e clique em **Gravar quitação(ões)**. Ao gravar, o status muda para **Finalizado**.")
+    falhas = st.session_state.pop("quit_lote_falhas", None)
+    if falhas:
+        st.error(f"{len(falhas)} quitação(ões) não foram gravadas:")
+        st.dataframe(pd.DataFrame(falhas), use_container_width=True, hide_index=True)
 
-    # Carrega pendentes de envio
-    df_quit = _quitacao_pendentes_base_df()
+    try:
+        total = contar_quitacoes_pendentes(filtros)
+        if total == 0:
+            st.info("Não há cirurgias com status 'Enviado para pagamento' para quitação com esses filtros.")
+        else:
+            assinatura = tuple(sorted(filtros.items()))
+            pag, df_pg = paginar_por_chave("quit", total, assinatura,
+                                           lambda apos, tam: pagina_quitacoes_pendentes(filtros, apos, tam))
+            with _fase("quitacao/render_editor"):
+                # A página fica fixa enquanto o usuário está nela (o editor só é recriado ao
+                # trocar de página/filtro); ao voltar, mostra o que está no buffer.
+                ident = (assinatura, pag, tuple(int(x) for x in df_pg["id"]))
+                vista = st.session_state.get("quit_vista")
+                if not vista or vista["ident"] != ident:
+                    st.session_state["quit_vista_n"] = st.session_state.get("quit_vista_n", 0) + 1
+                    vista = {
+                        "ident": ident,
+                        "chave": f"editor_quit_{st.session_state['quit_vista_n']}",
+                        "antes": _preparar_quitacao(df_pg),
+                        "tela": _preparar_quitacao(df_pg, buffer),
+                    }
+                    st.session_state["quit_vista"] = vista
+
+                edited = st.data_editor(
+                    vista["tela"].drop(columns=["data_ordem"]), key=vista["chave"], use_container_width=True, hide_index=True,
+                    column_config={
+                        "id": st.column_config.Column("ID", disabled=True),
+                        "hospital": st.column_config.Column("Hospital", disabled=True),
+                        "atendimento": st.column_config.Column("Atendimento", disabled=True),
+                        "paciente": st.column_config.Column("Paciente", disabled=True),
+                        "convenio": st.column_config.Column("Convênio", disabled=True),
+                        "data_procedimento": st.column_config.Column("Data Procedimento", disabled=True),
+                        "profissional": st.column_config.Column("Profissional", disabled=True),
+                        "aviso": st.column_config.Column("Aviso", disabled=True),
+                        "situacao": st.column_config.Column("Situação", disabled=True),
+
+                        "quitacao_data": st.column_config.DateColumn("Data da quitação", format="DD/MM/YYYY"),
+                        "quitacao_guia_amhptiss": st.column_config.TextColumn("Guia AMHPTISS"),
+                        "quitacao_valor_amhptiss": st.column_config.NumberColumn("Valor Guia AMHPTISS", format="R$ %.2f"),
+                        "quitacao_guia_complemento": st.column_config.TextColumn("Guia Complemento"),
+                        "quitacao_valor_complemento": st.column_config.NumberColumn("Valor Guia Complemento", format="R$ %.2f"),
+                        "quitacao_observacao": st.column_config.TextColumn("Observações da quitação"),
+                    }
+                )
 
-    if hosp_sel != "Todos" and not df_quit.empty:
-        df_quit = df_quit[df_quit["hospital"] == hosp_sel]
+                # Buffer desta página = diferença entre o editor e o que veio do banco
+                # (desfazer uma edição tira a linha do buffer).
+                ids_pag = [int(x) for x in vista["antes"]["id"]]
+                for pid in ids_pag:
+                    buffer.pop(pid, None)
+                alterados = diff_editor(vista["antes"], edited, _TIPOS_QUITACAO, completo=True)
+                antes = linhas_normalizadas(vista["antes"], _TIPOS_QUITACAO, [p["id"] for p in alterados])
+                for p in alterados:
+                    buffer[int(p["id"])] = {"novo": p, "antes": antes.get(int(p["id"]), {})}
+    except APIError as e:
+        _sb_debug_error(e, "Falha ao carregar pendências de quitação.")
 
-    if df_quit.empty:
-        st.info("Não há cirurgias com status 'Enviado para pagamento' para quitação.")
-    else:
-        # normalizações de tipos
-        df_quit["quitacao_data"] = pd.to_datetime(df_quit["quitacao_data"], dayfirst=True, errors="coerce")
-        for col in ["quitacao_valor_amhptiss", "quitacao_valor_complemento"]:
-            df_quit[col] = pd.to_numeric(df_quit[col], errors="coerce")
-        
-        # >>> ADIÇÃO: normalizar guias para exibição (remove ".0")
-        for col in ["quitacao_guia_amhptiss", "quitacao_guia_complemento"]:
-            if col in df_quit.columns:
-                df_quit[col] = df_quit[col].apply(_fmt_id_str)
-
-        st.markdown("Preencha os dados e clique em **Gravar quitação(ões)**. Ao gravar, o status muda para **Finalizado**.")
-        edited = st.data_editor(
-            df_quit, key="editor_quit", use_container_width=True, hide_index=True,
-            column_config={
-                "id": st.column_config.Column("ID", disabled=True),
-                "hospital": st.column_config.Column("Hospital", disabled=True),
-                "atendimento": st.column_config.Column("Atendimento", disabled=True),
-                "paciente": st.column_config.Column("Paciente", disabled=True),
-                "convenio": st.column_config.Column("Convênio", disabled=True),
-                "data_procedimento": st.column_config.Column("Data Procedimento", disabled=True),
-                "profissional": st.column_config.Column("Profissional", disabled=True),
-                "aviso": st.column_config.Column("Aviso", disabled=True),
-                "situacao": st.column_config.Column("Situação", disabled=True),
-
-                "quitacao_data": st.column_config.DateColumn("Data da quitação", format="DD/MM/YYYY"),
-                "quitacao_guia_amhptiss": st.column_config.TextColumn("Guia AMHPTISS"),
-                "quitacao_valor_amhptiss": st.column_config.NumberColumn("Valor Guia AMHPTISS", format="R$ %.2f"),
-                "quitacao_guia_complemento": st.column_config.TextColumn("Guia Complemento"),
-                "quitacao_valor_complemento": st.column_config.NumberColumn("Valor Guia Complemento", format="R$ %.2f"),
-                "quitacao_observacao": st.column_config.TextColumn("Observações da quitação"),
+    def _descartar():
+        st.session_state["quit_buffer"] = {}
+        _limpar_vista_quitacao()
+
+    col_info, col_desc, col_quit = st.columns([4, 1, 1])
+    with col_info:
+        if buffer:
+            st.caption(f"✏️ {len(buffer)} linha(s) alterada(s) aguardando gravação (mantidas ao trocar de página ou filtro).")
+    with col_desc:
+        st.button("Descartar alterações", key="btn_quit_descartar", use_container_width=True,
+                  disabled=not buffer, on_click=_descartar)
+    with col_quit:
+        if st.button("💾 Gravar quitação(ões)", type="primary", disabled=not buffer):
+            pendentes = list(buffer.values())
+            faltando_data = sum(1 for b in pendentes if not b["novo"]["quitacao_data"])
+            prontos = [b for b in pendentes if b["novo"]["quitacao_data"]]
+            itens = [
+                {"id": b["novo"]["id"], **_payload_quitacao(
+                    b["novo"]["quitacao_data"], b["novo"]["quitacao_guia_amhptiss"], b["novo"]["quitacao_valor_amhptiss"],
+                    b["novo"]["quitacao_guia_complemento"], b["novo"]["quitacao_valor_complemento"],
+                    b["novo"]["quitacao_observacao"],
+                )}
+                for b in prontos
+            ]
+            anteriores = {
+                int(b["novo"]["id"]): {**b["antes"], "situacao": "Enviado para pagamento"}   # a tela só lista pendências neste status
+                for b in prontos
             }
-        )
 
-        col_quit = st.columns(6)[-1]
-        with col_quit:
-            if st.button("💾 Gravar quitação(ões)", type="primary"):
-                cols_chk = [
-                    "quitacao_data","quitacao_guia_amhptiss","quitacao_valor_amhptiss",
-                    "quitacao_guia_complemento","quitacao_valor_complemento","quitacao_observacao",
-                ]
-                compare = df_quit[["id"] + cols_chk].merge(edited[["id"] + cols_chk], on="id", suffixes=("_old", "_new"))
-                atualizados = faltando_data = 0
-                for _, row in compare.iterrows():
-                    changed = any((str(row[c + "_old"] or "") != str(row[c + "_new"] or "")) for c in cols_chk)
-                    if not changed: continue
-                    data_q = _to_ddmmyyyy(row["quitacao_data_new"])
-                    if not data_q:
-                        faltando_data += 1; continue
-                    guia_amhp = row["quitacao_guia_amhptiss_new"] or None
-                    v_amhp = _to_float_or_none(row["quitacao_valor_amhptiss_new"])
-                    guia_comp = row["quitacao_guia_complemento_new"] or None
-                    v_comp = _to_float_or_none(row["quitacao_valor_complemento_new"])
-                    obs_q = (row["quitacao_observacao_new"] or None)
-
-                    quitar_procedimento(
-                        proc_id=int(row["id"]),
-                        data_quitacao=data_q, guia_amhptiss=guia_amhp, valor_amhptiss=v_amhp,
-                        guia_complemento=guia_comp, valor_complemento=v_comp, quitacao_observacao=obs_q
-                    )
-                    atualizados += 1
-
-                if faltando_data > 0 and atualizados == 0:
-                    st.warning("Nenhuma quitação gravada. Preencha a **Data da quitação** para finalizar.")
-                elif faltando_data > 0 and atualizados > 0:
-                    st.toast(f"{atualizados} quitação(ões) gravada(s). {faltando_data} linha(s) ignoradas sem **Data da quitação**.", icon="✅")
-                    st.rerun()
-                else:
-                    st.toast(f"{atualizados} quitação(ões) gravada(s).", icon="✅")
-                    st.rerun()
+            res_lote = quitar_procedimentos_em_lote(itens, anteriores)
+            atualizados = len(res_lote["ok"])
+            for pid in res_lote["ok"]:
+                buffer.pop(int(pid), None)
+            _limpar_vista_quitacao()
+            if res_lote["falhas"]:
+                st.session_state["quit_lote_falhas"] = res_lote["falhas"]
+                if atualizados == 0:
+                    st.rerun()  # nada gravado: mostra as falhas no editor
+
+            if faltando_data > 0 and atualizados == 0:
+                st.warning("Nenhuma quitação gravada. Preencha a **Data da quitação** para finalizar.")
+            elif faltando_data > 0 and atualizados > 0:
+                st.toast(f"{atualizados} quitação(ões) gravada(s). {faltando_data} linha(s) ignoradas sem **Data da quitação**.", icon="✅")
+                st.rerun()
+            else:
+                st.toast(f"{atualizados} quitação(ões) gravada(s).", icon="✅")
+                st.rerun()
+
+
+if secao == "💼 Quitação":
+    tab_header_with_home("💼 Quitação de Cirurgias", btn_key_suffix="quitacao")
+    _editor_quitacao()
 
 # ============================================================
 # ⚙️ 5) SISTEMA — Diagnósticos simples
 # ============================================================
-with tabs[5]:
+@st.cache_data(ttl=TTL_MED, show_spinner=False)
+def resumo_por_profissional(hospital: str = "Todos") -> pd.DataFrame:
+    """
+    Procedimentos por profissional (colunas profissional, total), opcionalmente de um hospital.
+      - USE_DB_RPC: GROUP BY no banco (função resumo_por_profissional) — volta 1 linha por profissional.
+      - Fallback: baixa procedimentos + internações e agrupa aqui.
+    Levanta APIError.
+    """
+    p_hosp = None if hospital == "Todos" else hospital
+    if USE_DB_RPC:
+        res = supabase.rpc("resumo_por_profissional", {"p_hospital": p_hosp}).execute()
+        return pd.DataFrame(res.data or [], columns=["profissional", "total"])
+
+    resp = supabase.table("procedimentos").select("internacao_id, profissional").not_.is_("profissional", None).execute()
+    dfp = pd.DataFrame(resp.data or [])
+    if dfp.empty:
+        return pd.DataFrame(columns=["profissional", "total"])
+    ids = sorted(set(int(x) for x in dfp["internacao_id"].dropna().tolist()))
+    resi = supabase.table("internacoes").select("id, hospital").in_("id", ids).execute() if ids else None
+    dfi = pd.DataFrame(resi.data or []) if resi else pd.DataFrame()
+    dfm = safe_merge(dfp, dfi, left_on="internacao_id", right_on="id", how="left")
+    if p_hosp is not None:
+        dfm = dfm[dfm["hospital"] == p_hosp]
+    return (dfm.groupby("profissional")["profissional"].count().reset_index(name="total")
+            .sort_values("total", ascending=False))
+
+@st.cache_data(ttl=TTL_MED, show_spinner=False)
+def resumo_por_convenio(hospital: str = "Todos") -> pd.DataFrame:
+    """
+    Procedimentos por convênio da internação (colunas convenio, total), ignorando convênio vazio.
+      - USE_DB_RPC: GROUP BY no banco (função resumo_por_convenio).
+      - Fallback: baixa as duas tabelas e agrupa aqui.
+    Levanta APIError.
+    """
+    p_hosp = None if hospital == "Todos" else hospital
+    if USE_DB_RPC:
+        res = supabase.rpc("resumo_por_convenio", {"p_hospital": p_hosp}).execute()
+        return pd.DataFrame(res.data or [], columns=["convenio", "total"])
+
+    vazio = pd.DataFrame(columns=["convenio", "total"])
+    resi = supabase.table("internacoes").select("id, convenio, hospital").execute()
+    dfi = pd.DataFrame(resi.data or [])
+    if dfi.empty:
+        return vazio
+    if p_hosp is not None:
+        dfi = dfi[dfi["hospital"] == p_hosp]
+    resp = supabase.table("procedimentos").select("internacao_id").execute()
+    dfp = pd.DataFrame(resp.data or [])
+    if dfp.empty:
+        return vazio
+    dfp = dfp[dfp["internacao_id"].notna()]
+    ids = set(int(x) for x in dfp["internacao_id"].tolist())
+    if not ids:
+        return vazio
+    dfm = safe_merge(dfp, dfi[dfi["id"].isin(ids)], left_on="internacao_id", right_on="id", how="left")
+    return (dfm[dfm["convenio"].notna() & (dfm["convenio"].astype(str).str.strip() != "")]
+            .groupby("convenio")["convenio"].count().reset_index(name="total")
+            .sort_values("total", ascending=False))
+
+# ---- Lista de procedimentos (filtros + paginação por chave) ----
+_COLS_LISTA_PROC = [
+    "id", "internacao_id", "data_procedimento", "aviso", "profissional", "grau_participacao",
+    "procedimento", "situacao", "observacao", "hospital", "atendimento", "paciente", "data_ordem",
+]
+
+@st.cache_data(ttl=TTL_MED, show_spinner=False)
+def _procedimentos_lista_local() -> pd.DataFrame:
+    """Fallback sem USE_DB_RPC: procedimentos + internação, com data_ordem como na view."""
+    resp = supabase.table("procedimentos").select(
+        "id, internacao_id, data_procedimento, aviso, profissional, grau_participacao, procedimento, situacao, observacao"
+    ).execute()
+    dfp = pd.DataFrame(resp.data or [])
+    if dfp.empty:
+        return pd.DataFrame(columns=_COLS_LISTA_PROC)
+    ids = sorted(set(int(x) for x in dfp["internacao_id"].dropna().tolist()))
+    resi = supabase.table("internacoes").select("id, hospital, atendimento, paciente").in_("id", ids).execute() if ids else None
+    dfi = pd.DataFrame(resi.data or []) if resi else pd.DataFrame(columns=["id", "hospital", "atendimento", "paciente"])
+    df = safe_merge(dfp, dfi, left_on="internacao_id", right_on="id", how="left", suffixes=("", "_i"))
+    df["data_ordem"] = _data_ordem(df["data_procedimento"])
+    return df.reindex(columns=_COLS_LISTA_PROC)
+
+@st.cache_data(ttl=TTL_SHORT, show_spinner=False)
+def contar_procedimentos_lista(filtros: dict) -> int:
+    """
+    Total de procedimentos com os filtros (hospital, situacao, profissional, ini/fim ISO).
+      - USE_DB_RPC: count=exact na vw_procedimentos_lista (só o número volta).
+      - Fallback: conta na base local.
+    Levanta APIError.
+    """
+    if USE_DB_RPC:
+        res = _consulta_filtrada("vw_procedimentos_lista", "id", filtros, count="exact").limit(1).execute()
+        return int(res.count or 0)
+    return len(_filtrar_local(_procedimentos_lista_local(), filtros))
+
+@st.cache_data(ttl=TTL_SHORT, show_spinner=False)
+def pagina_procedimentos(filtros: dict, apos: tuple = None, limite: int = 50, desc: bool = True) -> pd.DataFrame:
+    """
+    Uma página da lista, ordenada por (data_ordem, id). Paginação por chave:
+    `apos` = (data_ordem, id) da última linha da página anterior (None = 1ª página).
+      - USE_DB_RPC: filtros, ordem e limite no banco (vw_procedimentos_lista).
+      - Fallback: mesma semântica sobre a base local.
+    Levanta APIError.
+    """
+    if USE_DB_RPC:
+        q = _consulta_filtrada("vw_procedimentos_lista", ", ".join(_COLS_LISTA_PROC), filtros)
+        res = _apos_chave(q, apos, desc).limit(limite).execute()
+        return pd.DataFrame(res.data or [], columns=_COLS_LISTA_PROC)
+
+    return _pagina_local(_filtrar_local(_procedimentos_lista_local(), filtros), apos, limite, desc)
+
+@st.fragment
+def _navegador_procedimentos():
+    """Lista de procedimentos: uma página por vez; paginar/filtrar reroda só este trecho."""
+    def _primeira_pagina():
+        st.session_state["sys_proc_pag"] = 0
+
+    f1, f2, f3, f4 = st.columns(4)
+    with f1:
+        hosp = st.selectbox("Hospital", ["Todos"] + get_hospitais(), key="sys_proc_hosp", on_change=_primeira_pagina)
+    with f2:
+        situacao = st.selectbox("Situação", ["Todos"] + STATUS_OPCOES, key="sys_proc_status", on_change=_primeira_pagina)
+    with f3:
+        prof = st.selectbox("Profissional", ["Todos"] + _listar_profissionais_cache(), key="sys_proc_prof",
+                            on_change=_primeira_pagina)
+    with f4:
+        ordem = st.selectbox("Ordem", ["Data (recentes)", "Data (antigas)"], key="sys_proc_ordem",
+                             on_change=_primeira_pagina)
+
+    d1, d2, d3 = st.columns(3)
+    with d1:
+        usar_datas = st.checkbox("Filtrar por data do procedimento", key="sys_proc_usar_datas", on_change=_primeira_pagina)
+    ini = fim = None
+    if usar_datas:
+        with d2:
+            ini = st.date_input("Data inicial", value=date.today().replace(day=1), key="sys_proc_ini", on_change=_primeira_pagina)
+        with d3:
+            fim = st.date_input("Data final", value=date.today(), key="sys_proc_fim", on_change=_primeira_pagina)
+
+    filtros = {
+        "hospital": hosp, "situacao": situacao, "profissional": prof,
+        "ini": ini.isoformat() if ini else None, "fim": fim.isoformat() if fim else None,
+    }
+    desc = ordem == "Data (recentes)"
+
+    try:
+        total = contar_procedimentos_lista(filtros)
+    except APIError as e:
+        _sb_debug_error(e, "Falha ao contar procedimentos.")
+        return
+    if total == 0:
+        st.info("Nenhum procedimento com esses filtros.")
+        return
+
+    try:
+        _, df = paginar_por_chave("sys_proc", total, (tuple(sorted(filtros.items())), desc),
+                                  lambda apos, tam: pagina_procedimentos(filtros, apos, tam, desc))
+    except APIError as e:
+        _sb_debug_error(e, "Falha ao carregar procedimentos.")
+        return
+
+    st.dataframe(df.drop(columns=["data_ordem"]), use_container_width=True, hide_index=True)
+
+def _painel_desempenho():
+    """Painel 'Desempenho': consultas ao Supabase desta sessão (+ threads em background)."""
+    st.markdown("**⏱️ Desempenho — consultas ao Supabase**")
+    itens = _registro_da_sessao().itens() + _registros_background().itens(_origens_da_sessao())
+    if not itens:
+        st.info("Nenhuma consulta registrada ainda nesta sessão.")
+        return
+
+    df = pd.DataFrame(itens)
+    df["kb"] = (df["bytes"] / 1024).round(1)
+    n_reruns = int(df["rerun"].dropna().nunique())
+    kpi_row([
+        {"label": "Chamadas", "value": f"{len(df):,}".replace(",", ".")},
+        {"label": "Tempo total", "value": f"{df['ms'].sum() / 1000:.2f} s"},
+        {"label": "Linhas", "value": f"{int(df['linhas'].sum()):,}".replace(",", ".")},
+        {"label": "Transferido", "value": f"{df['bytes'].sum() / 1024 / 1024:.2f} MB"},
+        {"label": "Chamadas/rerun", "value": f"{len(df) / max(n_reruns, 1):.1f}", "hint": f"{n_reruns} rerun(s)"},
+    ])
+
+    cols_show = ["rerun", "secao", "tabela", "operacao", "filtros", "linhas", "kb", "ms", "erro"]
+    st.caption("Mais lentas")
+    st.dataframe(df.sort_values("ms", ascending=False).head(20)[cols_show], use_container_width=True, hide_index=True)
+
+    colr1, colr2 = st.columns(2)
+    with colr1:
+        st.caption("Por rerun (mais recentes)")
+        por_rerun = (
+            df.dropna(subset=["rerun"])
+              .groupby(["rerun", "secao"], as_index=False)
+              .agg(chamadas=("ms", "size"), ms=("ms", "sum"), linhas=("linhas", "sum"), kb=("kb", "sum"))
+              .sort_values("rerun", ascending=False)
+              .head(30)
+        )
+        st.dataframe(por_rerun, use_container_width=True, hide_index=True)
+    with colr2:
+        st.caption("Por seção / tabela / operação")
+        por_alvo = (
+            df.groupby(["secao", "tabela", "operacao"], as_index=False)
+              .agg(chamadas=("ms", "size"), ms_total=("ms", "sum"), ms_medio=("ms", "mean"),
+                   linhas=("linhas", "sum"), kb=("kb", "sum"))
+              .sort_values("ms_total", ascending=False)
+        )
+        por_alvo["ms_medio"] = por_alvo["ms_medio"].round(1)
+        st.dataframe(por_alvo, use_container_width=True, hide_index=True)
+
+    cold1, cold2 = st.columns([2, 1])
+    with cold1:
+        jsonl = b"".join([_registro_da_sessao().to_jsonl(), _registros_background().to_jsonl(_origens_da_sessao())])
+        st.download_button(
+            "⬇️ Exportar consultas (JSON Lines)",
+            data=jsonl,
+            file_name=f"consultas_supabase_{_now_ts()}.jsonl",
+            mime="application/x-ndjson",
+            key="dl_perf_jsonl",
+        )
+    with cold2:
+        if st.button("Limpar registros", key="btn_perf_limpar"):
+            _registro_da_sessao().limpar()
+            _registros_background().limpar(_origens_da_sessao())
+            st.session_state.pop("__perf_fases", None)
+            st.rerun()
+
+    _painel_profiling()
+
+
+def _toggle_cprofile():
+    st.session_state["__perf_cprofile"] = not st.session_state.get("__perf_cprofile", False)
+
+def _painel_profiling():
+    """Fases nomeadas por rerun + cProfile do rerun inteiro (só com PROFILING ligado)."""
+    st.markdown("**🧪 Profiling por fase**")
+    if not PROFILING:
+        if PROFILING_PERMITIR_URL:
+            st.caption("Desligado. Ative com o secret `PROFILING = true` ou abrindo o app com `?perf=1` na URL.")
+        else:
+            st.caption("Desligado. Ative com o secret `PROFILING = true` (ou libere `?perf=1` com `PROFILING_PERMITIR_URL = true`).")
+        return
+
+    fases = list(st.session_state.get("__perf_fases") or [])
+    if fases:
+        df_f = pd.DataFrame(fases)
+        ultimo = df_f["rerun"].max()
+        colp1, colp2 = st.columns(2)
+        with colp1:
+            st.caption(f"Rerun {ultimo} (atual) — fases já concluídas")
+            st.dataframe(df_f[df_f["rerun"] == ultimo][["fase", "ms"]], use_container_width=True, hide_index=True)
+        with colp2:
+            st.caption("Acumulado da sessão por fase")
+            agg = (
+                df_f.groupby("fase", as_index=False)
+                    .agg(vezes=("ms", "size"), ms_medio=("ms", "mean"), ms_max=("ms", "max"), ms_total=("ms", "sum"))
+                    .sort_values("ms_total", ascending=False)
+            )
+            agg["ms_medio"] = agg["ms_medio"].round(1)
+            st.dataframe(agg, use_container_width=True, hide_index=True)
+    else:
+        st.info("Nenhuma fase registrada ainda.")
+
+    ligado = bool(st.session_state.get("__perf_cprofile"))
+    st.button(
+        "⏹️ Parar cProfile" if ligado else "⏺️ Capturar cProfile dos próximos reruns",
+        key="btn_perf_cprofile", on_click=_toggle_cprofile,
+        help="Perfila o script inteiro a cada rerun (em qualquer seção) até ser desligado.",
+    )
+    perfil = st.session_state.get("__perf_ultimo_perfil") or {}
+    if perfil.get("top"):
+        st.caption(f"Último rerun perfilado: {perfil['ms']:.0f} ms — funções por tempo acumulado")
+        st.dataframe(pd.DataFrame(perfil["top"]), use_container_width=True, hide_index=True)
+        st.download_button(
+            "⬇️ Baixar perfil (.prof — pstats/snakeviz)",
+            data=perfil["prof"],
+            file_name=f"rerun_{_now_ts()}.prof",
+            mime="application/octet-stream",
+            key="dl_perf_prof",
+        )
+
+
+if secao == "⚙️ Sistema":
     tab_header_with_home("⚙️ Sistema", btn_key_suffix="sistema")
     st.markdown("<div class='soft-card'>", unsafe_allow_html=True)
     
@@ -2508,7 +4144,8 @@ with tabs[5]:
         st.markdown("**☁️ Backups no Storage**")
         
         # Se quiser subpastas, mude prefix="" para algo como "daily/" ou "2026/01/"
-        files = list_backups_from_storage(prefix="")
+        with _fase("sistema/storage_list"):
+            files = list_backups_from_storage(prefix="")
         
         if not files:
             st.info("Nenhum backup no Storage (ou bucket vazio).")
@@ -2576,106 +4213,41 @@ with tabs[5]:
     st.markdown("</div>", unsafe_allow_html=True)
 
     st.markdown("**📋 Procedimentos — Lista**")
-    filtro = ["Todos"] + get_hospitais()
-    chosen = st.selectbox("Hospital (lista de procedimentos):", filtro, key="sys_proc_hosp")
-
-    if st.button("Carregar procedimentos", key="btn_carregar_proc", type="primary"):
-        try:
-            resp = supabase.table("procedimentos").select(
-                "id, internacao_id, data_procedimento, aviso, profissional, grau_participacao, procedimento, situacao, observacao"
-            ).execute()
-            dfp = pd.DataFrame(resp.data or [])
-            if dfp.empty:
-                st.info("Sem procedimentos.")
-            else:
-                ids = sorted(set(int(x) for x in dfp["internacao_id"].dropna().tolist()))
-                resi = supabase.table("internacoes").select("id, hospital, atendimento, paciente").in_("id", ids).execute() if ids else None
-                dfi = pd.DataFrame(resi.data or []) if resi else pd.DataFrame()
-                df = safe_merge(dfp, dfi, left_on="internacao_id", right_on="id", how="left", suffixes=("", "_i"))
-                if chosen != "Todos":
-                    df = df[df["hospital"] == chosen]
-                df = df.sort_values(by=["data_procedimento","id"], ascending=[False, False])
-                st.dataframe(df, use_container_width=True, hide_index=True)
-        except APIError as e:
-            _sb_debug_error(e, "Falha ao carregar procedimentos.")
+    with _fase("sistema/lista_procedimentos"):
+        _navegador_procedimentos()
 
     st.divider()
     st.markdown("**🧾 Resumo por Profissional**")
     filtro_prof = ["Todos"] + get_hospitais()
     chosen_prof = st.selectbox("Hospital (resumo por profissional):", filtro_prof, key="sys_prof_hosp")
-    try:
-        resp = supabase.table("procedimentos").select("internacao_id, profissional").not_.is_("profissional", None).execute()
-        dfp = pd.DataFrame(resp.data or [])
-        if dfp.empty:
-            st.info("Sem dados.")
-        else:
-            ids = sorted(set(int(x) for x in dfp["internacao_id"].dropna().tolist()))
-            resi = supabase.table("internacoes").select("id, hospital").in_("id", ids).execute() if ids else None
-            dfi = pd.DataFrame(resi.data or []) if resi else pd.DataFrame()
-            dfm = safe_merge(dfp, dfi, left_on="internacao_id", right_on="id", how="left")
-            if chosen_prof != "Todos":
-                dfm = dfm[dfm["hospital"] == chosen_prof]
-            df_prof = dfm.groupby("profissional")["profissional"].count().reset_index(name="total").sort_values("total", ascending=False)
-            st.dataframe(df_prof, use_container_width=True, hide_index=True)
-    except APIError as e:
-        _sb_debug_error(e, "Falha no resumo por profissional.")
+    with _fase("sistema/resumo_profissional"):
+        try:
+            df_prof = resumo_por_profissional(chosen_prof)
+            if df_prof.empty:
+                st.info("Sem dados.")
+            else:
+                st.dataframe(df_prof, use_container_width=True, hide_index=True)
+        except APIError as e:
+            _sb_debug_error(e, "Falha no resumo por profissional.")
 
     st.divider()
     st.markdown("**💸 Resumo por Convênio**")
     filtro_conv = ["Todos"] + get_hospitais()
     chosen_conv = st.selectbox("Hospital (resumo por convênio):", filtro_conv, key="sys_conv_hosp")
 
-    try:
-        # Internações (lado direito do merge), traz convenio e hospital
-        resi = supabase.table("internacoes").select("id, convenio, hospital").execute()
-        dfi = pd.DataFrame(resi.data or [])
-
-        if dfi.empty:
-            st.info("Sem dados de internações.")
-        else:
-            if chosen_conv != "Todos":
-                dfi = dfi[dfi["hospital"] == chosen_conv]
-
-            # Procedimentos (lado esquerdo do merge), traz internacao_id
-            resp = supabase.table("procedimentos").select("internacao_id").execute()
-            dfp = pd.DataFrame(resp.data or [])
-
-            if dfp.empty:
-                st.info("Sem procedimentos.")
+    with _fase("sistema/resumo_convenio"):
+        try:
+            df_conv = resumo_por_convenio(chosen_conv)
+            if df_conv.empty:
+                st.info("Sem dados para o resumo por convênio.")
             else:
-                # Garante internacao_id válidos
-                dfp = dfp[dfp["internacao_id"].notna()]
-                ids = sorted(set(int(x) for x in dfp["internacao_id"].tolist() if pd.notna(x)))
-
-                if not ids:
-                    st.info("Sem vínculos de procedimentos com internações.")
-                else:
-                    # Reduz o universo de internações para as usadas
-                    dfi_ids = dfi[dfi["id"].isin(ids)].copy()
-
-                    # Merge seguro
-                    dfm = safe_merge(dfp, dfi_ids, left_on="internacao_id", right_on="id", how="left")
-
-                    # Agrega por convênio (ignora nulos/vazios)
-                    df_conv = (
-                        dfm[dfm["convenio"].notna() & (dfm["convenio"].astype(str).str.strip() != "")]
-                        .groupby("convenio")["convenio"]
-                        .count()
-                        .reset_index(name="total")
-                        .sort_values("total", ascending=False)
-                    )
-
-                    if df_conv.empty:
-                        st.info("Sem dados para o resumo por convênio.")
-                    else:
-                        st.dataframe(df_conv, use_container_width=True, hide_index=True)
-
-    except APIError as e:
-        _sb_debug_error(e, "Falha no resumo por convênio.")
+                st.dataframe(df_conv, use_container_width=True, hide_index=True)
+        except APIError as e:
+            _sb_debug_error(e, "Falha no resumo por convênio.")
 
+    st.divider()
+    _painel_desempenho()
 
 
-# ---- Troca de aba programática ----
-if st.session_state.get("goto_tab_label"):
-    _switch_to_tab_by_label(st.session_state["goto_tab_label"])
-    st.session_state["goto_tab_label"] = None
+# ---- Fim do rerun (profiling opt-in) ----
+_finalizar_perfil_rerun(secao, _T0_RERUN)
@@ -0,0 +1,129 @@
+# bench_relatorios.py
+# --------------------------------------------
+# Benchmark do motor de PDF (relatorios.py) com dados sintéticos.
+#
+# Uso:
+#   python bench_relatorios.py                        # 1k, 10k, 50k, 100k linhas
+#   python bench_relatorios.py --linhas 1000 5000 --legado
+#   python bench_relatorios.py --bloco 60 --memoria --json bench.json
+#
+# Para cada tamanho mede o tempo de parede dos dois relatórios e, com
+# --memoria, o pico de memória (tracemalloc deixa tudo bem mais lento).
+# `--legado` mede também o formato antigo (uma Table única com Paragraph
+# em todas as células), limitado a --max-legado linhas.
+# --------------------------------------------
+
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+import pandas as pd
+
+import relatorios
+
+HOSPITAIS = ["Santa Lúcia Sul", "Santa Lúcia Norte", "Maria Auxiliadora"]
+CONVENIOS = ["AMIL", "BRADESCO SAÚDE", "CASSI", "GEAP", "SULAMÉRICA", "UNIMED"]
+PROFISSIONAIS = ["Dr. Ana Souza", "Dr. Bruno Lima", "Dra. Carla Mendes", "Dr. Diego Alves"]
+SITUACOES = ["Pendente", "Não Cobrar", "Enviado para pagamento", "Aguardando Digitação - AMHP", "Finalizado"]
+
+
+def dados_sinteticos(n: int, semente: int = 42) -> pd.DataFrame:
+    rnd = random.Random(semente)
+    nomes = ["MARIA", "JOSÉ", "ANTÔNIO", "FRANCISCA", "CARLOS", "PAULO", "LUCAS", "JULIANA"]
+    sobrenomes = ["SILVA", "SANTOS", "OLIVEIRA", "SOUZA", "RODRIGUES", "FERREIRA", "ALVES", "PEREIRA"]
+    linhas = []
+    for i in range(n):
+        dia = f"{rnd.randint(1, 28):02d}/{rnd.randint(1, 12):02d}/2025"
+        linhas.append({
+            "atendimento": str(1000000 + i),
+            "aviso": str(rnd.randint(100000, 999999)),
+            "convenio": rnd.choice(CONVENIOS),
+            "paciente": " ".join(rnd.sample(nomes, 2) + rnd.sample(sobrenomes, 2)),
+            "data_procedimento": dia,
+            "procedimento": "Cirurgia / Procedimento",
+            "profissional": rnd.choice(PROFISSIONAIS),
+            "grau_participacao": rnd.choice(["Cirurgião", "Auxiliar", "Anestesista"]),
+            "hospital": rnd.choice(HOSPITAIS),
+            "situacao": rnd.choice(SITUACOES),
+            "quitacao_data": dia,
+            "quitacao_guia_amhptiss": str(rnd.randint(10**8, 10**9)),
+            "quitacao_valor_amhptiss": f"R$ {rnd.randint(100, 9000)},00",
+            "quitacao_guia_complemento": "",
+            "quitacao_valor_complemento": "R$ 0,00",
+        })
+    return pd.DataFrame(linhas)
+
+
+def _pdf_legado(df: pd.DataFrame, layout: relatorios.LayoutTabela) -> bytes:
+    """Formato anterior: uma Table com todas as linhas e Paragraph em toda célula, em BytesIO."""
+    import io
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.lib.units import cm
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Table
+
+    est = relatorios._estilos(layout)
+    buf = io.BytesIO()
+    doc = SimpleDocTemplate(buf, pagesize=landscape(A4), leftMargin=18, rightMargin=18, topMargin=18, bottomMargin=18)
+    header = [Paragraph(c.titulo, est["TH"]) for c in layout.colunas]
+    rows = [[Paragraph(str(r[c.campo]), est["TD"][c.alinhamento]) for c in layout.colunas] for _, r in df.iterrows()]
+    t = Table([header] + rows, repeatRows=1, colWidths=[c.largura_cm * cm for c in layout.colunas])
+    t.setStyle(relatorios._estilo_tabela(layout))
+    doc.build([t])
+    return buf.getvalue()
+
+
+def medir(funcao, memoria: bool = False) -> dict:
+    if memoria:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    pdf = funcao()
+    seg = time.perf_counter() - t0
+    pico = None
+    if memoria:
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {"s": round(seg, 2), "pico_mb": round(pico / 2**20, 1) if pico is not None else None,
+            "pdf_kb": round(len(pdf) / 1024)}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark dos PDFs de relatórios (dados sintéticos).")
+    ap.add_argument("--linhas", type=int, nargs="+", default=[1000, 10000, 50000, 100000])
+    ap.add_argument("--bloco", type=int, default=relatorios.LINHAS_POR_BLOCO, help="linhas por Table")
+    ap.add_argument("--legado", action="store_true", help="mede também o formato de Table única")
+    ap.add_argument("--max-legado", type=int, default=10000, help="não roda o legado acima disso")
+    ap.add_argument("--memoria", action="store_true", help="mede o pico de memória (tracemalloc)")
+    ap.add_argument("--json", dest="json_path", help="grava os resultados em JSON")
+    args = ap.parse_args(argv)
+
+    relatorios.LINHAS_POR_BLOCO = args.bloco
+    filtros = {"ini": "01/01/2025", "fim": "31/12/2025", "hospital": "Todos", "status": "Todos"}
+    totais = [["Total Geral:", "R$ 0,00"]]
+    resultados = []
+
+    print(f"{'relatório':<12} {'linhas':>8} {'motor':<8} {'tempo (s)':>10} {'pico (MB)':>10} {'PDF (KB)':>9}")
+    for n in args.linhas:
+        df = dados_sinteticos(n)
+        casos = [
+            ("cirurgias", "blocos", lambda: relatorios.pdf_cirurgias_por_status(df, filtros)),
+            ("quitacoes", "blocos", lambda: relatorios.pdf_quitacoes_colunas_fixas(df, filtros, totais)),
+        ]
+        if args.legado and n <= args.max_legado:
+            casos += [
+                ("cirurgias", "legado", lambda: _pdf_legado(df, relatorios.LAYOUT_CIRURGIAS)),
+                ("quitacoes", "legado", lambda: _pdf_legado(df, relatorios.LAYOUT_QUITACOES)),
+            ]
+        for nome, motor, funcao in casos:
+            r = {"relatorio": nome, "linhas": n, "motor": motor, **medir(funcao, args.memoria)}
+            resultados.append(r)
+            print(f"{nome:<12} {n:>8} {motor:<8} {r['s']:>10.2f} {r['pico_mb'] if r['pico_mb'] is not None else '-':>10} {r['pdf_kb']:>9}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
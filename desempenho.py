@@ -0,0 +1,370 @@
+# desempenho.py
+# --------------------------------------------
+# Instrumentação das chamadas ao Supabase (PostgREST).
+#
+# - ClienteInstrumentado envolve o client do supabase-py: toda cadeia
+#   supabase.table(...)....execute() e supabase.rpc(...).execute() passa
+#   por aqui e gera um registro com tabela, operação, filtros, linhas,
+#   bytes (JSON da resposta) e tempo de parede. As chamadas de Storage
+#   (client.storage.from_(bucket).upload/list/download...) também.
+# - O destino dos registros é uma função `registrar(dict)` injetada pelo
+#   app (ele acrescenta rerun/seção e decide onde guardar).
+# - RegistrosPorOrigem guarda as chamadas feitas fora de um rerun (threads
+#   de tarefas) separadas pela origem, para cada sessão ver só as suas.
+# - CronometroFases mede fases nomeadas (fetch, filtro, merge, render...)
+#   e PerfilExecucao captura um cProfile de um rerun inteiro (opt-in).
+# - Sem dependência de Streamlit: pode ser usado em threads/processos.
+# --------------------------------------------
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager, nullcontext
+
+# Métodos do builder que definem a operação (o resto é filtro/modificador)
+_OPERACOES = ("select", "insert", "update", "upsert", "delete")
+
+
+def _fmt_arg(v, limite: int = 60) -> str:
+    """Representação curta de um argumento de filtro (listas grandes viram contagem)."""
+    if isinstance(v, (list, tuple, set)):
+        if len(v) > 5:
+            return f"[{len(v)} valores]"
+        v = list(v)
+    s = str(v)
+    return s if len(s) <= limite else s[: limite - 1] + "…"
+
+
+def _bytes_json(data) -> int:
+    """Tamanho aproximado do payload (JSON compacto do que o PostgREST devolveu)."""
+    if data is None:
+        return 0
+    try:
+        return len(json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8"))
+    except Exception:
+        return 0
+
+
+class _ConsultaInstrumentada:
+    """Proxy de um request builder do postgrest-py que anota a cadeia de chamadas."""
+
+    def __init__(self, builder, alvo: str, registrar, operacao: str = "select", filtros=None):
+        self._builder = builder
+        self._alvo = alvo
+        self._registrar = registrar
+        self._operacao = operacao
+        self._filtros = list(filtros or [])
+
+    def _wrap(self, resultado, nome: str, args=(), kwargs=None):
+        operacao = nome if nome in _OPERACOES else self._operacao
+        filtros = self._filtros
+        if nome not in _OPERACOES:
+            partes = [_fmt_arg(a) for a in args] + [f"{k}={_fmt_arg(v)}" for k, v in (kwargs or {}).items()]
+            filtros = filtros + [f"{nome}({', '.join(partes)})"]
+        return _ConsultaInstrumentada(resultado, self._alvo, self._registrar, operacao, filtros)
+
+    def __getattr__(self, nome):
+        attr = getattr(self._builder, nome)
+        if not callable(attr):
+            # propriedades como `.not_` devolvem o próprio builder (negado)
+            return self._wrap(attr, nome) if hasattr(attr, "execute") else attr
+
+        def _chamada(*args, **kwargs):
+            res = attr(*args, **kwargs)
+            return self._wrap(res, nome, args, kwargs) if hasattr(res, "execute") else res
+
+        return _chamada
+
+    def execute(self):
+        t0 = time.perf_counter()
+        erro = None
+        res = None
+        try:
+            res = self._builder.execute()
+            return res
+        except Exception as e:
+            erro = f"{type(e).__name__}: {getattr(e, 'message', None) or e}"
+            raise
+        finally:
+            data = getattr(res, "data", None) if res is not None else None
+            try:
+                self._registrar({
+                    "ts": time.time(),
+                    "tabela": self._alvo,
+                    "operacao": self._operacao,
+                    "filtros": "; ".join(self._filtros),
+                    "linhas": len(data) if isinstance(data, list) else (1 if data else 0),
+                    "bytes": _bytes_json(data),
+                    "ms": round((time.perf_counter() - t0) * 1000, 1),
+                    "erro": erro,
+                })
+            except Exception:
+                pass  # instrumentação nunca derruba a consulta
+
+
+class ClienteInstrumentado:
+    """
+    Envolve o client do Supabase. `table()`/`from_()`/`rpc()` devolvem builders
+    instrumentados; qualquer outro atributo (storage, auth, ...) é repassado.
+    """
+
+    def __init__(self, client, registrar):
+        self._client = client
+        self._registrar = registrar
+
+    def table(self, nome: str):
+        return _ConsultaInstrumentada(self._client.table(nome), nome, self._registrar)
+
+    from_ = table
+
+    def rpc(self, fn: str, params=None, *args, **kwargs):
+        builder = self._client.rpc(fn, params, *args, **kwargs)
+        filtros = [f"params({', '.join(f'{k}={_fmt_arg(v)}' for k, v in (params or {}).items())})"]
+        return _ConsultaInstrumentada(builder, f"rpc:{fn}", self._registrar, "rpc", filtros)
+
+    @property
+    def storage(self):
+        return _StorageInstrumentado(self._client.storage, self._registrar)
+
+    def __getattr__(self, nome):
+        return getattr(self._client, nome)
+
+
+class _StorageInstrumentado:
+    """`client.storage`: `from_(bucket)` devolve o bucket instrumentado; o resto é repassado."""
+
+    def __init__(self, storage, registrar):
+        self._storage = storage
+        self._registrar = registrar
+
+    def from_(self, bucket: str):
+        return _BucketInstrumentado(self._storage.from_(bucket), bucket, self._registrar)
+
+    def __getattr__(self, nome):
+        return getattr(self._storage, nome)
+
+
+class _BucketInstrumentado:
+    """Cada método do bucket (upload, list, download, remove...) vira um registro."""
+
+    def __init__(self, bucket, nome: str, registrar):
+        self._bucket = bucket
+        self._nome = nome
+        self._registrar = registrar
+
+    def __getattr__(self, nome):
+        attr = getattr(self._bucket, nome)
+        if not callable(attr):
+            return attr
+
+        def _chamada(*args, **kwargs):
+            t0 = time.perf_counter()
+            erro = None
+            res = None
+            try:
+                res = attr(*args, **kwargs)
+                return res
+            except Exception as e:
+                erro = f"{type(e).__name__}: {getattr(e, 'message', None) or e}"
+                raise
+            finally:
+                # bytes: o que desceu (download) ou subiu (upload); listas contam como JSON
+                enviado = next((a for a in args if isinstance(a, (bytes, bytearray))), None)
+                if isinstance(res, (bytes, bytearray)):
+                    tamanho = len(res)
+                elif enviado is not None:
+                    tamanho = len(enviado)
+                else:
+                    tamanho = _bytes_json(res) if isinstance(res, (list, dict)) else 0
+                try:
+                    self._registrar({
+                        "ts": time.time(),
+                        "tabela": f"storage:{self._nome}",
+                        "operacao": nome,
+                        "filtros": ", ".join(_fmt_arg(a) for a in args if not isinstance(a, (bytes, bytearray))),
+                        "linhas": len(res) if isinstance(res, list) else (1 if res else 0),
+                        "bytes": tamanho,
+                        "ms": round((time.perf_counter() - t0) * 1000, 1),
+                        "erro": erro,
+                    })
+                except Exception:
+                    pass  # instrumentação nunca derruba a chamada
+
+        return _chamada
+
+
+class RegistroConsultas:
+    """Buffer circular thread-safe de registros (um por chamada executada)."""
+
+    def __init__(self, maxlen: int = 5000):
+        self._itens = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def adicionar(self, item: dict):
+        with self._lock:
+            self._itens.append(item)
+
+    def itens(self) -> list:
+        with self._lock:
+            return list(self._itens)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def to_jsonl(self) -> bytes:
+        return "".join(json.dumps(i, ensure_ascii=False, default=str) + "\n" for i in self.itens()).encode("utf-8")
+
+
+class RegistrosPorOrigem:
+    """
+    Registros de chamadas feitas fora de um rerun, separados por origem (ex.: a
+    tarefa em segundo plano que as fez), para cada sessão ler/limpar só os seus.
+    A origem vale para a thread dentro de `with registros.origem("tarefa-x"):`.
+    Guarda as `max_origens` usadas mais recentemente.
+    """
+
+    SEM_ORIGEM = "(sem origem)"
+
+    def __init__(self, max_origens: int = 50, maxlen: int = 2000):
+        self.max_origens = max_origens
+        self.maxlen = maxlen
+        self._registros = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def origem(self, chave: str):
+        anterior = getattr(self._local, "chave", None)
+        self._local.chave = chave
+        try:
+            yield
+        finally:
+            self._local.chave = anterior
+
+    def registro(self, chave: str = None) -> RegistroConsultas:
+        """Registro da origem dada (ou da origem atual da thread), criado se preciso."""
+        chave = chave or getattr(self._local, "chave", None) or self.SEM_ORIGEM
+        with self._lock:
+            reg = self._registros.get(chave)
+            if reg is None:
+                reg = self._registros[chave] = RegistroConsultas(maxlen=self.maxlen)
+                while len(self._registros) > self.max_origens:
+                    self._registros.popitem(last=False)
+            else:
+                self._registros.move_to_end(chave)
+            return reg
+
+    def itens(self, chaves) -> list:
+        with self._lock:
+            regs = [self._registros[c] for c in chaves if c in self._registros]
+        return [i for r in regs for i in r.itens()]
+
+    def to_jsonl(self, chaves) -> bytes:
+        return "".join(json.dumps(i, ensure_ascii=False, default=str) + "\n" for i in self.itens(chaves)).encode("utf-8")
+
+    def limpar(self, chaves):
+        with self._lock:
+            for c in chaves:
+                self._registros.pop(c, None)
+
+
+# ============================================================
+# Fases nomeadas (profiling opt-in)
+# ============================================================
+class CronometroFases:
+    """
+    Cronometra blocos com `with cron.fase("relatorios/fetch"):`.
+    Fases aninhadas ganham o caminho completo ("relatorios/pdf/build").
+    Desligado, `fase()` devolve um nullcontext (custo desprezível).
+    """
+
+    def __init__(self, registrar, ativo: bool = False):
+        self._registrar = registrar
+        self.ativo = ativo
+        self._local = threading.local()
+
+    def _pilha(self) -> list:
+        if not hasattr(self._local, "pilha"):
+            self._local.pilha = []
+        return self._local.pilha
+
+    def fase(self, nome: str):
+        if not self.ativo:
+            return nullcontext()
+        return self._medir(nome)
+
+    @contextmanager
+    def _medir(self, nome: str):
+        pilha = self._pilha()
+        pilha.append(nome)
+        caminho = "/".join(pilha)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            ms = round((time.perf_counter() - t0) * 1000, 1)
+            pilha.pop()
+            try:
+                self._registrar({"ts": time.time(), "fase": caminho, "nivel": len(pilha), "ms": ms})
+            except Exception:
+                pass
+
+
+class PerfilExecucao:
+    """cProfile de um rerun inteiro: iniciar() no topo do script, parar() no fim."""
+
+    def __init__(self):
+        self._prof = None
+        self.t0 = None
+
+    @property
+    def ativo(self) -> bool:
+        return self._prof is not None
+
+    def iniciar(self) -> bool:
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:
+            # Python 3.12+: outro profiler já ativo no processo (outra sessão perfilando)
+            return False
+        self._prof = prof
+        self.t0 = time.perf_counter()
+        return True
+
+    def parar(self, top: int = 40) -> dict:
+        """Encerra e devolve {'ms', 'top': [linhas], 'prof': bytes do .prof (pstats)}."""
+        prof, self._prof = self._prof, None
+        if prof is None:
+            return {}
+        prof.disable()
+        ms = round((time.perf_counter() - (self.t0 or time.perf_counter())) * 1000, 1)
+
+        stats = pstats.Stats(prof, stream=io.StringIO())
+        linhas = []
+        for (arquivo, linha, func), (cc, nc, tt, ct, _callers) in stats.stats.items():
+            linhas.append({
+                "funcao": func,
+                "local": f"{os.path.basename(arquivo)}:{linha}",
+                "chamadas": nc,
+                "tottime_ms": round(tt * 1000, 2),
+                "cumtime_ms": round(ct * 1000, 2),
+            })
+        linhas.sort(key=lambda r: r["cumtime_ms"], reverse=True)
+
+        fd, caminho = tempfile.mkstemp(suffix=".prof")
+        os.close(fd)
+        try:
+            stats.dump_stats(caminho)
+            with open(caminho, "rb") as f:
+                dump = f.read()
+        finally:
+            os.remove(caminho)
+        return {"ms": ms, "top": linhas[:top], "prof": dump}
@@ -0,0 +1,137 @@
+# importtime_report.py
+# --------------------------------------------
+# Relatório de tempo de import (cold start) no estilo `python -X importtime`.
+#
+# Uso:
+#   python importtime_report.py                 # imports de topo do app.py
+#   python importtime_report.py --lazy          # + dependências carregadas sob demanda
+#   python importtime_report.py --top 40 --json importtime.json
+#
+# Cada medição roda num interpretador NOVO (sem cache em sys.modules), então o
+# número reflete o custo real de um container recém-iniciado.
+# --------------------------------------------
+
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+# Dependências que o app.py só importa no primeiro uso (relatorios.py, Excel)
+LAZY_MODULES = [
+    "reportlab.platypus",
+    "reportlab.lib.styles",
+    "openpyxl",
+]
+
+
+def top_level_imports(path: str = APP_FILE) -> list:
+    """Módulos importados no nível de módulo do app (ignora imports dentro de funções)."""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    mods = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            mods.extend(a.name for a in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+            mods.append(node.module)
+    seen, out = set(), []
+    for m in mods:
+        if m not in seen:
+            seen.add(m)
+            out.append(m)
+    return out
+
+
+def measure(modules: list) -> list:
+    """
+    Executa `python -X importtime -c "import a; import b; ..."` e devolve
+    uma lista de dicts {module, self_us, cumulative_us, depth}.
+    """
+    code = "\n".join(f"try:\n    import {m}\nexcept Exception:\n    pass" for m in modules)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True,
+        cwd=os.path.dirname(APP_FILE),
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            _, rest = line.split(":", 1)
+            self_us, cum_us, name = rest.split("|", 2)
+            depth = (len(name) - len(name.lstrip(" "))) // 2
+            rows.append({
+                "module": name.strip(),
+                "self_us": int(self_us.strip()),
+                "cumulative_us": int(cum_us.strip()),
+                "depth": depth,
+            })
+        except ValueError:
+            continue
+    return rows
+
+
+def summarize(rows: list) -> dict:
+    """Totais por pacote de topo (streamlit, pandas, supabase, ...)."""
+    per_pkg = {}
+    for r in rows:
+        pkg = r["module"].split(".")[0]
+        per_pkg[pkg] = per_pkg.get(pkg, 0) + r["self_us"]
+    total_us = sum(r["self_us"] for r in rows)
+    return {
+        "total_ms": round(total_us / 1000, 1),
+        "modules": len(rows),
+        "per_package_ms": {
+            k: round(v / 1000, 1)
+            for k, v in sorted(per_pkg.items(), key=lambda kv: kv[1], reverse=True)
+        },
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Perfil de tempo de import do app (cold start).")
+    ap.add_argument("--top", type=int, default=25, help="quantos módulos listar (por tempo acumulado)")
+    ap.add_argument("--lazy", action="store_true", help="mede também as dependências carregadas sob demanda")
+    ap.add_argument("--json", dest="json_path", help="grava o resultado completo em JSON")
+    args = ap.parse_args(argv)
+
+    eager = [m for m in top_level_imports() if m != "parser"]
+    report = {"eager_modules": eager}
+
+    rows = measure(eager)
+    report["eager"] = summarize(rows)
+    report["eager_top"] = sorted(
+        (r for r in rows if r["depth"] <= 1), key=lambda r: r["cumulative_us"], reverse=True
+    )[: args.top]
+
+    if args.lazy:
+        # Custo incremental: mede eager + lazy e subtrai o eager
+        rows_all = measure(eager + LAZY_MODULES)
+        report["lazy_modules"] = LAZY_MODULES
+        report["lazy_incremental_ms"] = round(
+            summarize(rows_all)["total_ms"] - report["eager"]["total_ms"], 1
+        )
+
+    print(f"Imports de topo do app.py: {', '.join(eager)}")
+    print(f"Cold start (imports): {report['eager']['total_ms']:.1f} ms em {report['eager']['modules']} módulos\n")
+    print(f"{'módulo':<45} {'acumulado (ms)':>15} {'próprio (ms)':>13}")
+    for r in report["eager_top"]:
+        print(f"{r['module']:<45} {r['cumulative_us'] / 1000:>15.1f} {r['self_us'] / 1000:>13.1f}")
+    print("\nPor pacote (ms):")
+    for pkg, ms in list(report["eager"]["per_package_ms"].items())[:15]:
+        print(f"  {pkg:<30} {ms:>8.1f}")
+    if args.lazy:
+        print(f"\nSob demanda ({', '.join(LAZY_MODULES)}): +{report['lazy_incremental_ms']:.1f} ms no primeiro uso")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
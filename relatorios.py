@@ -0,0 +1,587 @@
+# relatorios.py
+# --------------------------------------------
+# Motor de PDF para relatórios grandes (ReportLab).
+#
+# - A tabela é emitida em blocos de N linhas (uma Table por bloco, com o
+#   cabeçalho repetido), em vez de uma Table única com todas as linhas:
+#   o custo de layout/quebra de página fica linear no número de linhas.
+# - Paragraph só nas colunas que precisam quebrar texto (paciente,
+#   convênio, ...); o resto vai como string simples, bem mais barato.
+# - Estilos (ParagraphStyle/TableStyle) são criados uma vez por processo
+#   e reaproveitados entre blocos e entre relatórios.
+# - O PDF é gravado num arquivo temporário (ou no caminho informado) em
+#   vez de um BytesIO que dobra a memória no final.
+# - Recebe DataFrames já formatados pelo app (datas, guias e valores
+#   como texto). Sem dependência de Streamlit: roda em outro processo.
+# - FilaRelatorios roda a geração num pool de processos e guarda os bytes
+#   num LRU limitado, com chave (tipo, filtros, impressão digital do df):
+#   repetir o mesmo relatório com os mesmos dados não gera de novo. O
+#   mesmo LRU memoiza os downloads gerados no clique (CSV/Excel).
+# - Excel em modo write-only do openpyxl: uma passada pelas linhas, com o
+#   formato de cada coluna resolvido uma vez (estilo nomeado por coluna).
+# - Parquet (pyarrow) com tipos de verdade: datas como date32, valores
+#   como decimal(14,2), colunas repetitivas como dictionary (categóricas).
+# --------------------------------------------
+
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from xml.sax.saxutils import escape
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+LINHAS_POR_BLOCO = 40
+_PADDING = 6  # LEFTPADDING/RIGHTPADDING padrão da Table (pt)
+
+
+@dataclass(frozen=True)
+class Coluna:
+    campo: str
+    titulo: str
+    largura_cm: float
+    alinhamento: str = "LEFT"      # LEFT | CENTER | RIGHT
+    quebra: bool = False           # True: Paragraph (quebra linha); False: texto simples
+    estilo: str = "TD"             # estilo do Paragraph quando quebra=True (TD | TD_SMALL)
+
+
+@dataclass(frozen=True)
+class LayoutTabela:
+    colunas: tuple
+    fonte_th: float = 9
+    entrelinha_th: float = 11
+    fonte_td: float = 8
+    entrelinha_td: float = 10
+    fonte_td_pequena: float = 7
+    entrelinha_td_pequena: float = 8.6
+
+
+# ============================================================
+# Layouts dos relatórios do app
+# ============================================================
+LAYOUT_CIRURGIAS = LayoutTabela(colunas=(
+    Coluna("atendimento", "Atendimento", 2.6, "CENTER"),
+    Coluna("aviso", "Aviso", 2.0, "CENTER"),
+    Coluna("convenio", "Convênio", 2.8, quebra=True),
+    Coluna("paciente", "Paciente", 5.0, quebra=True),
+    Coluna("data_procedimento", "Data", 2.2, "CENTER"),
+    Coluna("procedimento", "Tipo", 2.4, quebra=True),
+    Coluna("profissional", "Profissional", 2.8, quebra=True),
+    Coluna("grau_participacao", "Grau de Participação", 3.0, "CENTER", quebra=True),
+    Coluna("hospital", "Hospital", 2.6, quebra=True),
+    Coluna("situacao", "Situação", 2.1, "CENTER", quebra=True),
+))
+
+# Larguras (cm) — soma ≈ 28,4 cm (área útil em A4 paisagem com margens 18pt)
+LAYOUT_QUITACOES = LayoutTabela(colunas=(
+    Coluna("quitacao_data", "Quitação", 2.0, "CENTER"),
+    Coluna("hospital", "Hospital", 2.2, quebra=True),
+    Coluna("atendimento", "<nobr>Atendimento</nobr>", 2.2, "CENTER"),
+    Coluna("paciente", "Paciente", 4.3, quebra=True, estilo="TD_SMALL"),
+    Coluna("convenio", "Convênio", 2.6, quebra=True, estilo="TD_SMALL"),
+    Coluna("profissional", "Profissional", 3.2, quebra=True),
+    Coluna("grau_participacao", "Grau", 1.8, "CENTER", quebra=True),
+    Coluna("data_procedimento", "Data Proc.", 2.0, "CENTER"),
+    Coluna("quitacao_guia_amhptiss", "Guia AMHPTISS", 2.5, "CENTER"),
+    Coluna("quitacao_valor_amhptiss", "R$ AMHPTISS", 2.1, "RIGHT"),
+    Coluna("quitacao_guia_complemento", "Guia Compl.", 2.5, "CENTER"),
+    Coluna("quitacao_valor_complemento", "R$ Compl.", 2.0, "RIGHT"),
+), fonte_th=8.2, entrelinha_th=9.8, fonte_td=7.8, entrelinha_td=9.6)
+
+
+# ============================================================
+# Estilos (criados uma vez por processo)
+# ============================================================
+_ESTILOS: Dict[LayoutTabela, dict] = {}
+
+
+def _alinhamentos(nome: str, base) -> dict:
+    from reportlab.lib.styles import ParagraphStyle
+
+    return {"LEFT": base,
+            "CENTER": ParagraphStyle(f"{nome}_CENTER", parent=base, alignment=1),
+            "RIGHT": ParagraphStyle(f"{nome}_RIGHT", parent=base, alignment=2)}
+
+
+def _estilos(layout: LayoutTabela) -> dict:
+    """ParagraphStyles do layout (cache por processo)."""
+    est = _ESTILOS.get(layout)
+    if est is not None:
+        return est
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
+    base = getSampleStyleSheet()
+    td = ParagraphStyle("TD", parent=base["Normal"], fontName="Helvetica",
+                        fontSize=layout.fonte_td, leading=layout.entrelinha_td, wordWrap="LTR")
+    td_small = ParagraphStyle("TD_SMALL", parent=td, fontSize=layout.fonte_td_pequena,
+                              leading=layout.entrelinha_td_pequena)
+    est = {
+        "H1": base["Heading1"],
+        "H2": base["Heading2"],
+        "N": base["BodyText"],
+        "TH": ParagraphStyle("TH", parent=base["Normal"], fontName="Helvetica-Bold",
+                             fontSize=layout.fonte_th, leading=layout.entrelinha_th, alignment=1),
+        "TD": _alinhamentos("TD", td),
+        "TD_SMALL": _alinhamentos("TD_SMALL", td_small),
+    }
+    _ESTILOS[layout] = est
+    return est
+
+
+def _estilo_tabela(layout: LayoutTabela):
+    """TableStyle único por layout (vale para qualquer quantidade de linhas)."""
+    from reportlab.lib import colors
+    from reportlab.platypus import TableStyle
+
+    cmds = [
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#E8EEF7")),
+        ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("FONTSIZE", (0, 0), (-1, 0), layout.fonte_th),
+        ("FONTNAME", (0, 1), (-1, -1), "Helvetica"),
+        ("FONTSIZE", (0, 1), (-1, -1), layout.fonte_td),
+        ("LEADING", (0, 1), (-1, -1), layout.entrelinha_td),
+        ("VALIGN", (0, 0), (-1, -1), "TOP"),
+        ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#FAFAFA")]),
+        ("ALIGN", (0, 0), (-1, 0), "CENTER"),
+    ]
+    for i, c in enumerate(layout.colunas):
+        if c.alinhamento != "LEFT":
+            cmds.append(("ALIGN", (i, 1), (i, -1), c.alinhamento))
+        if c.estilo == "TD_SMALL":
+            cmds.append(("FONTSIZE", (i, 1), (i, -1), layout.fonte_td_pequena))
+            cmds.append(("LEADING", (i, 1), (i, -1), layout.entrelinha_td_pequena))
+    return TableStyle(cmds)
+
+
+def _tabela_resumo(linhas: List[list], larguras_cm: Optional[List[float]] = None, alinhar_direita: bool = False):
+    """Tabelinha simples (resumo por situação, totais)."""
+    from reportlab.lib import colors
+    from reportlab.lib.units import cm
+    from reportlab.platypus import Table, TableStyle
+
+    t = Table(linhas, hAlign="RIGHT" if alinhar_direita else "LEFT",
+              colWidths=[w * cm for w in larguras_cm] if larguras_cm else None)
+    if alinhar_direita:
+        t.setStyle(TableStyle([
+            ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
+            ("FONTSIZE", (0, 0), (-1, -1), 10),
+            ("ALIGN", (0, 0), (-1, -1), "RIGHT"),
+        ]))
+    else:
+        t.setStyle(TableStyle([
+            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#F0F0F0")),
+            ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+            ("ALIGN", (1, 1), (-1, -1), "RIGHT"),
+            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+            ("FONTSIZE", (0, 0), (-1, 0), 9),
+        ]))
+    return t
+
+
+def blocos_tabela(df: pd.DataFrame, layout: LayoutTabela, linhas_por_bloco: Optional[int] = None):
+    """Gera as Tables (uma por bloco de linhas), com cabeçalho em cada uma."""
+    from reportlab.lib.units import cm
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    from reportlab.platypus import Paragraph, Table
+
+    linhas_por_bloco = linhas_por_bloco or LINHAS_POR_BLOCO
+    est = _estilos(layout)
+    estilo_tab = _estilo_tabela(layout)
+    larguras = [c.largura_cm * cm for c in layout.colunas]
+    cabecalho = [Paragraph(c.titulo, est["TH"]) for c in layout.colunas]
+
+    campos = [c.campo for c in layout.colunas]
+    base = df.reindex(columns=campos)
+    valores = base.astype(object).where(base.notna(), "").astype(str).values.tolist()
+
+    # Conversores por coluna, resolvidos uma vez. Nas colunas com quebra,
+    # texto que cabe numa linha vai como string (o Paragraph só é criado
+    # quando precisa quebrar); a medida é feita uma vez por valor distinto.
+    conv = []
+    for i, c in enumerate(layout.colunas):
+        if not c.quebra:
+            conv.append(None)
+            continue
+        st_p = est[c.estilo][c.alinhamento]
+        util = larguras[i] - 2 * _PADDING
+        cabe = {v: stringWidth(v, st_p.fontName, st_p.fontSize) <= util
+                for v in {row[i] for row in valores}}
+        conv.append(lambda v, _s=st_p, _cabe=cabe: v if _cabe[v] else Paragraph(escape(v), _s))
+
+    for i in range(0, len(valores), linhas_por_bloco):
+        linhas = [cabecalho]
+        for row in valores[i:i + linhas_por_bloco]:
+            linhas.append([f(v) if f else v for f, v in zip(conv, row)])
+        t = Table(linhas, repeatRows=1, colWidths=larguras)
+        t.setStyle(estilo_tab)
+        yield t
+
+
+def gerar_pdf(titulo: str, subtitulo: str, df: pd.DataFrame, layout: LayoutTabela,
+              antes: Optional[list] = None, depois: Optional[list] = None,
+              destino: Optional[str] = None, linhas_por_bloco: Optional[int] = None) -> bytes:
+    """
+    Monta o PDF (A4 paisagem). `antes`/`depois`: lista de ("titulo2"|"texto"|"resumo"|"totais", conteúdo).
+    Com `destino`, grava no caminho e devolve b""; sem, usa um temporário e devolve os bytes.
+    """
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
+
+    est = _estilos(layout)
+
+    def _extras(itens):
+        out = []
+        for tipo, conteudo in itens or []:
+            if tipo == "titulo2":
+                out.append(Paragraph(conteudo, est["H2"]))
+            elif tipo == "texto":
+                out.append(Paragraph(conteudo, est["N"]))
+            elif tipo == "resumo":
+                out += [_tabela_resumo(conteudo), Spacer(1, 10)]
+            elif tipo == "totais":
+                out += [Spacer(1, 8), _tabela_resumo(conteudo, [4.5, 3.5], alinhar_direita=True)]
+            elif tipo == "espaco":
+                out.append(Spacer(1, conteudo))
+        return out
+
+    elems = [Paragraph(titulo, est["H1"]), Spacer(1, 6), Paragraph(subtitulo, est["N"]), Spacer(1, 8)]
+    elems += _extras(antes)
+    elems += list(blocos_tabela(df, layout, linhas_por_bloco))
+    elems += _extras(depois)
+
+    caminho = destino
+    if caminho is None:
+        fd, caminho = tempfile.mkstemp(suffix=".pdf")
+        os.close(fd)
+    try:
+        doc = SimpleDocTemplate(caminho, pagesize=landscape(A4),
+                                leftMargin=18, rightMargin=18, topMargin=18, bottomMargin=18)
+        doc.build(elems)
+        if destino is not None:
+            return b""
+        with open(caminho, "rb") as f:
+            return f.read()
+    finally:
+        if destino is None and os.path.exists(caminho):
+            os.remove(caminho)
+
+
+# ============================================================
+# Relatórios do app (df já formatado: tudo texto)
+# ============================================================
+def pdf_cirurgias_por_status(df: pd.DataFrame, filtros: dict, resumo: Optional[List[list]] = None,
+                             destino: Optional[str] = None) -> bytes:
+    antes = [("titulo2", f"Total de cirurgias: <b>{len(df)}</b>")]
+    if resumo:
+        antes.append(("resumo", [["Situação", "Quantidade"]] + resumo))
+    subtitulo = (f"Período: {filtros['ini']} a {filtros['fim']}  |  Hospital: {filtros['hospital']}  |  "
+                 f"Status: {filtros['status']}")
+    return gerar_pdf("Relatório — Cirurgias por Status", subtitulo, df, LAYOUT_CIRURGIAS,
+                     antes=antes, destino=destino)
+
+
+def pdf_quitacoes_colunas_fixas(df: pd.DataFrame, filtros: dict, totais: List[list],
+                                destino: Optional[str] = None) -> bytes:
+    subtitulo = f"Período da quitação: {filtros['ini']} a {filtros['fim']}  |  Hospital: {filtros['hospital']}"
+    return gerar_pdf("Relatório — Quitações", subtitulo, df, LAYOUT_QUITACOES,
+                     depois=[("totais", totais)], destino=destino)
+
+
+# ============================================================
+# Excel (openpyxl write-only)
+# ============================================================
+@dataclass(frozen=True)
+class ColunaXlsx:
+    titulo: str
+    largura: float                     # em "caracteres" do Excel
+    formato: Optional[str] = None      # number_format (datas, moeda)
+    alinhamento: Optional[str] = None  # left | center | right
+
+
+FORMATO_DATA_BR = "dd/mm/yyyy"
+FORMATO_MOEDA_BR = '[$R$-pt_BR] #,##0.00'
+
+# Mesmo layout do PDF de quitações (larguras proporcionais às do PDF)
+LAYOUT_XLSX_QUITACOES = (
+    ColunaXlsx("Quitação", 11, FORMATO_DATA_BR, "center"),
+    ColunaXlsx("Hospital", 16),
+    ColunaXlsx("Atendimento", 12, alinhamento="center"),
+    ColunaXlsx("Paciente", 32),
+    ColunaXlsx("Convênio", 18),
+    ColunaXlsx("Profissional", 22),
+    ColunaXlsx("Grau", 12),
+    ColunaXlsx("Data Proc.", 11, FORMATO_DATA_BR, "center"),
+    ColunaXlsx("Guia AMHPTISS", 16, alinhamento="center"),
+    ColunaXlsx("R$ AMHPTISS", 14, FORMATO_MOEDA_BR, "right"),
+    ColunaXlsx("Guia Compl.", 16, alinhamento="center"),
+    ColunaXlsx("R$ Compl.", 14, FORMATO_MOEDA_BR, "right"),
+)
+
+
+def gerar_xlsx(aba: str, df: pd.DataFrame, colunas: tuple) -> bytes:
+    """
+    Planilha única em modo write-only: cabeçalho em negrito/centralizado,
+    larguras e painel congelado definidos antes das linhas; células de
+    colunas formatadas recebem o estilo nomeado da coluna. `df` já vem com
+    as colunas nomeadas pelos títulos (datas como datetime, valores float).
+    """
+    import io
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Font, NamedStyle
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(aba)
+    ws.freeze_panes = "A2"
+    for i, c in enumerate(colunas, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = c.largura
+
+    # Um estilo nomeado por coluna formatada (registrado uma vez no workbook)
+    estilos = []
+    for i, c in enumerate(colunas):
+        if not (c.formato or c.alinhamento):
+            estilos.append(None)
+            continue
+        ns = NamedStyle(name=f"col_{i}_{aba}")
+        if c.formato:
+            ns.number_format = c.formato
+        if c.alinhamento:
+            ns.alignment = Alignment(horizontal=c.alinhamento)
+        wb.add_named_style(ns)
+        estilos.append(ns.name)
+
+    cab = []
+    for c in colunas:
+        cel = WriteOnlyCell(ws, value=c.titulo)
+        cel.font = Font(bold=True)
+        cel.alignment = Alignment(horizontal="center")
+        cab.append(cel)
+    ws.append(cab)
+
+    base = df.reindex(columns=[c.titulo for c in colunas]).astype(object)
+    base = base.where(base.notna(), None)
+    for row in base.itertuples(index=False, name=None):
+        linha = []
+        for v, estilo in zip(row, estilos):
+            if estilo is None:
+                linha.append(v)
+            else:
+                cel = WriteOnlyCell(ws, value=v)
+                cel.style = estilo
+                linha.append(cel)
+        ws.append(linha)
+
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+# ============================================================
+# Parquet (pyarrow)
+# ============================================================
+def _texto(s: pd.Series) -> pd.Series:
+    return s.astype(object).where(s.notna(), None).map(lambda v: v if v is None else str(v)).astype("string")
+
+
+def gerar_parquet(df: pd.DataFrame, tipos: dict) -> bytes:
+    """
+    Parquet tipado. `tipos`: coluna -> "data" (texto dd/mm/aaaa) | "valor" | "inteiro" |
+    "booleano" | "instante" (ISO 8601) | "categoria" | "texto" (padrão).
+    """
+    import io
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    arrays = []
+    for c in df.columns:
+        s, tipo = df[c], tipos.get(c, "texto")
+        if tipo == "data":
+            d = pd.to_datetime(s.astype("string"), format="%d/%m/%Y", errors="coerce")
+            arr = pa.array(d, from_pandas=True).cast(pa.date32())
+        elif tipo == "valor":
+            v = pd.to_numeric(s, errors="coerce").round(2)
+            arr = pa.array(v, from_pandas=True, type=pa.float64()).cast(pa.decimal128(14, 2))
+        elif tipo == "inteiro":
+            arr = pa.array(pd.to_numeric(s, errors="coerce").astype("Int64"), from_pandas=True)
+        elif tipo == "booleano":
+            # números (int, float de coluna inteira com nulos, bool) valem != 0; texto pelo rótulo
+            num = pd.to_numeric(s, errors="coerce")
+            arr = pa.array([
+                None if pd.isna(v) else bool(n != 0) if pd.notna(n) else str(v).strip().lower() in ("true", "t", "sim", "s")
+                for v, n in zip(s, num)
+            ], type=pa.bool_())
+        elif tipo == "instante":
+            arr = pa.array(pd.to_datetime(s, utc=True, errors="coerce", format="ISO8601"), from_pandas=True)
+        else:
+            arr = pa.array(_texto(s), from_pandas=True).cast(pa.string())
+            if tipo == "categoria":
+                arr = arr.dictionary_encode()
+        arrays.append(arr)
+
+    tabela = pa.Table.from_arrays(arrays, names=[str(c) for c in df.columns])
+    buf = io.BytesIO()
+    pq.write_table(tabela, buf, compression="zstd")
+    return buf.getvalue()
+
+
+GERADORES = {
+    "pdf_cirurgias": pdf_cirurgias_por_status,
+    "pdf_quitacoes": pdf_quitacoes_colunas_fixas,
+}
+
+
+def _executar(tipo: str, kwargs: dict) -> bytes:
+    """Ponto de entrada no processo filho (função de módulo: precisa ser picklável)."""
+    return GERADORES[tipo](**kwargs)
+
+
+# ============================================================
+# Fila de geração (pool de processos + LRU de bytes)
+# ============================================================
+def impressao_digital(df: pd.DataFrame) -> str:
+    """Hash do conteúdo do DataFrame (colunas + valores), estável entre reruns."""
+    h = hashlib.sha1(json.dumps([str(c) for c in df.columns]).encode("utf-8"))
+    try:
+        h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    except TypeError:
+        # célula não hasheável (lista/dict): cai para a serialização
+        h.update(df.to_csv(index=False).encode("utf-8"))
+    return h.hexdigest()
+
+
+def chave_relatorio(tipo: str, filtros: dict, df: pd.DataFrame) -> str:
+    base = json.dumps({"tipo": tipo, "filtros": filtros}, sort_keys=True, default=str)
+    return hashlib.sha1(f"{base}|{impressao_digital(df)}".encode("utf-8")).hexdigest()[:20]
+
+
+_LOCK_MAIN = threading.Lock()
+
+
+@contextmanager
+def _main_neutro():
+    """
+    O Streamlit executa o script como `__main__`; com spawn, cada processo
+    filho reexecutaria o app inteiro. Enquanto os filhos são lançados, o
+    __main__ vira um módulo vazio.
+    """
+    with _LOCK_MAIN:
+        original = sys.modules.get("__main__")
+        sys.modules["__main__"] = types.ModuleType("__main__")
+        try:
+            yield
+        finally:
+            sys.modules["__main__"] = original
+
+
+class FilaRelatorios:
+    """
+    Gera relatórios fora do rerun. `processos=0` usa uma thread em vez de
+    processos (ambientes que não permitem subprocessos).
+    """
+
+    def __init__(self, processos: int = 2, max_itens: int = 16, max_mb: int = 256):
+        self.processos = int(processos)
+        self.max_itens = int(max_itens)
+        self.max_bytes = int(max_mb) * 2**20
+        self._lock = threading.Lock()
+        self._pool = None
+        self._futuros = {}                  # chave -> (Future, t0)
+        self._prontos = OrderedDict()       # chave -> {"bytes", "s", "ts"} (LRU)
+        self._erros = {}                    # chave -> mensagem
+
+    def _executor(self):
+        if self._pool is None:
+            if self.processos > 0:
+                # spawn: o processo do Streamlit tem threads; fork herdaria locks no meio do uso
+                self._pool = ProcessPoolExecutor(max_workers=self.processos,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="relatorio")
+        return self._pool
+
+    def submeter(self, chave: str, tipo: str, **kwargs) -> str:
+        """Agenda a geração (se já não estiver pronta ou em andamento) e devolve a chave."""
+        with self._lock:
+            if chave in self._prontos:
+                self._prontos.move_to_end(chave)
+                return chave
+            if chave in self._futuros:
+                return chave
+            self._erros.pop(chave, None)
+            with _main_neutro() if self.processos > 0 else nullcontext():
+                try:
+                    fut = self._executor().submit(_executar, tipo, kwargs)
+                except BrokenProcessPool:
+                    self._pool = None
+                    fut = self._executor().submit(_executar, tipo, kwargs)
+            self._futuros[chave] = (fut, time.perf_counter())
+        fut.add_done_callback(lambda f, _c=chave: self._concluir(_c, f))
+        return chave
+
+    def _concluir(self, chave: str, fut):
+        with self._lock:
+            _, t0 = self._futuros.pop(chave, (None, time.perf_counter()))
+            try:
+                dados = fut.result()
+            except BrokenProcessPool as e:
+                self._pool = None
+                self._erros[chave] = f"{type(e).__name__}: {e}"
+                return
+            except Exception as e:
+                self._erros[chave] = f"{type(e).__name__}: {e}"
+                return
+            self._prontos[chave] = {"bytes": dados, "s": round(time.perf_counter() - t0, 2), "ts": time.time()}
+            self._prontos.move_to_end(chave)
+            self._aparar()
+
+    def _aparar(self):
+        total = sum(len(v["bytes"]) for v in self._prontos.values())
+        while self._prontos and (len(self._prontos) > self.max_itens or total > self.max_bytes):
+            _, velho = self._prontos.popitem(last=False)
+            total -= len(velho["bytes"])
+
+    def obter_ou_gerar(self, chave: str, gerar) -> bytes:
+        """Memoização síncrona no mesmo LRU (downloads gerados no clique: CSV, Excel)."""
+        with self._lock:
+            if chave in self._prontos:
+                self._prontos.move_to_end(chave)
+                return self._prontos[chave]["bytes"]
+        t0 = time.perf_counter()
+        dados = gerar()
+        with self._lock:
+            self._prontos[chave] = {"bytes": dados, "s": round(time.perf_counter() - t0, 2), "ts": time.time()}
+            self._aparar()
+        return dados
+
+    def estado(self, chave: str) -> dict:
+        """{'status': 'pronto'|'executando'|'erro'|None, 'bytes', 's', 'erro'}."""
+        with self._lock:
+            if chave in self._prontos:
+                self._prontos.move_to_end(chave)
+                return {"status": "pronto", **self._prontos[chave]}
+            if chave in self._futuros:
+                return {"status": "executando", "s": round(time.perf_counter() - self._futuros[chave][1], 1)}
+            if chave in self._erros:
+                return {"status": "erro", "erro": self._erros[chave]}
+        return {"status": None}
+
+    def resumo(self) -> dict:
+        with self._lock:
+            return {
+                "em_andamento": len(self._futuros),
+                "prontos": len(self._prontos),
+                "mb": round(sum(len(v["bytes"]) for v in self._prontos.values()) / 2**20, 1),
+            }
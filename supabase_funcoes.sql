@@ -0,0 +1,460 @@
+-- ============================================================
+--  supabase_funcoes.sql
+--  Funções (RPC) e objetos opcionais usados pelo app quando os
+--  secrets USE_DB_RPC / USE_IMPORT_JOURNAL / USE_DB_ROLLUP = true. Rode no SQL
+--  Editor do Supabase. Sem eles o app continua funcionando
+--  (fallback via PostgREST).
+-- ============================================================
+
+-- ------------------------------------------------------------
+-- Atualização em lote de procedimentos (editor da Consulta)
+--   p_itens: [{"id": 1, "situacao": "Finalizado", ...}, ...]
+--   Só as chaves presentes em cada item são alteradas.
+--   Cada linha roda no seu próprio bloco: uma falha não derruba
+--   as demais e volta como (id, ok=false, erro).
+-- ------------------------------------------------------------
+create or replace function public.atualizar_procedimentos_em_lote(p_itens jsonb)
+returns table (id bigint, ok boolean, erro text)
+language plpgsql
+as $$
+declare
+  v_item jsonb;
+  v_id   bigint;
+  v_rows int;
+begin
+  for v_item in select * from jsonb_array_elements(coalesce(p_itens, '[]'::jsonb))
+  loop
+    v_id := (v_item->>'id')::bigint;
+    begin
+      update public.procedimentos p set
+        procedimento      = case when v_item ? 'procedimento'      then v_item->>'procedimento'      else p.procedimento end,
+        situacao          = case when v_item ? 'situacao'          then v_item->>'situacao'          else p.situacao end,
+        observacao        = case when v_item ? 'observacao'        then v_item->>'observacao'        else p.observacao end,
+        grau_participacao = case when v_item ? 'grau_participacao' then v_item->>'grau_participacao' else p.grau_participacao end,
+        aviso             = case when v_item ? 'aviso'             then v_item->>'aviso'             else p.aviso end
+      where p.id = v_id;
+      get diagnostics v_rows = row_count;
+      if v_rows = 0 then
+        id := v_id; ok := false; erro := 'não encontrado (ou bloqueado por RLS)';
+      else
+        id := v_id; ok := true; erro := null;
+      end if;
+    exception when others then
+      id := v_id; ok := false; erro := sqlerrm;
+    end;
+    return next;
+  end loop;
+end;
+$$;
+
+-- ------------------------------------------------------------
+-- Quitação em lote (aba 💼 Quitação) — tudo ou nada
+--   p_itens: [{"id": 1, "quitacao_data": "05/03/2025",
+--              "quitacao_guia_amhptiss": "123", "quitacao_valor_amhptiss": 150.5, ...}, ...]
+--   Aplica guia/valor/data/observação presentes em cada item e muda a
+--   situação para 'Finalizado' numa única transação. Se qualquer linha
+--   falhar, NADA é gravado: a linha culpada volta com o erro e as demais
+--   com ok=false / 'lote revertido'.
+-- ------------------------------------------------------------
+create or replace function public.quitar_procedimentos_em_lote(p_itens jsonb)
+returns table (id bigint, ok boolean, erro text)
+language plpgsql
+as $$
+declare
+  v_item  jsonb;
+  v_id    bigint;
+  v_rows  int;
+  v_falha bigint := null;
+  v_msg   text := null;
+begin
+  begin
+    for v_item in select * from jsonb_array_elements(coalesce(p_itens, '[]'::jsonb))
+    loop
+      v_id := (v_item->>'id')::bigint;
+      update public.procedimentos p set
+        quitacao_data              = case when v_item ? 'quitacao_data'              then v_item->>'quitacao_data'                       else p.quitacao_data end,
+        quitacao_guia_amhptiss     = case when v_item ? 'quitacao_guia_amhptiss'     then v_item->>'quitacao_guia_amhptiss'              else p.quitacao_guia_amhptiss end,
+        quitacao_valor_amhptiss    = case when v_item ? 'quitacao_valor_amhptiss'    then (v_item->>'quitacao_valor_amhptiss')::numeric    else p.quitacao_valor_amhptiss end,
+        quitacao_guia_complemento  = case when v_item ? 'quitacao_guia_complemento'  then v_item->>'quitacao_guia_complemento'           else p.quitacao_guia_complemento end,
+        quitacao_valor_complemento = case when v_item ? 'quitacao_valor_complemento' then (v_item->>'quitacao_valor_complemento')::numeric else p.quitacao_valor_complemento end,
+        quitacao_observacao        = case when v_item ? 'quitacao_observacao'        then v_item->>'quitacao_observacao'                 else p.quitacao_observacao end,
+        situacao                   = 'Finalizado'
+      where p.id = v_id;
+      get diagnostics v_rows = row_count;
+      if v_rows = 0 then
+        raise exception 'procedimento % não encontrado (ou bloqueado por RLS)', v_id;
+      end if;
+    end loop;
+  exception when others then
+    -- o bloco com EXCEPTION é um savepoint: tudo o que foi feito acima é desfeito
+    v_falha := v_id;
+    v_msg   := sqlerrm;
+  end;
+
+  return query
+    select (e->>'id')::bigint,
+           v_falha is null,
+           case
+             when v_falha is null then null
+             when (e->>'id')::bigint = v_falha then v_msg
+             else 'não aplicado (lote revertido)'
+           end
+    from jsonb_array_elements(coalesce(p_itens, '[]'::jsonb)) e;
+end;
+$$;
+
+-- ------------------------------------------------------------
+-- Exclusão em cascata de internações (limpeza de imports ruins)
+--   Apaga os procedimentos e as internações dos ids informados
+--   numa única transação; devolve quantas linhas saíram de cada tabela.
+-- ------------------------------------------------------------
+create or replace function public.excluir_internacoes(p_ids bigint[])
+returns table (internacoes int, procedimentos int)
+language plpgsql
+as $$
+declare
+  v_proc int;
+  v_int  int;
+begin
+  delete from public.procedimentos where internacao_id = any(p_ids);
+  get diagnostics v_proc = row_count;
+  delete from public.internacoes where id = any(p_ids);
+  get diagnostics v_int = row_count;
+  internacoes := v_int;
+  procedimentos := v_proc;
+  return next;
+end;
+$$;
+
+-- ------------------------------------------------------------
+-- Exclusão de procedimentos por lista de ids (devolve a quantidade)
+-- ------------------------------------------------------------
+create or replace function public.excluir_procedimentos(p_ids bigint[])
+returns int
+language sql
+as $$
+  with apagados as (
+    delete from public.procedimentos where id = any(p_ids) returning 1
+  )
+  select count(*)::int from apagados;
+$$;
+
+-- ============================================================
+-- Diário de importações (secret USE_IMPORT_JOURNAL = true)
+--   Um registro por upload gravado; internações e procedimentos
+--   criados pelo import levam o id do lote (import_batch_id).
+-- ============================================================
+create table if not exists public.import_batches (
+  id                     bigserial primary key,
+  content_hash           text not null,            -- sha256 do arquivo enviado
+  hospital               text not null,
+  medicos                text,                     -- seleção de médicos usada (ordenada, ';')
+  arquivo                text,
+  status                 text not null default 'em_andamento',  -- em_andamento | concluido | falhou | revertido
+  registros_arquivo      int,
+  internacoes_criadas    int default 0,
+  procedimentos_criados  int default 0,
+  ignorados              int default 0,
+  duracao_ms             int,
+  created_at             timestamptz not null default now(),
+  reverted_at            timestamptz
+);
+create index if not exists import_batches_hash_idx on public.import_batches (content_hash, hospital, status);
+
+alter table public.internacoes   add column if not exists import_batch_id bigint references public.import_batches(id) on delete set null;
+alter table public.procedimentos add column if not exists import_batch_id bigint references public.import_batches(id) on delete set null;
+create index if not exists internacoes_import_batch_idx   on public.internacoes (import_batch_id);
+create index if not exists procedimentos_import_batch_idx on public.procedimentos (import_batch_id);
+
+-- ------------------------------------------------------------
+-- Desfaz um lote numa transação: apaga os procedimentos do lote e
+-- as internações do lote que não ficaram com nenhum outro procedimento
+-- (lançados à mão ou por imports posteriores).
+-- ------------------------------------------------------------
+create or replace function public.reverter_import_batch(p_batch_id bigint)
+returns table (internacoes int, procedimentos int)
+language plpgsql
+as $$
+declare
+  v_proc int;
+  v_int  int;
+begin
+  delete from public.procedimentos where import_batch_id = p_batch_id;
+  get diagnostics v_proc = row_count;
+
+  delete from public.internacoes i
+   where i.import_batch_id = p_batch_id
+     and not exists (select 1 from public.procedimentos p where p.internacao_id = i.id);
+  get diagnostics v_int = row_count;
+
+  update public.import_batches
+     set status = 'revertido', reverted_at = now()
+   where id = p_batch_id;
+
+  internacoes := v_int;
+  procedimentos := v_proc;
+  return next;
+end;
+$$;
+
+-- ============================================================
+-- Resumos do ⚙️ Sistema (GROUP BY no banco; p_hospital null = todos)
+-- ============================================================
+create or replace function public.resumo_por_profissional(p_hospital text default null)
+returns table (profissional text, total bigint)
+language sql
+stable
+as $$
+  select p.profissional, count(*) as total
+    from public.procedimentos p
+    left join public.internacoes i on i.id = p.internacao_id
+   where p.profissional is not null
+     and (p_hospital is null or i.hospital = p_hospital)
+   group by p.profissional
+   order by total desc, p.profissional;
+$$;
+
+create or replace function public.resumo_por_convenio(p_hospital text default null)
+returns table (convenio text, total bigint)
+language sql
+stable
+as $$
+  select i.convenio, count(*) as total
+    from public.procedimentos p
+    join public.internacoes i on i.id = p.internacao_id
+   where nullif(btrim(i.convenio), '') is not null
+     and (p_hospital is null or i.hospital = p_hospital)
+   group by i.convenio
+   order by total desc, i.convenio;
+$$;
+
+-- Convênios distintos das internações (filtro da 💼 Quitação)
+create or replace function public.listar_convenios()
+returns table (convenio text)
+language sql
+stable
+as $$
+  select distinct btrim(i.convenio) as convenio
+    from public.internacoes i
+   where nullif(btrim(i.convenio), '') is not null
+   order by 1;
+$$;
+
+-- ============================================================
+-- Contagens da 🏠 Início (USE_DB_ROLLUP)
+--   procedimentos_resumo guarda quantos procedimentos há por
+--   (hospital, situação, mês do procedimento, mês da internação)
+--   e é mantida pelos triggers abaixo a cada insert/update/delete.
+--   Mês = 1º dia do mês; 1900-01-01 = data vazia ou inválida.
+--   Depois de criar (ou se desconfiar da tabela):
+--     select public.recalcular_procedimentos_resumo();
+-- ============================================================
+create table if not exists public.procedimentos_resumo (
+  hospital         text   not null default '',
+  situacao         text   not null default '',
+  mes_procedimento date   not null default date '1900-01-01',
+  mes_internacao   date   not null default date '1900-01-01',
+  total            bigint not null default 0,
+  primary key (hospital, situacao, mes_procedimento, mes_internacao)
+);
+
+-- Datas gravadas como texto: 'dd/mm/aaaa' ou 'aaaa-mm-dd' -> date
+-- (null se vazia/inválida; nunca levanta erro)
+create or replace function public.data_de_texto(p text)
+returns date
+language plpgsql
+immutable
+as $$
+begin
+  if p ~ '^\s*\d{2}/\d{2}/\d{4}' then
+    return to_date(substr(btrim(p), 1, 10), 'DD/MM/YYYY');
+  elsif p ~ '^\s*\d{4}-\d{2}-\d{2}' then
+    return to_date(substr(btrim(p), 1, 10), 'YYYY-MM-DD');
+  end if;
+  return null;
+exception when others then
+  return null;
+end;
+$$;
+
+-- 1º dia do mês (1900-01-01 = sem data)
+create or replace function public.mes_de_texto(p text)
+returns date
+language sql
+immutable
+as $$
+  select coalesce(date_trunc('month', public.data_de_texto(p))::date, date '1900-01-01');
+$$;
+
+create or replace function public._somar_resumo(
+  p_hospital text, p_situacao text, p_mes_proc date, p_mes_int date, p_delta bigint
+)
+returns void
+language sql
+as $$
+  insert into public.procedimentos_resumo as r (hospital, situacao, mes_procedimento, mes_internacao, total)
+  values (coalesce(p_hospital, ''), coalesce(p_situacao, ''),
+          coalesce(p_mes_proc, date '1900-01-01'), coalesce(p_mes_int, date '1900-01-01'), p_delta)
+  on conflict (hospital, situacao, mes_procedimento, mes_internacao)
+  do update set total = r.total + excluded.total;
+$$;
+
+-- procedimentos: desconta a linha antiga e soma a nova
+create or replace function public.procedimentos_resumo_trg()
+returns trigger
+language plpgsql
+as $$
+declare
+  v_hosp text;
+  v_data text;
+begin
+  if tg_op in ('UPDATE', 'DELETE') then
+    v_hosp := null; v_data := null;
+    select i.hospital, i.data_internacao into v_hosp, v_data
+      from public.internacoes i where i.id = old.internacao_id;
+    perform public._somar_resumo(v_hosp, old.situacao, public.mes_de_texto(old.data_procedimento),
+                                 public.mes_de_texto(v_data), -1);
+  end if;
+  if tg_op in ('INSERT', 'UPDATE') then
+    v_hosp := null; v_data := null;
+    select i.hospital, i.data_internacao into v_hosp, v_data
+      from public.internacoes i where i.id = new.internacao_id;
+    perform public._somar_resumo(v_hosp, new.situacao, public.mes_de_texto(new.data_procedimento),
+                                 public.mes_de_texto(v_data), 1);
+  end if;
+  return null;
+end;
+$$;
+
+drop trigger if exists procedimentos_resumo_ins_del on public.procedimentos;
+create trigger procedimentos_resumo_ins_del
+  after insert or delete on public.procedimentos
+  for each row execute function public.procedimentos_resumo_trg();
+
+-- só as colunas que mudam a chave (editar quitação não mexe no resumo)
+drop trigger if exists procedimentos_resumo_upd on public.procedimentos;
+create trigger procedimentos_resumo_upd
+  after update of situacao, data_procedimento, internacao_id on public.procedimentos
+  for each row execute function public.procedimentos_resumo_trg();
+
+-- internacoes:
+--   DELETE: apaga os procedimentos antes, com a internação ainda visível,
+--           para o trigger deles descontar no hospital/mês certos (o
+--           ON DELETE CASCADE depois não encontra mais nada).
+--   UPDATE de hospital/data_internacao: move as contagens dos procedimentos.
+create or replace function public.internacoes_resumo_trg()
+returns trigger
+language plpgsql
+as $$
+begin
+  if tg_op = 'DELETE' then
+    delete from public.procedimentos where internacao_id = old.id;
+    return old;
+  end if;
+
+  if new.hospital is distinct from old.hospital
+     or public.mes_de_texto(new.data_internacao) <> public.mes_de_texto(old.data_internacao) then
+    insert into public.procedimentos_resumo as r (hospital, situacao, mes_procedimento, mes_internacao, total)
+    select coalesce(old.hospital, ''), coalesce(p.situacao, ''), public.mes_de_texto(p.data_procedimento),
+           public.mes_de_texto(old.data_internacao), -count(*)
+      from public.procedimentos p
+     where p.internacao_id = old.id
+     group by 2, 3
+    on conflict (hospital, situacao, mes_procedimento, mes_internacao)
+    do update set total = r.total + excluded.total;
+
+    insert into public.procedimentos_resumo as r (hospital, situacao, mes_procedimento, mes_internacao, total)
+    select coalesce(new.hospital, ''), coalesce(p.situacao, ''), public.mes_de_texto(p.data_procedimento),
+           public.mes_de_texto(new.data_internacao), count(*)
+      from public.procedimentos p
+     where p.internacao_id = new.id
+     group by 2, 3
+    on conflict (hospital, situacao, mes_procedimento, mes_internacao)
+    do update set total = r.total + excluded.total;
+  end if;
+  return new;
+end;
+$$;
+
+drop trigger if exists internacoes_resumo_del on public.internacoes;
+create trigger internacoes_resumo_del
+  before delete on public.internacoes
+  for each row execute function public.internacoes_resumo_trg();
+
+drop trigger if exists internacoes_resumo_upd on public.internacoes;
+create trigger internacoes_resumo_upd
+  after update of hospital, data_internacao on public.internacoes
+  for each row execute function public.internacoes_resumo_trg();
+
+-- Reconstrói do zero (carga inicial / conferência). Devolve o total de procedimentos.
+create or replace function public.recalcular_procedimentos_resumo()
+returns bigint
+language sql
+as $$
+  delete from public.procedimentos_resumo;
+  insert into public.procedimentos_resumo (hospital, situacao, mes_procedimento, mes_internacao, total)
+  select coalesce(i.hospital, ''), coalesce(p.situacao, ''), public.mes_de_texto(p.data_procedimento),
+         public.mes_de_texto(i.data_internacao), count(*)
+    from public.procedimentos p
+    left join public.internacoes i on i.id = p.internacao_id
+   group by 1, 2, 3, 4;
+  select coalesce(sum(total), 0)::bigint from public.procedimentos_resumo;
+$$;
+
+-- ============================================================
+-- Lista de procedimentos do ⚙️ Sistema (USE_DB_RPC)
+--   Filtros (hospital, situação, profissional, data) e ordenação no
+--   servidor; o app pagina por chave (data_ordem, id) e conta com
+--   count=exact. data_ordem: data do procedimento (1900-01-01 = sem data).
+-- ============================================================
+create or replace view public.vw_procedimentos_lista
+with (security_invoker = true)
+as
+select p.id, p.internacao_id, p.data_procedimento, p.aviso, p.profissional, p.grau_participacao,
+       p.procedimento, p.situacao, p.observacao,
+       i.hospital, i.atendimento, i.paciente,
+       coalesce(public.data_de_texto(p.data_procedimento), date '1900-01-01') as data_ordem
+  from public.procedimentos p
+  left join public.internacoes i on i.id = p.internacao_id;
+
+-- ============================================================
+-- Pendências da 💼 Quitação (USE_DB_RPC)
+--   Cirurgias 'Enviado para pagamento' com os dados da internação;
+--   o editor filtra (hospital, convênio, data) e pagina por
+--   (data_ordem, id) no servidor, como a vw_procedimentos_lista.
+-- ============================================================
+create or replace view public.vw_quitacao_pendentes
+with (security_invoker = true)
+as
+select p.id, p.internacao_id, p.data_procedimento, p.profissional, p.aviso, p.situacao,
+       p.quitacao_data, p.quitacao_guia_amhptiss, p.quitacao_valor_amhptiss,
+       p.quitacao_guia_complemento, p.quitacao_valor_complemento, p.quitacao_observacao,
+       i.hospital, i.atendimento, i.paciente, i.convenio,
+       coalesce(public.data_de_texto(p.data_procedimento), date '1900-01-01') as data_ordem
+  from public.procedimentos p
+  left join public.internacoes i on i.id = p.internacao_id
+ where p.procedimento = 'Cirurgia / Procedimento'
+   and p.situacao = 'Enviado para pagamento';
+
+-- ============================================================
+-- Índices recomendados
+-- ============================================================
+-- Prefetch do import (procedimentos automáticos por internação + dias do arquivo)
+create index if not exists procedimentos_auto_int_data_idx
+  on public.procedimentos (internacao_id, data_procedimento)
+  where is_manual = 0;
+
+-- Resumos por hospital (resumo_por_profissional / resumo_por_convenio)
+create index if not exists internacoes_hospital_idx on public.internacoes (hospital);
+
+-- Convênios distintos (listar_convenios)
+create index if not exists internacoes_convenio_idx on public.internacoes (convenio);
+
+-- Ordenação/paginação da vw_procedimentos_lista (data_ordem, id)
+create index if not exists procedimentos_data_ordem_idx
+  on public.procedimentos ((coalesce(public.data_de_texto(data_procedimento), date '1900-01-01')), id);
+
+-- Pendências de quitação (vw_quitacao_pendentes), já na ordem da paginação
+create index if not exists procedimentos_quitacao_pendentes_idx
+  on public.procedimentos ((coalesce(public.data_de_texto(data_procedimento), date '1900-01-01')), id)
+  where procedimento = 'Cirurgia / Procedimento' and situacao = 'Enviado para pagamento';
@@ -0,0 +1,340 @@
+# tarefas.py
+# --------------------------------------------
+# Execução de tarefas longas (ex.: importação) em segundo plano.
+#
+# - O estado fica num SQLite local (tarefas, progresso por fase e chunks
+#   já gravados), então sobrevive a reload da aba / queda do websocket:
+#   a UI só consulta o estado, quem grava é a thread.
+# - Cada tarefa roda numa thread daemon; a função recebe um
+#   ContextoTarefa para reportar progresso e marcar chunks concluídos.
+# - Quem roda a tarefa fica registrado no SQLite (`dono`, uma por instância
+#   de FilaTarefas) e renova `batimento` a cada BATIMENTO_S. Outra instância
+#   (restart do processo, cache limpo, reload do módulo) só assume uma
+#   tarefa ativa cujo batimento passou de BATIMENTO_EXPIRADO_S (ou uma com
+#   erro, via "Retomar"), e assume com um UPDATE condicional: duas
+#   instâncias nunca rodam a mesma tarefa e uma concluída não roda de novo.
+# - retomar_interrompidas() (ou a thread de vigiar()) reinicia essas
+#   tarefas com `retomada=True`: a função pula os chunks registrados e
+#   revalida o primeiro pendente (pode ter sido gravado sem dar tempo de
+#   registrar). Há uma vigia só por processo: a de uma instância nova
+#   para a da anterior.
+# - Conexões SQLite são curtas (abertas e fechadas a cada operação).
+# - Sem dependência de Streamlit.
+# --------------------------------------------
+
+import json
+import os
+from contextlib import contextmanager
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+
+STATUS_ATIVOS = ("pendente", "executando")
+BATIMENTO_S = 5.0              # intervalo de renovação do batimento enquanto a tarefa roda
+BATIMENTO_EXPIRADO_S = 30.0    # sem batimento há mais que isso = dono morreu
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tarefas (
+    id            TEXT PRIMARY KEY,
+    tipo          TEXT NOT NULL,
+    titulo        TEXT,
+    status        TEXT NOT NULL,              -- pendente | executando | concluida | erro
+    chave         TEXT,                       -- identifica o trabalho (evita duas ativas iguais)
+    dono          TEXT,                       -- instância de FilaTarefas que está rodando
+    batimento     REAL,                       -- última renovação do dono (epoch)
+    payload       TEXT,                       -- JSON
+    resultado     TEXT,                       -- JSON
+    erro          TEXT,
+    tentativas    INTEGER NOT NULL DEFAULT 0,
+    criado_em     REAL NOT NULL,
+    atualizado_em REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tarefa_fases (
+    tarefa_id  TEXT NOT NULL,
+    fase       TEXT NOT NULL,
+    ordem      INTEGER NOT NULL DEFAULT 0,
+    feito      INTEGER NOT NULL DEFAULT 0,
+    total      INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (tarefa_id, fase)
+);
+CREATE TABLE IF NOT EXISTS tarefa_chunks (
+    tarefa_id  TEXT NOT NULL,
+    fase       TEXT NOT NULL,
+    chunk      INTEGER NOT NULL,
+    resultado  TEXT,                          -- JSON (ex.: ids criados no chunk)
+    PRIMARY KEY (tarefa_id, fase, chunk)
+);
+"""
+
+# Colunas acrescentadas depois da 1ª versão do schema (bancos já existentes)
+_COLUNAS_NOVAS = {"chave": "TEXT", "dono": "TEXT", "batimento": "REAL"}
+
+
+class ContextoTarefa:
+    """O que a função da tarefa enxerga: progresso, chunks gravados e se é retomada."""
+
+    def __init__(self, fila, tarefa_id: str, retomada: bool):
+        self.fila = fila
+        self.id = tarefa_id
+        self.retomada = retomada
+
+    def fase(self, nome: str, total: int, ordem: int = 0):
+        self.fila._definir_fase(self.id, nome, total, ordem)
+
+    def progresso(self, fase: str, feito: int):
+        self.fila._progresso(self.id, fase, feito)
+
+    def chunks_feitos(self, fase: str) -> dict:
+        """{indice_chunk: resultado} dos chunks já registrados nesta fase."""
+        return self.fila._chunks(self.id, fase)
+
+    def registrar_chunk(self, fase: str, indice: int, resultado=None):
+        self.fila._registrar_chunk(self.id, fase, indice, resultado)
+
+
+class FilaTarefas:
+    """Fila de tarefas com estado em SQLite e execução em threads."""
+
+    def __init__(self, caminho: str = "tarefas.db"):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._threads = {}
+        self._lock_iniciar = threading.Lock()
+        self.dono = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._vigia = None
+        with self._conn() as c:
+            c.executescript(_SCHEMA)
+            existentes = {r["name"] for r in c.execute("PRAGMA table_info(tarefas)")}
+            for col, tipo in _COLUNAS_NOVAS.items():
+                if col not in existentes:
+                    c.execute(f"ALTER TABLE tarefas ADD COLUMN {col} {tipo}")
+
+    # ---------------- SQLite ----------------
+    @contextmanager
+    def _conn(self):
+        """Conexão curta: commit (ou rollback) na saída e sempre fechada."""
+        conn = sqlite3.connect(self.caminho, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _exec(self, sql: str, params=()) -> int:
+        with self._lock, self._conn() as c:
+            return c.execute(sql, params).rowcount
+
+    def _query(self, sql: str, params=()) -> list:
+        with self._lock, self._conn() as c:
+            return [dict(r) for r in c.execute(sql, params).fetchall()]
+
+    # ---------------- API ----------------
+    def criar(self, tipo: str, payload: dict, titulo: str = "", chave: str = None) -> str:
+        """
+        Registra a tarefa (status 'pendente') e devolve o id. Com `chave`, a checagem e o
+        INSERT são uma transação só: se já houver tarefa ativa do mesmo tipo e chave,
+        não cria nada e devolve None.
+        """
+        tid = uuid.uuid4().hex[:12]
+        agora = time.time()
+        with self._lock, self._conn() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if chave is not None and conn.execute(
+                f"SELECT 1 FROM tarefas WHERE tipo=? AND chave=? AND status IN ({','.join('?' * len(STATUS_ATIVOS))}) LIMIT 1",
+                (tipo, chave, *STATUS_ATIVOS),
+            ).fetchone():
+                conn.rollback()
+                return None
+            # já nasce com dono/batimento: outra instância não a assume antes do iniciar()
+            conn.execute(
+                "INSERT INTO tarefas (id, tipo, titulo, status, chave, dono, batimento, payload, criado_em, atualizado_em) "
+                "VALUES (?,?,?,?,?,?,?,?,?,?)",
+                (tid, tipo, titulo, "pendente", chave, self.dono, agora,
+                 json.dumps(payload, ensure_ascii=False, default=str), agora, agora),
+            )
+        return tid
+
+    def atualizar_payload(self, tarefa_id: str, extra: dict):
+        """Acrescenta/substitui chaves do payload (antes de iniciar)."""
+        with self._lock, self._conn() as c:
+            row = c.execute("SELECT payload FROM tarefas WHERE id=?", (tarefa_id,)).fetchone()
+            if row is None:
+                return
+            payload = {**(json.loads(row["payload"]) if row["payload"] else {}), **extra}
+            c.execute("UPDATE tarefas SET payload=?, atualizado_em=? WHERE id=?",
+                      (json.dumps(payload, ensure_ascii=False, default=str), time.time(), tarefa_id))
+
+    def iniciar(self, tarefa_id: str, funcao, retomada: bool = False) -> bool:
+        """
+        Roda `funcao(ctx, payload) -> resultado` numa thread daemon, se conseguir assumir a
+        tarefa (ver _assumir). Devolve False se ela já roda aqui ou com outro dono vivo.
+        """
+        # checagem + UPDATE + registro da thread juntos: dois cliques na mesma instância
+        # (que passariam no "dono=?") não disparam duas threads
+        with self._lock_iniciar:
+            t = self._threads.get(tarefa_id)
+            if t is not None and t.is_alive():
+                return False
+            if not self._assumir(tarefa_id):
+                return False
+            t = threading.Thread(target=self._rodar, args=(tarefa_id, funcao, retomada),
+                                 name=f"tarefa-{tarefa_id}", daemon=True)
+            self._threads[tarefa_id] = t
+            t.start()
+        return True
+
+    def _assumir(self, tarefa_id: str) -> bool:
+        """
+        UPDATE condicional que marca esta instância como dona e a tarefa como 'executando'.
+        Só passa se a tarefa parou com erro, ou está ativa e já é nossa / o batimento do
+        dono expirou. Concluída nunca é assumida de novo.
+        """
+        agora = time.time()
+        return self._exec(
+            "UPDATE tarefas SET status='executando', dono=?, batimento=?, tentativas=tentativas+1, atualizado_em=? "
+            f"WHERE id=? AND (status='erro' OR (status IN ({','.join('?' * len(STATUS_ATIVOS))}) "
+            "AND (dono=? OR batimento IS NULL OR batimento < ?)))",
+            (self.dono, agora, agora, tarefa_id, *STATUS_ATIVOS, self.dono, agora - BATIMENTO_EXPIRADO_S),
+        ) == 1
+
+    def _bater(self, tarefa_id: str, parar: threading.Event):
+        while not parar.wait(BATIMENTO_S):
+            try:
+                self._exec("UPDATE tarefas SET batimento=? WHERE id=? AND dono=?", (time.time(), tarefa_id, self.dono))
+            except sqlite3.Error:
+                pass  # tenta de novo no próximo intervalo
+
+    def _rodar(self, tarefa_id: str, funcao, retomada: bool):
+        tarefa = self.obter(tarefa_id)
+        if tarefa is None:
+            return
+        parar = threading.Event()
+        threading.Thread(target=self._bater, args=(tarefa_id, parar),
+                         name=f"batimento-{tarefa_id}", daemon=True).start()
+        ctx = ContextoTarefa(self, tarefa_id, retomada)
+        try:
+            resultado = funcao(ctx, tarefa["payload"])
+            self._exec(
+                "UPDATE tarefas SET status='concluida', resultado=?, erro=NULL, atualizado_em=? WHERE id=? AND dono=?",
+                (json.dumps(resultado, ensure_ascii=False, default=str), time.time(), tarefa_id, self.dono),
+            )
+        except Exception as e:
+            self._exec(
+                "UPDATE tarefas SET status='erro', erro=?, atualizado_em=? WHERE id=? AND dono=?",
+                (f"{type(e).__name__}: {e}\n{traceback.format_exc(limit=5)}", time.time(), tarefa_id, self.dono),
+            )
+        finally:
+            parar.set()
+
+    def retomar_interrompidas(self, executores: dict) -> list:
+        """
+        Reinicia tarefas ativas cujo dono parou de bater (restart, cache limpo, reload).
+        Tarefas com batimento recente ficam com quem as roda. Devolve os ids retomados.
+        """
+        retomadas = []
+        limite = time.time() - BATIMENTO_EXPIRADO_S
+        for t in self.listar(status=STATUS_ATIVOS, limite=100):
+            viva = self._threads.get(t["id"])
+            if viva is not None and viva.is_alive():
+                continue
+            if t.get("batimento") is not None and t["batimento"] >= limite:
+                continue
+            funcao = executores.get(t["tipo"])
+            if funcao is None:
+                continue
+            if self.iniciar(t["id"], funcao, retomada=True):
+                retomadas.append(t["id"])
+        return retomadas
+
+    def vigiar(self, executores: dict, intervalo: float = BATIMENTO_EXPIRADO_S):
+        """
+        Retoma as interrompidas agora e depois a cada `intervalo` numa thread daemon:
+        não depende de alguém abrir a tela da tarefa. Uma vigia por processo: as de
+        instâncias anteriores (cache limpo, reload do módulo) são paradas antes.
+        """
+        if self._vigia is not None and self._vigia.is_alive():
+            return
+        for t in threading.enumerate():
+            if t.name == "tarefas-vigia" and getattr(t, "parar", None) is not None:
+                t.parar.set()
+
+        parar = threading.Event()
+
+        def _loop():
+            while not parar.is_set():
+                try:
+                    self.retomar_interrompidas(executores)
+                except Exception:
+                    pass  # vigia nunca morre por uma falha pontual
+                parar.wait(intervalo)
+
+        self._vigia = threading.Thread(target=_loop, name="tarefas-vigia", daemon=True)
+        self._vigia.parar = parar
+        self._vigia.start()
+
+    def parar_vigia(self):
+        """Encerra a vigia desta instância (volta no próximo ciclo de espera)."""
+        if self._vigia is not None:
+            self._vigia.parar.set()
+
+    def obter(self, tarefa_id: str) -> dict:
+        rows = self._query("SELECT * FROM tarefas WHERE id=?", (tarefa_id,))
+        if not rows:
+            return None
+        t = rows[0]
+        t["payload"] = json.loads(t["payload"]) if t.get("payload") else {}
+        t["resultado"] = json.loads(t["resultado"]) if t.get("resultado") else None
+        t["fases"] = self._query(
+            "SELECT fase, feito, total FROM tarefa_fases WHERE tarefa_id=? ORDER BY ordem, fase", (tarefa_id,)
+        )
+        return t
+
+    def listar(self, tipo: str = None, status=None, limite: int = 20) -> list:
+        """Tarefas mais recentes (sem payload), com as fases."""
+        sql = ("SELECT id, tipo, titulo, status, chave, dono, batimento, resultado, erro, tentativas, "
+               "criado_em, atualizado_em FROM tarefas")
+        cond, params = [], []
+        if tipo:
+            cond.append("tipo=?"); params.append(tipo)
+        if status:
+            cond.append(f"status IN ({','.join('?' * len(status))})"); params.extend(status)
+        if cond:
+            sql += " WHERE " + " AND ".join(cond)
+        sql += " ORDER BY criado_em DESC LIMIT ?"
+        params.append(int(limite))
+        tarefas = self._query(sql, params)
+        for t in tarefas:
+            t["resultado"] = json.loads(t["resultado"]) if t.get("resultado") else None
+            t["fases"] = self._query(
+                "SELECT fase, feito, total FROM tarefa_fases WHERE tarefa_id=? ORDER BY ordem, fase", (t["id"],)
+            )
+        return tarefas
+
+    # ---------------- usados pelo ContextoTarefa ----------------
+    def _definir_fase(self, tarefa_id: str, fase: str, total: int, ordem: int):
+        self._exec(
+            "INSERT INTO tarefa_fases (tarefa_id, fase, ordem, feito, total) VALUES (?,?,?,0,?) "
+            "ON CONFLICT(tarefa_id, fase) DO UPDATE SET total=excluded.total, ordem=excluded.ordem",
+            (tarefa_id, fase, int(ordem), int(total)),
+        )
+
+    def _progresso(self, tarefa_id: str, fase: str, feito: int):
+        self._exec(
+            "UPDATE tarefa_fases SET feito=? WHERE tarefa_id=? AND fase=?", (int(feito), tarefa_id, fase)
+        )
+        self._exec("UPDATE tarefas SET atualizado_em=? WHERE id=?", (time.time(), tarefa_id))
+
+    def _chunks(self, tarefa_id: str, fase: str) -> dict:
+        rows = self._query(
+            "SELECT chunk, resultado FROM tarefa_chunks WHERE tarefa_id=? AND fase=?", (tarefa_id, fase)
+        )
+        return {r["chunk"]: (json.loads(r["resultado"]) if r["resultado"] else None) for r in rows}
+
+    def _registrar_chunk(self, tarefa_id: str, fase: str, indice: int, resultado=None):
+        self._exec(
+            "INSERT OR REPLACE INTO tarefa_chunks (tarefa_id, fase, chunk, resultado) VALUES (?,?,?,?)",
+            (tarefa_id, fase, int(indice), json.dumps(resultado, ensure_ascii=False, default=str)),
+        )
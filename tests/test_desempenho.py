@@ -0,0 +1,61 @@
+import json
+import threading
+
+import desempenho
+
+
+def test_to_jsonl_vazio_sem_linha_em_branco():
+    assert desempenho.RegistroConsultas().to_jsonl() == b""
+
+
+def test_to_jsonl_uma_linha_por_registro():
+    reg = desempenho.RegistroConsultas()
+    reg.adicionar({"tabela": "internacoes", "linhas": 3})
+    reg.adicionar({"tabela": "procedimentos", "linhas": 0})
+    linhas = reg.to_jsonl().decode("utf-8").splitlines(keepends=True)
+    assert len(linhas) == 2 and all(l.endswith("\n") for l in linhas)
+    assert json.loads(linhas[1]) == {"tabela": "procedimentos", "linhas": 0}
+
+
+def test_registros_por_origem_separa_threads():
+    regs = desempenho.RegistrosPorOrigem(max_origens=2)
+
+    def tarefa(nome):
+        with regs.origem(nome):
+            regs.registro().adicionar({"tabela": nome})
+
+    threads = [threading.Thread(target=tarefa, args=(n,)) for n in ("tarefa-a", "tarefa-b")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert regs.itens(["tarefa-a"]) == [{"tabela": "tarefa-a"}]
+    regs.limpar(["tarefa-a"])
+    assert regs.itens(["tarefa-a"]) == [] and regs.itens(["tarefa-b"]) == [{"tabela": "tarefa-b"}]
+    regs.registro("tarefa-c")
+    regs.registro("tarefa-d")
+    assert regs.itens(["tarefa-b"]) == []   # só as 2 origens mais recentes ficam
+
+
+def test_storage_instrumentado_registra_upload_e_list():
+    class _Bucket:
+        def upload(self, path, conteudo, opcoes=None):
+            return {"Key": path}
+
+        def list(self, path=""):
+            return [{"name": "a.zip"}, {"name": "b.zip"}]
+
+    class _Storage:
+        def from_(self, bucket):
+            return _Bucket()
+
+    class _Client:
+        storage = _Storage()
+
+    itens = []
+    cli = desempenho.ClienteInstrumentado(_Client(), itens.append)
+    cli.storage.from_("backups").upload("x/a.zip", b"12345")
+    assert len(cli.storage.from_("backups").list(path="x")) == 2
+    up, ls = itens
+    assert (up["tabela"], up["operacao"], up["bytes"]) == ("storage:backups", "upload", 5)
+    assert (ls["operacao"], ls["linhas"]) == ("list", 2)
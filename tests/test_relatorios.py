@@ -0,0 +1,31 @@
+import io
+
+import pandas as pd
+import pytest
+
+import relatorios
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+def _ler(df: pd.DataFrame, tipos: dict) -> dict:
+    return pq.read_table(io.BytesIO(relatorios.gerar_parquet(df, tipos))).to_pydict()
+
+
+def test_booleano_coluna_inteira_com_nulo_vira_float():
+    # is_manual com null chega do banco como float: 1.0 / 0.0 / NaN
+    df = pd.DataFrame({"is_manual": [1, 0, None]})
+    assert df["is_manual"].dtype == float
+    assert _ler(df, {"is_manual": "booleano"})["is_manual"] == [True, False, None]
+
+
+def test_booleano_int_nullable_bool_e_texto():
+    df = pd.DataFrame({
+        "inteiro": pd.array([1, 0, None, 2], dtype="Int64"),
+        "booleano": [True, False, None, True],
+        "texto": ["sim", "não", None, "1"],
+    })
+    out = _ler(df, {"inteiro": "booleano", "booleano": "booleano", "texto": "booleano"})
+    assert out["inteiro"] == [True, False, None, True]
+    assert out["booleano"] == [True, False, None, True]
+    assert out["texto"] == [True, False, None, True]
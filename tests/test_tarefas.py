@@ -0,0 +1,53 @@
+import threading
+import time
+
+import tarefas
+
+
+def _esperar(fila, tid, status, limite=5.0):
+    fim = time.time() + limite
+    while fila.obter(tid)["status"] != status and time.time() < fim:
+        time.sleep(0.02)
+    return fila.obter(tid)["status"]
+
+
+def test_concluida_nao_e_assumida_de_novo(tmp_path):
+    fila = tarefas.FilaTarefas(str(tmp_path / "t.db"))
+    tid = fila.criar("importacao", {})
+    assert fila.iniciar(tid, lambda ctx, p: {"ok": 1})
+    assert _esperar(fila, tid, "concluida") == "concluida"
+    assert not fila.iniciar(tid, lambda ctx, p: {"ok": 2}, retomada=True)
+    assert not tarefas.FilaTarefas(fila.caminho).iniciar(tid, lambda ctx, p: {"ok": 3}, retomada=True)
+
+
+def test_retomar_com_erro_roda_uma_vez_so(tmp_path):
+    fila = tarefas.FilaTarefas(str(tmp_path / "t.db"))
+    tid = fila.criar("importacao", {})
+
+    def falha(ctx, p):
+        raise RuntimeError("queda")
+
+    fila.iniciar(tid, falha)
+    assert _esperar(fila, tid, "erro") == "erro"
+    liberar = threading.Event()
+    res = []
+    cliques = [threading.Thread(target=lambda: res.append(fila.iniciar(tid, lambda ctx, p: liberar.wait(5), retomada=True)))
+               for _ in range(4)]
+    for t in cliques:
+        t.start()
+    for t in cliques:
+        t.join()
+    liberar.set()
+    assert sorted(res) == [False, False, False, True]
+
+
+def test_uma_vigia_por_processo(tmp_path):
+    caminho = str(tmp_path / "t.db")
+    a, b = tarefas.FilaTarefas(caminho), tarefas.FilaTarefas(caminho)
+    a.vigiar({}, intervalo=0.05)
+    b.vigiar({}, intervalo=0.05)
+    time.sleep(0.2)
+    assert not a._vigia.is_alive() and b._vigia.is_alive()
+    b.parar_vigia()
+    b._vigia.join(1)
+    assert not b._vigia.is_alive()